@@ -13,6 +13,8 @@ project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 from src.pipeline import BenchmarkPipeline
+from src.preflight import run_preflight, format_preflight
+from src.utils import profile_imports, format_import_report
 
 
 def load_config(config_path: str) -> dict:
@@ -46,6 +48,23 @@ def main():
         action="store_true",
         help="Resume from checkpoint"
     )
+    parser.add_argument(
+        "--sample",
+        type=int,
+        metavar="K",
+        help="Quick evaluation on K deterministically sampled pairs per category "
+             "(rerun with a larger K to extend the sample)"
+    )
+    parser.add_argument(
+        "--preflight",
+        action="store_true",
+        help="Validate config, data, prompts and output dirs without loading models, then exit"
+    )
+    parser.add_argument(
+        "--profile-imports",
+        action="store_true",
+        help="Report import time of the pipeline and the configured model modules, then exit"
+    )
     
     args = parser.parse_args()
     
@@ -58,10 +77,31 @@ def main():
     
     config = load_config(args.config)
     
+    # 导入耗时报告：在新解释器中导入pipeline和配置中的模型模块（不实例化模型）
+    if args.profile_imports:
+        modules = ["src.pipeline"] + [
+            config.get(section, {}).get("class_path", "").rsplit(".", 1)[0]
+            for section in ("diffusion_model", "reward_model")
+            if "." in config.get(section, {}).get("class_path", "")
+        ]
+        print(format_import_report(profile_imports(modules, cwd=str(project_root))))
+        return
+    
+    # 运行前检查：不加载模型，检查失败时返回非零退出码
+    if args.preflight:
+        report = run_preflight(config)
+        print(format_preflight(report))
+        sys.exit(0 if report["ok"] else 1)
+    
     # 如果指定了resume，覆盖配置
     if args.resume:
         config.setdefault("evaluation", {})["resume_from_checkpoint"] = True
     
+    # 抽样快速评测
+    if args.sample:
+        sampling = config.setdefault("evaluation", {}).setdefault("sampling", {})
+        sampling.update(enabled=True, pairs_per_category=args.sample)
+    
     # 创建并运行pipeline
     try:
         pipeline = BenchmarkPipeline(config)
@@ -77,8 +117,16 @@ def main():
         print(f"Overall Mean Score: {summary.get('overall_mean', 0):.3f}")
         
         print("\nCategory Mean Scores:")
+        pairs_used = summary.get("pairs_used", {})
         for cat, score in summary.get("category_means", {}).items():
-            print(f"  - {cat}: {score:.3f}")
+            used = f" ({pairs_used[cat]} pairs used)" if cat in pairs_used else ""
+            print(f"  - {cat}: {score:.3f}{used}")
+        
+        overall_estimate = (report.get("sampling") or report.get("adaptive") or {}).get("overall", {})
+        if overall_estimate.get("ci_low") is not None:
+            print(f"\nEstimated Full-Run Mean (sampled): {overall_estimate['estimated_mean']:.3f} "
+                  f"({overall_estimate['ci_level']:.0%} CI {overall_estimate['ci_low']:.3f} – "
+                  f"{overall_estimate['ci_high']:.3f})")
         
         print("="*60)
         print("\nEvaluation completed successfully!")
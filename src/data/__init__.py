@@ -4,8 +4,10 @@ Data loading module
 """
 
 from .benchmark_loader import BenchmarkLoader
-from .data_types import BenchmarkData, DataPair, CategoryData
+from .data_types import BenchmarkData, DataPair, CategoryData, CategoryColumns, LazyField
+from .synthetic import generate_synthetic_benchmark, synthetic_prompts
 
-__all__ = ["BenchmarkLoader", "BenchmarkData", "DataPair", "CategoryData"]
+__all__ = ["BenchmarkLoader", "BenchmarkData", "DataPair", "CategoryData", "CategoryColumns", "LazyField",
+           "generate_synthetic_benchmark", "synthetic_prompts"]
 
 
@@ -3,13 +3,28 @@ Benchmark data loader
 Benchmark数据加载器
 """
 
+import base64
 import json
+from functools import partial
 from pathlib import Path
 from typing import Dict, List, Optional
 import logging
 
+from PIL import Image
+
 from .data_types import BenchmarkData, CategoryData, DataPair
-from ..utils.image_utils import decode_base64_image
+from ..utils.image_store import ImageContentStore
+
+
+def _b64_from_file(path: str, pair: DataPair) -> str:
+    """原图base64的loader：读取缓存文件并重新编码"""
+    return base64.b64encode(Path(path).read_bytes()).decode("ascii")
+
+
+def _image_from_file(path: str, pair: DataPair) -> Image.Image:
+    """原图的loader：直接从缓存文件解码（不经过base64）"""
+    with Image.open(path) as image:
+        return image.convert("RGB")
 
 
 class BenchmarkLoader:
@@ -31,7 +46,8 @@ class BenchmarkLoader:
     def load(self, 
              data_path: str, 
              categories: List[str],
-             decode_images: bool = False) -> BenchmarkData:
+             decode_images: bool = False,
+             image_cache_dir: Optional[str] = None) -> BenchmarkData:
         """
         加载benchmark数据集
         
@@ -39,6 +55,8 @@ class BenchmarkLoader:
             data_path: JSON文件路径
             categories: 类别名称列表
             decode_images: 是否立即解码base64图像（默认False以节省内存）
+            image_cache_dir: 原图缓存目录（可选）。设置后原图写入磁盘（按内容哈希，跨运行复用），
+                样本中不再保留base64字符串，original_image/original_image_b64在访问时从文件读取
             
         Returns:
             BenchmarkData对象
@@ -58,12 +76,14 @@ class BenchmarkLoader:
         # 按类别组织数据
         category_data_dict = {}
         total_pairs = 0
+        image_store = ImageContentStore(image_cache_dir) if image_cache_dir else None
         
         for category in categories:
             pairs = self._extract_category_data(
                 raw_data, 
                 category, 
-                decode_images=decode_images
+                decode_images=decode_images,
+                image_store=image_store
             )
             
             if pairs:
@@ -94,7 +114,8 @@ class BenchmarkLoader:
     def _extract_category_data(self,
                                raw_data: Dict,
                                category: str,
-                               decode_images: bool = False) -> List[DataPair]:
+                               decode_images: bool = False,
+                               image_store: Optional[ImageContentStore] = None) -> List[DataPair]:
         """
         从原始数据中提取指定类别的数据
         
@@ -102,6 +123,7 @@ class BenchmarkLoader:
             raw_data: 原始JSON数据（可以是list或dict）
             category: 类别名称
             decode_images: 是否解码图像
+            image_store: 原图缓存（可选，设置后样本只保留文件路径）
             
         Returns:
             DataPair列表
@@ -144,20 +166,25 @@ class BenchmarkLoader:
                 edit_instruction = item.get("edit_instruction_en", "")
                 original_description = item.get("original_description_en", "")
                 
-                # 创建DataPair
+                # 创建DataPair（元数据不含图像字段，避免base64随元数据一起常驻内存）
                 pair = DataPair(
                     pair_id=pair_id,
                     category=category,
                     original_image_b64=original_image_b64,
                     edit_instruction=edit_instruction,
                     original_description=original_description,
-                    metadata=item  # 保存完整的原始数据
+                    metadata={key: value for key, value in item.items() if key != "src_img_b64"}
                 )
+                if image_store is not None and original_image_b64:
+                    image_path = image_store.write_b64(original_image_b64)
+                    pair.original_image_b64 = None
+                    pair.set_loader("original_image_b64", partial(_b64_from_file, image_path))
+                    pair.set_loader("original_image", partial(_image_from_file, image_path))
                 
                 # 如果需要，解码图像
                 if decode_images and original_image_b64:
                     try:
-                        pair.original_image = decode_base64_image(original_image_b64)
+                        pair.load("original_image")
                     except Exception as e:
                         self.logger.warning(f"Failed to decode image for {pair_id}: {e}")
                 
@@ -216,7 +243,7 @@ class BenchmarkLoader:
                 
                 if decode_images and pair.original_image_b64:
                     try:
-                        pair.original_image = decode_base64_image(pair.original_image_b64)
+                        pair.load("original_image")
                     except Exception as e:
                         self.logger.warning(f"Failed to decode image for {pair.pair_id}: {e}")
                 
@@ -4,35 +4,186 @@ Data type definitions
 """
 
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
 from PIL import Image
 
+from ..utils.image_utils import decode_base64_image
+
+
+class LazyField:
+    """
+    延迟字段句柄
+
+    值在首次访问时由loader(pair)生成并缓存；drop()只释放缓存，
+    有loader的字段下次访问时重新生成，没有loader的字段释放后不可恢复。
+    """
+
+    __slots__ = ("value", "loader")
+
+    def __init__(self, value: Any = None, loader: Optional[Callable[["DataPair"], Any]] = None):
+        self.value = value
+        self.loader = loader
+
+    def get(self, owner: "DataPair") -> Any:
+        if self.value is None and self.loader is not None:
+            self.value = self.loader(owner)
+        return self.value
+
+    def drop(self) -> None:
+        self.value = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.value is not None
+
+    @property
+    def available(self) -> bool:
+        return self.value is not None or self.loader is not None
+
+
+def _decode_original(pair: "DataPair") -> Optional[Image.Image]:
+    """原始图像的默认loader：由base64解码"""
+    image_b64 = pair.original_image_b64
+    return decode_base64_image(image_b64) if image_b64 else None
+
+
+def _lazy_property(slot: str, doc: str) -> property:
+    """读取时解析延迟字段，赋值时替换缓存的值（赋值None即释放）"""
+    def getter(self):
+        return getattr(self, slot).get(self)
+
+    def setter(self, value):
+        getattr(self, slot).value = value
+
+    return property(getter, setter, doc=doc)
+
 
-@dataclass
 class DataPair:
     """
     单个数据对
     
+    使用__slots__以减少每个样本的内存开销；图像、base64和元数据为延迟字段，
+    可通过set_loader指定来源、通过drop单独释放（见LAZY_FIELDS）
+    
     Attributes:
         pair_id: 数据对的唯一标识
         category: 类别名称
-        original_image_b64: 原始图像的base64编码
+        original_image_b64: 原始图像的base64编码（延迟字段）
         edit_instruction: 编辑指令
         original_description: 原始图像描述
-        original_image: 解码后的PIL图像对象（可选）
-        edited_image: 编辑后的图像（可选）
+        original_image: 解码后的PIL图像对象（延迟字段，默认首次访问时由base64解码）
+        edited_image: 编辑后的图像（延迟字段，溢写后由loader从磁盘读回）
         score: 评分（可选）
-        metadata: 其他元数据
+        metadata: 其他元数据（延迟字段）
+        status: 处理状态（pending, edited, edit_failed, scored, score_failed）
+        rubric_scores: 多维度评分模式下各维度的评分（可选）
+        edited_image_ref: 溢写到磁盘的编辑结果路径（内存受限模式下代替edited_image）
     """
-    pair_id: str
-    category: str
-    original_image_b64: str
-    edit_instruction: str
-    original_description: str
-    original_image: Optional[Image.Image] = None
-    edited_image: Optional[Image.Image] = None
-    score: Optional[float] = None
-    metadata: Optional[Dict] = None
+    
+    # 延迟字段名 -> 存放LazyField的slot
+    LAZY_FIELDS = {
+        "original_image_b64": "_original_image_b64",
+        "original_image": "_original_image",
+        "edited_image": "_edited_image",
+        "metadata": "_metadata",
+    }
+    
+    __slots__ = ("pair_id", "category", "edit_instruction", "original_description", "score", "status",
+                 "rubric_scores", "edited_image_ref") + tuple(LAZY_FIELDS.values())
+    
+    def __init__(self,
+                 pair_id: str,
+                 category: str,
+                 original_image_b64: Optional[str],
+                 edit_instruction: str,
+                 original_description: str,
+                 original_image: Optional[Image.Image] = None,
+                 edited_image: Optional[Image.Image] = None,
+                 score: Optional[float] = None,
+                 metadata: Optional[Dict] = None,
+                 status: str = "pending",
+                 rubric_scores: Optional[Dict[str, float]] = None,
+                 edited_image_ref: Optional[str] = None):
+        self.pair_id = pair_id
+        self.category = category
+        self.edit_instruction = edit_instruction
+        self.original_description = original_description
+        self.score = score
+        self.status = status
+        self.rubric_scores = rubric_scores
+        self.edited_image_ref = edited_image_ref
+        self._original_image_b64 = LazyField(original_image_b64)
+        self._original_image = LazyField(original_image, _decode_original)
+        self._edited_image = LazyField(edited_image)
+        self._metadata = LazyField(metadata)
+    
+    original_image_b64 = _lazy_property("_original_image_b64", "原始图像的base64编码")
+    original_image = _lazy_property("_original_image", "原始图像（首次访问时解码）")
+    edited_image = _lazy_property("_edited_image", "编辑后的图像")
+    metadata = _lazy_property("_metadata", "其他元数据")
+    
+    def _field(self, name: str) -> LazyField:
+        if name not in self.LAZY_FIELDS:
+            raise KeyError(f"Not a lazy field: {name}")
+        return getattr(self, self.LAZY_FIELDS[name])
+    
+    def set_loader(self, name: str, loader: Optional[Callable[["DataPair"], Any]]) -> None:
+        """设置延迟字段的来源（loader(pair)返回字段的值）"""
+        self._field(name).loader = loader
+    
+    def load(self, *names: str) -> None:
+        """预先解析延迟字段"""
+        for name in names:
+            self._field(name).get(self)
+    
+    def drop(self, *names: str) -> None:
+        """释放延迟字段的缓存值"""
+        for name in names:
+            self._field(name).drop()
+    
+    def release(self, *names: str) -> None:
+        """释放可由loader重新生成的字段的缓存值（没有loader的字段保持不变，释放后不会丢失数据）"""
+        for name in names:
+            field = self._field(name)
+            if field.loader is not None:
+                field.drop()
+    
+    def is_loaded(self, name: str) -> bool:
+        """字段值是否已在内存中（不触发解析）"""
+        return self._field(name).loaded
+    
+    def is_available(self, name: str) -> bool:
+        """字段值是否已在内存中或可由loader生成（不触发解析）"""
+        return self._field(name).available
+    
+    def __repr__(self) -> str:
+        return (f"DataPair(pair_id={self.pair_id!r}, category={self.category!r}, "
+                f"status={self.status!r}, score={self.score!r})")
+
+
+@dataclass
+class CategoryColumns:
+    """
+    类别数据的列式视图（统计和报告只需要ID、分数和状态，不必遍历样本对象）
+    
+    Attributes:
+        pair_ids: 样本ID数组
+        scores: 分数数组（未评分的样本为NaN）
+        status: 处理状态数组
+    """
+    pair_ids: np.ndarray
+    scores: np.ndarray
+    status: np.ndarray
+    
+    def scored(self) -> np.ndarray:
+        """成功评分的样本的分数"""
+        return self.scores[self.status == "scored"]
+    
+    def ids_with_status(self, status: str) -> List[str]:
+        """指定状态的样本ID"""
+        return self.pair_ids[self.status == status].tolist()
 
 
 @dataclass
@@ -53,6 +204,15 @@ class CategoryData:
     
     def __len__(self):
         return len(self.data_pairs)
+    
+    def columns(self) -> CategoryColumns:
+        """生成列式视图（反映调用时样本的分数和状态）"""
+        pairs = self.data_pairs
+        return CategoryColumns(
+            pair_ids=np.array([pair.pair_id for pair in pairs], dtype=object),
+            scores=np.array([np.nan if pair.score is None else pair.score for pair in pairs], dtype=np.float64),
+            status=np.array([pair.status for pair in pairs], dtype=object)
+        )
 
 
 @dataclass
@@ -0,0 +1,73 @@
+"""
+Synthetic benchmark data
+合成benchmark数据生成（格式与真实benchmark JSON相同，用于负载测试）
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from ..utils.image_utils import encode_image_to_base64
+
+
+def synthetic_category_names(num_categories: int) -> List[str]:
+    """合成类别名（synthetic_0, synthetic_1, ...）"""
+    return [f"synthetic_{k}" for k in range(num_categories)]
+
+
+def generate_synthetic_benchmark(output_path: str,
+                                 num_categories: int = 3,
+                                 pairs_per_category: int = 10,
+                                 image_size: Tuple[int, int] = (512, 512),
+                                 image_format: str = "PNG",
+                                 seed: int = 0) -> List[str]:
+    """
+    生成合成benchmark JSON文件
+
+    图像为随机噪声（压缩率接近真实照片的下限，base64体积偏大，适合压测解码和传输）
+
+    Args:
+        output_path: 输出JSON文件路径
+        num_categories: 类别数
+        pairs_per_category: 每个类别的样本数
+        image_size: 图像尺寸(宽, 高)
+        image_format: 图像编码格式（PNG或JPEG）
+        seed: 随机种子
+
+    Returns:
+        生成的类别名列表
+    """
+    rng = np.random.default_rng(seed)
+    categories = synthetic_category_names(num_categories)
+    width, height = image_size
+
+    items = []
+    for category in categories:
+        for i in range(pairs_per_category):
+            pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+            items.append({
+                "subset": category,
+                "original_image_path": f"{category}/pair_{i}.png",
+                "src_img_b64": encode_image_to_base64(pixels, format=image_format),
+                "edit_instruction_en": f"Synthetic edit {i} for {category}",
+                "original_description_en": f"Synthetic image {i} in {category}"
+            })
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(items, f)
+    return categories
+
+
+def synthetic_prompts(categories: List[str]) -> Dict[str, Dict[str, str]]:
+    """为合成类别生成prompts配置"""
+    return {
+        category: {
+            "system_prompt": f"You are evaluating {category}.",
+            "user_prompt_template": "Description: {original_description}\nInstruction: {edit_instruction}"
+        }
+        for category in categories
+    }
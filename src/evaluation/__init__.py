@@ -5,7 +5,12 @@ Evaluation module
 
 from .scorer import Scorer
 from .reporter import Reporter
+from .performance import summarize_performance, current_rss_mb, peak_rss_mb
+from .sampling import (StratifiedSampler, SampleState, SequentialStopper, estimate_mean,
+                       estimate_stratified_mean, load_baseline, run_fingerprint)
 
-__all__ = ["Scorer", "Reporter"]
+__all__ = ["Scorer", "Reporter", "summarize_performance", "current_rss_mb", "peak_rss_mb",
+           "StratifiedSampler", "SampleState", "estimate_mean", "estimate_stratified_mean", "run_fingerprint",
+           "SequentialStopper", "load_baseline"]
 
 
@@ -0,0 +1,142 @@
+"""
+Performance summary
+性能摘要（由阶段计时span汇总吞吐、延迟分位数、模型切换耗时和峰值内存）
+"""
+
+import os
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..utils.tracing import Tracer
+
+# 评分的最小计时单元：(类别, 名称) -> 表示该单元包含图像数的参数名
+# 批量单元的耗时平均分摊到其中每张图像
+SCORE_UNITS = {
+    ("reward", "score_batch"): "batch_size",
+    ("ipc", "score"): "num_tasks",
+    ("ipc", "subprocess"): "num_tasks",
+}
+
+# 不计入阶段耗时的pipeline span（category包含了其他阶段，prefetch在后台与编辑重叠）
+_NESTED_STAGES = {"category", "prefetch"}
+
+
+def latency_percentiles(values: List[float]) -> Dict[str, float]:
+    """计算延迟分布（秒）"""
+    if not values:
+        return {"count": 0}
+    array = np.asarray(values)
+    return {
+        "count": len(values),
+        "mean": float(np.mean(array)),
+        "p50": float(np.percentile(array, 50)),
+        "p95": float(np.percentile(array, 95)),
+        "p99": float(np.percentile(array, 99)),
+        "max": float(np.max(array)),
+    }
+
+
+def peak_rss_mb() -> Optional[Dict[str, float]]:
+    """
+    本进程及已回收子进程的峰值常驻内存（MB）
+
+    Returns:
+        {"self": ..., "children": ...}，不支持resource模块的平台返回None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux上ru_maxrss单位为KB，macOS上为字节
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit,
+    }
+
+
+def current_rss_mb() -> Optional[float]:
+    """当前进程的常驻内存（MB，读取/proc/self/statm，不支持的平台返回None）"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _per_gpu(samples: Dict[Any, List[float]], stage_seconds: float) -> Dict[str, Dict[str, float]]:
+    """按GPU汇总图像数、忙碌时间和吞吐（吞吐以整个阶段的墙钟时间为分母）"""
+    return {
+        str(gpu): {
+            "images": len(latencies),
+            "busy_seconds": float(sum(latencies)),
+            "images_per_second": len(latencies) / stage_seconds if stage_seconds > 0 else 0.0,
+        }
+        for gpu, latencies in sorted(samples.items(), key=lambda item: str(item[0]))
+    }
+
+
+def summarize_performance(tracer: Tracer, wall_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """
+    由tracer记录的span生成性能摘要
+
+    出错的span（args中带error）不计入延迟分布
+
+    Args:
+        tracer: 已记录span的计时器
+        wall_seconds: 整次运行的墙钟时间（可选）
+
+    Returns:
+        性能摘要字典，时间单位均为秒
+    """
+    stage_seconds: Dict[str, float] = defaultdict(float)
+    for span in tracer.spans(cat="pipeline"):
+        if span["name"] not in _NESTED_STAGES:
+            stage_seconds[span["name"]] += span["dur"] / 1e6
+
+    edit_samples: Dict[Any, List[float]] = defaultdict(list)
+    for span in tracer.spans(name="edit", cat="diffusion"):
+        if "error" not in span["args"]:
+            edit_samples[span["args"].get("gpu", "all")].append(span["dur"] / 1e6)
+
+    score_samples: Dict[Any, List[float]] = defaultdict(list)
+    for span in tracer.spans():
+        size_arg = SCORE_UNITS.get((span["cat"], span["name"]))
+        if size_arg is None or "error" in span["args"]:
+            continue
+        num_images = max(1, int(span["args"].get(size_arg, 1)))
+        score_samples[span["args"].get("gpu", "all")].extend([span["dur"] / 1e6 / num_images] * num_images)
+
+    swaps = [span["dur"] / 1e6 for span in tracer.spans(name="swap", cat="pipeline")]
+    prefetch = [span["dur"] / 1e6 for span in tracer.spans(name="prefetch", cat="pipeline")]
+
+    summary = {
+        "stage_seconds": dict(stage_seconds),
+        "edit": {
+            "latency": latency_percentiles([v for values in edit_samples.values() for v in values]),
+            "per_gpu": _per_gpu(edit_samples, stage_seconds.get("edit_stage", 0.0)),
+        },
+        "score": {
+            "latency": latency_percentiles([v for values in score_samples.values() for v in values]),
+            "per_gpu": _per_gpu(score_samples, stage_seconds.get("score_stage", 0.0)),
+        },
+        "swap": {
+            "count": len(swaps),
+            "total_seconds": float(sum(swaps)),
+            "max_seconds": float(max(swaps)) if swaps else 0.0,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if prefetch:
+        # 后台预热耗时，以及评分前仍需等待的时间（其余部分与编辑重叠）
+        summary["prefetch"] = {
+            "seconds": float(sum(prefetch)),
+            "wait_seconds": float(stage_seconds.get("prefetch_wait", 0.0)),
+        }
+    if wall_seconds is not None:
+        summary["wall_seconds"] = wall_seconds
+    return summary
@@ -34,7 +34,12 @@ class Reporter:
     def generate_report(self,
                        category_statistics: Dict[str, Dict[str, float]],
                        overall_statistics: Dict[str, float],
-                       metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                       metadata: Optional[Dict[str, Any]] = None,
+                       failures: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                       rubric_statistics: Optional[Dict[str, Dict[str, Dict[str, float]]]] = None,
+                       performance: Optional[Dict[str, Any]] = None,
+                       sampling: Optional[Dict[str, Any]] = None,
+                       adaptive: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         生成评测报告
         
@@ -42,6 +47,11 @@ class Reporter:
             category_statistics: 各类别统计指标
             overall_statistics: 整体统计指标
             metadata: 元数据（模型信息、配置等）
+            failures: 各类别的失败样本，格式为 {category: {failure_type: [pair_id, ...]}}
+            rubric_statistics: 多维度评分的统计，格式为 {category: {rubric: {metric: value}}}
+            performance: 性能摘要（阶段耗时、吞吐、延迟分位数等，见summarize_performance）
+            sampling: 抽样评测的全量估计（见BenchmarkPipeline._sampling_report），统计指标只覆盖抽中的样本
+            adaptive: 自适应评测的各类别实际使用样本数、停止原因和全量估计（见BenchmarkPipeline._adaptive_report）
             
         Returns:
             报告字典
@@ -54,6 +64,28 @@ class Reporter:
             "metadata": metadata or {}
         }
         
+        if failures:
+            report["failures"] = failures
+            report["summary"]["num_failed"] = sum(
+                len(failures[cat].get("edit_failed", [])) + len(failures[cat].get("score_failed", []))
+                for cat in failures
+            )
+        
+        if rubric_statistics:
+            report["rubric_statistics"] = rubric_statistics
+        
+        if performance:
+            report["performance"] = performance
+        
+        if sampling:
+            report["sampling"] = sampling
+        
+        if adaptive:
+            report["adaptive"] = adaptive
+            report["summary"]["pairs_used"] = {
+                category: stats["pairs_used"] for category, stats in adaptive.get("categories", {}).items()
+            }
+        
         return report
     
     def _generate_summary(self,
@@ -153,8 +185,18 @@ class Reporter:
             md_lines.append(f"- **Best Category:** {summary['best_category']['name']} ({summary['best_category']['score']:.3f})")
         if "worst_category" in summary:
             md_lines.append(f"- **Worst Category:** {summary['worst_category']['name']} ({summary['worst_category']['score']:.3f})")
+        if "num_failed" in summary:
+            md_lines.append(f"- **Failed Pairs (excluded):** {summary['num_failed']}")
         md_lines.append("")
         
+        # 抽样评测：全量平均分的估计
+        sampling = report.get("sampling")
+        if sampling:
+            md_lines.extend(self._sampling_markdown(sampling))
+        adaptive = report.get("adaptive")
+        if adaptive:
+            md_lines.extend(self._adaptive_markdown(adaptive))
+        
         # 各类别详细结果
         md_lines.append("## Category Results")
         md_lines.append("")
@@ -163,9 +205,9 @@ class Reporter:
         for category, stats in category_stats.items():
             md_lines.append(f"### {category}")
             md_lines.append("")
-            md_lines.append(f"- **Mean:** {stats.get('mean', 0):.3f}")
+            md_lines.append(f"- **Mean:** {stats.get('mean', 0):.3f}{self._ci_text(stats, 'mean')}")
             md_lines.append(f"- **Std:** {stats.get('std', 0):.3f}")
-            md_lines.append(f"- **Median:** {stats.get('median', 0):.3f}")
+            md_lines.append(f"- **Median:** {stats.get('median', 0):.3f}{self._ci_text(stats, 'median')}")
             md_lines.append(f"- **Min:** {stats.get('min', 0):.3f}")
             md_lines.append(f"- **Max:** {stats.get('max', 0):.3f}")
             md_lines.append(f"- **Samples:** {stats.get('num_samples', 0)}")
@@ -175,15 +217,157 @@ class Reporter:
         md_lines.append("## Overall Statistics")
         md_lines.append("")
         overall_stats = report.get("overall_statistics", {})
-        md_lines.append(f"- **Mean:** {overall_stats.get('mean', 0):.3f}")
+        md_lines.append(f"- **Mean:** {overall_stats.get('mean', 0):.3f}{self._ci_text(overall_stats, 'mean')}")
         md_lines.append(f"- **Std:** {overall_stats.get('std', 0):.3f}")
-        md_lines.append(f"- **Median:** {overall_stats.get('median', 0):.3f}")
+        md_lines.append(f"- **Median:** {overall_stats.get('median', 0):.3f}{self._ci_text(overall_stats, 'median')}")
         md_lines.append(f"- **Min:** {overall_stats.get('min', 0):.3f}")
         md_lines.append(f"- **Max:** {overall_stats.get('max', 0):.3f}")
         md_lines.append("")
         
+        # 多维度评分（各类别在每个维度上的平均分）
+        rubric_stats = report.get("rubric_statistics", {})
+        if rubric_stats:
+            rubrics = list(next(iter(rubric_stats.values())).keys())
+            md_lines.append("## Rubric Scores")
+            md_lines.append("")
+            md_lines.append("| Category | " + " | ".join(rubrics) + " |")
+            md_lines.append("|" + "---|" * (len(rubrics) + 1))
+            for category, stats in rubric_stats.items():
+                means = [f"{stats.get(r, {}).get('mean', 0):.3f}" for r in rubrics]
+                md_lines.append(f"| {category} | " + " | ".join(means) + " |")
+            md_lines.append("")
+        
+        # 失败样本
+        failures = report.get("failures", {})
+        if any(ids for cat_failures in failures.values() for ids in cat_failures.values()):
+            md_lines.append("## Failed Pairs")
+            md_lines.append("")
+            for category, cat_failures in failures.items():
+                for failure_type, pair_ids in cat_failures.items():
+                    if pair_ids:
+                        md_lines.append(f"- **{category} / {failure_type}:** {len(pair_ids)} ({', '.join(pair_ids)})")
+            md_lines.append("")
+        
+        # 性能摘要
+        performance = report.get("performance")
+        if performance:
+            md_lines.extend(self._performance_markdown(performance))
+        
         return "\n".join(md_lines)
     
+    @staticmethod
+    def _ci_text(stats: Dict[str, float], metric: str) -> str:
+        """置信区间文本（没有bootstrap结果时为空）"""
+        if f"{metric}_ci_low" not in stats:
+            return ""
+        return (f" ({stats['ci_level']:.0%} CI {stats[f'{metric}_ci_low']:.3f}"
+                f" – {stats[f'{metric}_ci_high']:.3f})")
+    
+    @staticmethod
+    def _estimate_text(estimate: Dict[str, Any]) -> str:
+        """估计值及置信区间文本"""
+        if "estimated_mean" not in estimate:
+            return "n/a"
+        text = f"{estimate['estimated_mean']:.3f}"
+        if estimate.get("ci_low") is not None:
+            text += f" ({estimate['ci_level']:.0%} CI {estimate['ci_low']:.3f} – {estimate['ci_high']:.3f})"
+        return text
+    
+    def _sampling_markdown(self, sampling: Dict[str, Any]) -> List[str]:
+        """抽样评测的Markdown段落"""
+        md_lines = ["## Sampled Estimates", ""]
+        md_lines.append(f"Stratified sample of up to {sampling['pairs_per_category']} pairs per category "
+                        f"(seed {sampling['seed']}); statistics below cover the sampled pairs only.")
+        md_lines.append("")
+        md_lines.append("| Category | Sampled / Total | Reused | Estimated Mean |")
+        md_lines.append("|---|---|---|---|")
+        for category, stats in sampling.get("categories", {}).items():
+            md_lines.append(f"| {category} | {stats['sampled']} / {stats['population']} | {stats['reused']} | "
+                            f"{self._estimate_text(stats)} |")
+        md_lines.append("")
+        md_lines.append(f"- **Estimated Overall Mean:** {self._estimate_text(sampling.get('overall', {}))}")
+        md_lines.append("")
+        return md_lines
+    
+    def _adaptive_markdown(self, adaptive: Dict[str, Any]) -> List[str]:
+        """自适应评测的Markdown段落"""
+        md_lines = ["## Adaptive Evaluation", ""]
+        md_lines.append(f"Pairs processed in batches of {adaptive['batch_size']} "
+                        f"({adaptive.get('edit_batches_per_swap', 1)} batches per model swap) until the "
+                        f"{adaptive['confidence_level']:.0%} CI half-width reached {adaptive['target_half_width']}"
+                        + (f" or the comparison with {adaptive['baseline_report']} was decisive"
+                           if adaptive.get("baseline_report") else "")
+                        + "; statistics below cover the pairs used only.")
+        md_lines.append("")
+        md_lines.append("| Category | Pairs Used / Total | Stop Reason | Estimated Mean | Difference vs Baseline "
+                        "| Swaps (s) |")
+        md_lines.append("|---|---|---|---|---|---|")
+        for category, stats in adaptive.get("categories", {}).items():
+            difference = "n/a"
+            if "difference" in stats:
+                difference = (f"{stats['difference']:+.3f} ({stats['difference_ci_low']:+.3f} – "
+                              f"{stats['difference_ci_high']:+.3f})")
+            swaps = f"{stats['swaps']} ({stats['swap_seconds']:.1f}s)" if "swaps" in stats else "n/a"
+            md_lines.append(f"| {category} | {stats['pairs_used']} / {stats['population']} | "
+                            f"{stats.get('stop_reason') or 'n/a'} | {self._estimate_text(stats)} | {difference} "
+                            f"| {swaps} |")
+        md_lines.append("")
+        md_lines.append(f"- **Pairs Used:** {adaptive['pairs_used']}")
+        if "swap_seconds" in adaptive:
+            md_lines.append(f"- **Model Swap Time:** {adaptive['swap_seconds']:.1f}s")
+        md_lines.append(f"- **Estimated Overall Mean:** {self._estimate_text(adaptive.get('overall', {}))}")
+        md_lines.append("")
+        return md_lines
+    
+    def _performance_markdown(self, performance: Dict[str, Any]) -> List[str]:
+        """生成性能摘要的Markdown段落"""
+        md_lines = ["## Performance", ""]
+        if "wall_seconds" in performance:
+            md_lines.append(f"- **Wall Time:** {performance['wall_seconds']:.1f}s")
+        swap = performance.get("swap", {})
+        if swap.get("count"):
+            md_lines.append(f"- **Model Swaps:** {swap['count']} (total {swap['total_seconds']:.1f}s, "
+                            f"max {swap['max_seconds']:.1f}s)")
+        prefetch = performance.get("prefetch")
+        if prefetch:
+            md_lines.append(f"- **Reward Prefetch:** {prefetch['seconds']:.1f}s in background "
+                            f"(waited {prefetch['wait_seconds']:.1f}s)")
+        peak_rss = performance.get("peak_rss_mb")
+        if peak_rss:
+            md_lines.append(f"- **Peak RSS:** {peak_rss['self']:.0f} MB (children {peak_rss['children']:.0f} MB)")
+        memory = performance.get("memory") or {}
+        if memory.get("max_rss_mb"):
+            status = {True: "within budget", False: "exceeded"}.get(memory.get("within_budget"), "not measured")
+            md_lines.append(f"- **Memory Budget:** {memory['max_rss_mb']} MB ({status})")
+        spill = memory.get("spill")
+        if spill:
+            md_lines.append(f"- **Spilled Images:** {spill['written']} ({spill['bytes'] / 1e6:.1f} MB, "
+                            f"{spill['failed']} failed)")
+        md_lines.append("")
+        
+        stage_seconds = performance.get("stage_seconds", {})
+        if stage_seconds:
+            md_lines.append("| Stage | Seconds |")
+            md_lines.append("|---|---|")
+            for stage, seconds in stage_seconds.items():
+                md_lines.append(f"| {stage} | {seconds:.2f} |")
+            md_lines.append("")
+        
+        md_lines.append("| Phase | Images | p50 (s) | p95 (s) | p99 (s) | Images/s per GPU |")
+        md_lines.append("|---|---|---|---|---|---|")
+        for phase in ("edit", "score"):
+            latency = performance.get(phase, {}).get("latency", {})
+            if not latency.get("count"):
+                continue
+            throughput = ", ".join(
+                f"{gpu}: {stats['images_per_second']:.2f}"
+                for gpu, stats in performance[phase].get("per_gpu", {}).items()
+            )
+            md_lines.append(f"| {phase} | {latency['count']} | {latency['p50']:.3f} | {latency['p95']:.3f} | "
+                            f"{latency['p99']:.3f} | {throughput} |")
+        md_lines.append("")
+        return md_lines
+    
     def save_markdown_report(self,
                             report: Dict[str, Any],
                             filename: Optional[str] = None) -> str:
@@ -0,0 +1,309 @@
+"""
+Stratified sampling for quick evaluation
+分层抽样快速评测与自适应（序贯停止）评测
+
+每个类别（即数据中的subset）作为一层，确定性地抽取k个样本走完整的编辑+评分流程，
+并估计全量运行时各类别及整体的平均分和置信区间，用于训练过程中快速筛查checkpoint。
+
+抽样顺序由(seed, 类别, pair_id)的哈希决定，与数据文件中的顺序无关；k增大时新的样本集
+包含原样本集，配合SampleState可以在之前的抽样上增量扩展，已评分的样本不会重新处理。
+自适应评测按同样的顺序分批处理样本，由SequentialStopper决定每个类别何时停止。
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+from pathlib import Path
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# 配置中影响单个样本分数的部分（变化时已保存的分数失效）
+FINGERPRINT_SECTIONS = ("diffusion_model", "reward_model", "prompts")
+
+
+def sample_key(seed: int, category: str, pair_id: str) -> str:
+    """样本的抽样排序键"""
+    return hashlib.sha1(f"{seed}\0{category}\0{pair_id}".encode("utf-8")).hexdigest()
+
+
+class StratifiedSampler:
+    """
+    按类别分层的确定性抽样器
+
+    每个类别按sample_key排序后取前pairs_per_category个样本（类别样本数不足时全部取用）
+    """
+
+    def __init__(self, pairs_per_category: int, seed: int = 0):
+        """
+        初始化抽样器
+
+        Args:
+            pairs_per_category: 每个类别抽取的样本数k
+            seed: 抽样种子（相同的种子和数据得到相同的样本）
+        """
+        if pairs_per_category <= 0:
+            raise ValueError(f"pairs_per_category must be positive, got {pairs_per_category}")
+        self.pairs_per_category = pairs_per_category
+        self.seed = seed
+
+    def order(self, category_data) -> list:
+        """类别内全部样本的抽样顺序"""
+        return sorted(category_data.data_pairs,
+                      key=lambda pair: sample_key(self.seed, category_data.category_name, pair.pair_id))
+
+    def sample(self, category_data) -> list:
+        """抽取的样本（抽样顺序的前k个）"""
+        return self.order(category_data)[:self.pairs_per_category]
+
+
+def run_fingerprint(config: Dict[str, Any]) -> str:
+    """配置中影响样本分数的部分（模型、prompt、数据文件、多维度评分）的指纹"""
+    evaluation = config.get("evaluation", {})
+    relevant = {section: config.get(section, {}) for section in FINGERPRINT_SECTIONS}
+    relevant["data_path"] = config.get("benchmark", {}).get("data_path")
+    relevant["multi_rubric"] = evaluation.get("multi_rubric", {})
+    encoded = json.dumps(relevant, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+class SampleState:
+    """
+    抽样评测的持久化状态
+
+    按类别记录已成功评分的样本的分数及是否以降低的分辨率编辑（失败的样本不记录，下次运行时重试）；
+    指纹与当前配置不一致时丢弃旧状态。每个类别完成后原子写入，中断后可继续
+    """
+
+    def __init__(self, path: str, fingerprint: str, logger: Optional[logging.Logger] = None):
+        """
+        初始化状态（读取已有的状态文件）
+
+        Args:
+            path: 状态文件路径
+            fingerprint: 当前配置的指纹（见run_fingerprint）
+            logger: 日志记录器（可选）
+        """
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self.logger = logger or logging.getLogger(__name__)
+        # {category: {pair_id: {"score": ..., "rubric_scores": ..., "degraded": ...}}}
+        self.pairs: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"Ignoring unreadable sampling state {self.path}: {e}")
+                return
+            if data.get("fingerprint") != fingerprint:
+                self.logger.warning(f"Sampling state {self.path} was produced with a different model/prompt/data "
+                                    f"config, starting a new sample")
+                return
+            self.pairs = data.get("pairs", {})
+
+    def restore(self, category: str, pairs: Sequence) -> List:
+        """把已保存的分数写回样本，返回被复用的样本"""
+        saved = self.pairs.get(category, {})
+        restored = []
+        for pair in pairs:
+            entry = saved.get(pair.pair_id)
+            if entry is None:
+                continue
+            pair.score = entry["score"]
+            pair.rubric_scores = entry.get("rubric_scores")
+            pair.status = "scored"
+            restored.append(pair)
+        return restored
+
+    def degraded_ids(self, category: str, pairs: Sequence) -> List[str]:
+        """已保存的样本中以降低的分辨率编辑的样本ID"""
+        saved = self.pairs.get(category, {})
+        return [pair.pair_id for pair in pairs if saved.get(pair.pair_id, {}).get("degraded")]
+
+    def record(self, category: str, pairs: Sequence, degraded_ids: Sequence[str] = ()) -> None:
+        """
+        记录成功评分的样本
+
+        Args:
+            category: 类别名
+            pairs: 本次处理的样本
+            degraded_ids: 其中以降低的分辨率编辑成功的样本ID
+        """
+        saved = self.pairs.setdefault(category, {})
+        degraded_ids = set(degraded_ids)
+        for pair in pairs:
+            if pair.status == "scored" and pair.score is not None:
+                saved[pair.pair_id] = {"score": pair.score, "rubric_scores": pair.rubric_scores,
+                                       "degraded": pair.pair_id in degraded_ids}
+
+    def save(self) -> None:
+        """原子写入状态文件"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"fingerprint": self.fingerprint, "pairs": self.pairs}, f)
+        os.replace(tmp_path, self.path)
+
+
+def _z_value(confidence_level: float) -> float:
+    return NormalDist().inv_cdf(0.5 + confidence_level / 2)
+
+
+def estimate_mean(scores, population_size: int, confidence_level: float = 0.95) -> Dict[str, Any]:
+    """
+    由抽样分数估计全量平均分（不放回抽样，标准误带有限总体校正）
+
+    Args:
+        scores: 抽中样本的分数
+        population_size: 类别的总样本数N
+        confidence_level: 置信水平
+
+    Returns:
+        {"estimated_mean", "std_error", "ci_level", "ci_low", "ci_high", "num_sampled", "population"}；
+        少于2个分数时标准误和区间为None，没有分数时返回空字典
+    """
+    scores_array = np.asarray(scores, dtype=np.float64)
+    n = scores_array.size
+    if n == 0:
+        return {}
+    mean = float(scores_array.mean())
+    estimate = {"estimated_mean": mean, "std_error": None, "ci_level": confidence_level,
+                "ci_low": None, "ci_high": None, "num_sampled": int(n), "population": int(population_size)}
+    if n < 2:
+        return estimate
+
+    fpc = max(0.0, 1.0 - n / population_size) if population_size else 1.0
+    std_error = math.sqrt(fpc * scores_array.var(ddof=1) / n)
+    half_width = _z_value(confidence_level) * std_error
+    estimate.update(std_error=std_error, ci_low=mean - half_width, ci_high=mean + half_width)
+    return estimate
+
+
+def estimate_stratified_mean(category_scores: Dict[str, Any],
+                             population_sizes: Dict[str, int],
+                             confidence_level: float = 0.95) -> Dict[str, Any]:
+    """
+    分层估计全量的整体平均分（各类别按总样本数加权，与全量运行时合并所有分数的平均分一致）
+
+    没有分数的类别不参与估计（权重在其余类别间重新归一化）；
+    有类别少于2个分数时标准误和区间为None
+
+    Args:
+        category_scores: {类别: 抽中样本的分数}
+        population_sizes: {类别: 总样本数}
+        confidence_level: 置信水平
+
+    Returns:
+        与estimate_mean相同格式的字典
+    """
+    strata = {c: np.asarray(s, dtype=np.float64) for c, s in category_scores.items() if len(s)}
+    if not strata:
+        return {}
+    total = sum(population_sizes[c] for c in strata)
+    mean = sum(population_sizes[c] / total * s.mean() for c, s in strata.items())
+    estimate = {"estimated_mean": float(mean), "std_error": None, "ci_level": confidence_level,
+                "ci_low": None, "ci_high": None,
+                "num_sampled": int(sum(s.size for s in strata.values())), "population": int(total)}
+    if any(s.size < 2 for s in strata.values()):
+        return estimate
+
+    variance = 0.0
+    for category, s in strata.items():
+        weight = population_sizes[category] / total
+        fpc = max(0.0, 1.0 - s.size / population_sizes[category])
+        variance += weight ** 2 * fpc * s.var(ddof=1) / s.size
+    std_error = math.sqrt(variance)
+    half_width = _z_value(confidence_level) * std_error
+    estimate.update(std_error=std_error, ci_low=float(mean) - half_width, ci_high=float(mean) + half_width)
+    return estimate
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, float]]:
+    """
+    读取基线运行的JSON报告中各类别的平均分
+
+    抽样/自适应运行的报告使用其全量估计及标准误；全量运行的平均分就是该基准上的精确值，标准误为0
+
+    Returns:
+        {category: {"mean", "std_error"}}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    baseline = {
+        category: {"mean": stats["mean"], "std_error": 0.0}
+        for category, stats in report.get("category_statistics", {}).items() if "mean" in stats
+    }
+    for section in ("sampling", "adaptive"):
+        for category, stats in (report.get(section) or {}).get("categories", {}).items():
+            if "estimated_mean" in stats:
+                baseline[category] = {"mean": stats["estimated_mean"], "std_error": stats.get("std_error") or 0.0}
+    return baseline
+
+
+class SequentialStopper:
+    """
+    按置信区间的序贯停止规则（自适应评测）
+
+    每处理完一批样本检查一次：全量估计的置信区间半宽降到target_half_width以下，
+    或与基线的差值的置信区间不包含0（比较已有定论）时停止。每批都检查会放大误判率，
+    confidence_level应高于报告中使用的置信水平
+    """
+
+    def __init__(self,
+                 target_half_width: Optional[float] = None,
+                 min_pairs: int = 2,
+                 confidence_level: float = 0.99):
+        """
+        初始化停止规则
+
+        Args:
+            target_half_width: 目标置信区间半宽（None表示只按基线比较停止）
+            min_pairs: 检查停止条件前至少需要的分数数
+            confidence_level: 停止判断使用的置信水平
+        """
+        self.target_half_width = target_half_width
+        self.min_pairs = max(2, min_pairs)
+        self.confidence_level = confidence_level
+
+    def check(self, scores, population_size: int, num_used: int,
+              baseline: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """
+        检查是否停止
+
+        Args:
+            scores: 已成功评分的分数
+            population_size: 类别的总样本数
+            num_used: 已处理的样本数（包括失败的样本）
+            baseline: 该类别的基线 {"mean", "std_error"}（可选）
+
+        Returns:
+            estimate_mean的结果，另含stop、stop_reason（exhausted、target_width、baseline_decisive）、
+            ci_half_width，有基线时含baseline_mean、difference、difference_ci_low、difference_ci_high
+        """
+        estimate = estimate_mean(scores, population_size, self.confidence_level)
+        result = {**estimate, "stop": False, "stop_reason": None}
+        if num_used >= population_size:
+            result.update(stop=True, stop_reason="exhausted")
+        if estimate.get("std_error") is None:
+            return result
+
+        z = _z_value(self.confidence_level)
+        result["ci_half_width"] = z * estimate["std_error"]
+        if baseline is not None:
+            difference = estimate["estimated_mean"] - baseline["mean"]
+            half_width = z * math.sqrt(estimate["std_error"] ** 2 + baseline["std_error"] ** 2)
+            result.update(baseline_mean=baseline["mean"], difference=difference,
+                          difference_ci_low=difference - half_width, difference_ci_high=difference + half_width)
+        if result["stop"] or len(scores) < self.min_pairs:
+            return result
+
+        if baseline is not None and not result["difference_ci_low"] <= 0.0 <= result["difference_ci_high"]:
+            result.update(stop=True, stop_reason="baseline_decisive")
+        elif self.target_half_width is not None and result["ci_half_width"] <= self.target_half_width:
+            result.update(stop=True, stop_reason="target_width")
+        return result
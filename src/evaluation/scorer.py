@@ -12,21 +12,70 @@ class Scorer:
     """
     评分统计器
     
-    负责计算各类别的统计指标（平均分、标准差等）
+    负责计算各类别的统计指标（平均分、标准差等）及平均分、中位数的bootstrap置信区间
     """
     
+    # 单次重采样矩阵的元素上限（B×N超过时按行分块，限制内存占用）
+    MAX_RESAMPLE_ELEMENTS = 4_000_000
+    
     def __init__(self, 
                  metrics: Optional[List[str]] = None,
-                 logger: Optional[logging.Logger] = None):
+                 logger: Optional[logging.Logger] = None,
+                 bootstrap_resamples: int = 0,
+                 confidence_level: float = 0.95,
+                 seed: int = 0):
         """
         初始化评分统计器
         
         Args:
             metrics: 需要计算的统计指标列表，默认为["mean", "std", "median"]
             logger: 日志记录器（可选）
+            bootstrap_resamples: bootstrap重采样次数B（0表示不计算置信区间）
+            confidence_level: 置信水平
+            seed: 重采样的随机种子（相同的分数得到相同的区间）
         """
         self.metrics = metrics or ["mean", "std", "median", "min", "max"]
         self.logger = logger or logging.getLogger(__name__)
+        self.bootstrap_resamples = bootstrap_resamples
+        self.confidence_level = confidence_level
+        self.seed = seed
+    
+    def bootstrap_ci(self, scores) -> Dict[str, float]:
+        """
+        平均分和中位数的bootstrap百分位置信区间
+        
+        用一个(B × N)的索引矩阵一次完成全部重采样（矩阵过大时按行分块）
+        
+        Args:
+            scores: 评分（列表或numpy数组）
+            
+        Returns:
+            {"ci_level", "mean_ci_low", "mean_ci_high", "median_ci_low", "median_ci_high"}
+        """
+        scores_array = np.asarray(scores, dtype=np.float64)
+        n = scores_array.size
+        rng = np.random.default_rng(self.seed)
+        rows_per_block = max(1, self.MAX_RESAMPLE_ELEMENTS // n)
+        
+        means = np.empty(self.bootstrap_resamples)
+        medians = np.empty(self.bootstrap_resamples)
+        for start in range(0, self.bootstrap_resamples, rows_per_block):
+            stop = min(start + rows_per_block, self.bootstrap_resamples)
+            samples = scores_array[rng.integers(0, n, size=(stop - start, n))]
+            means[start:stop] = samples.mean(axis=1)
+            medians[start:stop] = np.median(samples, axis=1)
+        
+        alpha = (1.0 - self.confidence_level) / 2
+        (mean_low, median_low), (mean_high, median_high) = np.quantile(
+            np.stack([means, medians]), [alpha, 1.0 - alpha], axis=1
+        )
+        return {
+            "ci_level": self.confidence_level,
+            "mean_ci_low": float(mean_low),
+            "mean_ci_high": float(mean_high),
+            "median_ci_low": float(median_low),
+            "median_ci_high": float(median_high),
+        }
     
     def compute_category_statistics(self, 
                                     scores: List[float],
@@ -35,13 +84,13 @@ class Scorer:
         计算单个类别的统计指标
         
         Args:
-            scores: 该类别的所有评分列表
+            scores: 该类别的所有评分（列表或numpy数组）
             category_name: 类别名称
             
         Returns:
             统计指标字典
         """
-        if not scores:
+        if len(scores) == 0:
             self.logger.warning(f"No scores for category '{category_name}'")
             return {}
         
@@ -69,6 +118,9 @@ class Scorer:
         # 添加样本数量
         stats["num_samples"] = len(scores)
         
+        if self.bootstrap_resamples > 0:
+            stats.update(self.bootstrap_ci(scores_array))
+        
         return stats
     
     def compute_all_statistics(self, 
@@ -142,7 +194,7 @@ class Scorer:
         total_count = 0
         
         for scores in category_scores.values():
-            if scores:
+            if len(scores):
                 total_score += sum(scores)
                 total_count += len(scores)
         
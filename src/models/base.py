@@ -49,4 +49,13 @@ class BaseModel(ABC):
         默认实现：不做任何操作
         """
         pass
+    
+    def prefetch(self):
+        """
+        在后台预热模型（pipeline在阶段1编辑期间于后台线程中调用，评分前等待其完成）
+        
+        子类可以重写此方法，例如把权重读入页缓存或提前加载到内存（不应占用显存）
+        默认实现：不做任何操作
+        """
+        pass
 
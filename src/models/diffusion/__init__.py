@@ -4,7 +4,8 @@ Diffusion model module
 """
 
 from .base_diffusion import BaseDiffusionModel
+from .retry_policy import EditRetryPolicy, EditOutcome
 
-__all__ = ["BaseDiffusionModel"]
+__all__ = ["BaseDiffusionModel", "EditRetryPolicy", "EditOutcome"]
 
 
@@ -4,10 +4,11 @@ Base diffusion model class
 """
 
 from abc import abstractmethod
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 from PIL import Image
 
 from ..base import BaseModel
+from ...utils import get_tracer
 
 
 class BaseDiffusionModel(BaseModel):
@@ -55,6 +56,7 @@ class BaseDiffusionModel(BaseModel):
     def batch_edit(self,
                    images: list,
                    instructions: list,
+                   on_result: Optional[Callable[[int, Image.Image], Any]] = None,
                    **kwargs) -> list:
         """
         批量编辑图像（默认实现，可被子类覆盖以优化性能）
@@ -62,6 +64,8 @@ class BaseDiffusionModel(BaseModel):
         Args:
             images: 原始图像列表
             instructions: 编辑指令列表
+            on_result: 每张图像编辑完成后的回调on_result(index, image)（可选），
+                返回值代替图像放入结果列表（如落盘后的路径，图像本身随即释放）
             **kwargs: 其他参数
             
         Returns:
@@ -71,9 +75,11 @@ class BaseDiffusionModel(BaseModel):
             raise ValueError("Number of images must match number of instructions")
         
         edited_images = []
-        for img, inst in zip(images, instructions):
-            edited_img = self.edit_image(img, inst, **kwargs)
-            edited_images.append(edited_img)
+        tracer = get_tracer()
+        for idx, (img, inst) in enumerate(zip(images, instructions)):
+            with tracer.span("edit", cat="diffusion"):
+                edited_img = self.edit_image(img, inst, **kwargs)
+            edited_images.append(on_result(idx, edited_img) if on_result else edited_img)
         
         return edited_images
 
@@ -1,11 +1,30 @@
 """
 Diffusion model implementations
 扩散模型具体实现
+
+实现模块在首次访问对应的类时才导入（Qwen实现依赖torch/diffusers）
 """
 
-from .example_model import ExampleDiffusionModel
-from .qwen_image_edit import QwenImageEditModel
-from .multi_gpu_qwen_edit import MultiGPUQwenImageEditModel
+import importlib
+
+# 类名 -> 所在模块
+_LAZY_IMPORTS = {
+    "ExampleDiffusionModel": ".example_model",
+    "QwenImageEditModel": ".qwen_image_edit",
+    "MultiGPUQwenImageEditModel": ".multi_gpu_qwen_edit",
+    "SyntheticDiffusionModel": ".synthetic_model",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
 
-__all__ = ["ExampleDiffusionModel", "QwenImageEditModel", "MultiGPUQwenImageEditModel"]
 
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
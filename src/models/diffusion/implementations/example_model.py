@@ -7,7 +7,7 @@ Example diffusion model implementation
 """
 
 import time
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 from PIL import Image
 
 from ..base_diffusion import BaseDiffusionModel
@@ -87,6 +87,7 @@ class ExampleDiffusionModel(BaseDiffusionModel):
     def batch_edit(self,
                    images: list,
                    instructions: list,
+                   on_result: Optional[Callable[[int, Image.Image], Any]] = None,
                    **kwargs) -> list:
         """
         批量编辑图像（可选：优化的批处理实现）
@@ -94,6 +95,6 @@ class ExampleDiffusionModel(BaseDiffusionModel):
         如果你的模型支持批处理，可以在这里实现更高效的批处理逻辑
         """
         # 默认使用父类的逐个处理实现
-        return super().batch_edit(images, instructions, **kwargs)
+        return super().batch_edit(images, instructions, on_result=on_result, **kwargs)
 
 
@@ -5,20 +5,53 @@ Multi-GPU Qwen-Image-Edit diffusion model implementation
 基于已验证的多GPU任务分配逻辑
 """
 
+import math
+import os
 import threading
+import time
 import torch
 from PIL import Image
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, List, Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
 from ..base_diffusion import BaseDiffusionModel
-from ....utils import setup_logger
+from ..retry_policy import EditRetryPolicy, EditOutcome, EditAttempt
+from ....utils import get_tracer, setup_logger
 
 
 # 全局锁，用于序列化模型加载过程（避免OOM）
 _model_load_lock = threading.Lock()
 
+# Qwen-Image-Edit pipeline内部按该面积和32对齐计算输出分辨率
+_TARGET_AREA = 1024 * 1024
+_compile_cache_lock = threading.Lock()
+_compile_cache_dir = None
+
+
+def _configure_compile_cache(cache_dir: str):
+    """
+    配置torch.compile的持久化缓存目录（进程内只配置一次）
+    
+    Inductor的FX graph缓存和autotune结果都会写到该目录，
+    后续运行命中缓存时可跳过大部分编译时间
+    """
+    global _compile_cache_dir
+    with _compile_cache_lock:
+        if _compile_cache_dir is not None:
+            return
+        cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = cache_dir
+        os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+        os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+        try:
+            import torch._inductor.config as inductor_config
+            inductor_config.fx_graph_cache = True
+        except Exception:
+            pass
+        _compile_cache_dir = cache_dir
+
 
 class GPUWorker:
     """GPU工作器类，每个实例绑定到一个GPU"""
@@ -46,6 +79,15 @@ class GPUWorker:
         self.negative_prompt = config.get("negative_prompt", " ")
         self.seed = config.get("seed", 0)
         self.disable_progress_bar = config.get("disable_progress_bar", True)
+        
+        # torch.compile编译模式（可选）
+        self.compile_transformer = config.get("compile_transformer", False)
+        self.compile_mode = config.get("compile_mode", "max-autotune-no-cudagraphs")
+        self.compile_cache_dir = config.get("compile_cache_dir", "outputs/compile_cache")
+        self.compile_measure_speedup = config.get("compile_measure_speedup", False)
+        self._eager_transformer = None
+        self._warm_buckets = set()
+        self.compile_stats = {"warmup": {}, "steady": {}, "eager": {}}
     
     def _load_model_serial(self):
         """
@@ -89,6 +131,10 @@ class GPUWorker:
                 if self.disable_progress_bar:
                     self.pipeline.set_progress_bar_config(disable=True)
                 
+                # 编译transformer（实际编译在每个分辨率桶的首次调用时发生）
+                if self.compile_transformer:
+                    self._compile_transformer()
+                
                 self._model_loaded = True
                 print(f"[GPU {self.gpu_id}] ✅ Model loaded successfully")
                 return True
@@ -99,6 +145,74 @@ class GPUWorker:
                 traceback.print_exc()
                 return False
     
+    def _compile_transformer(self):
+        """用torch.compile包装pipeline的transformer，保留eager版本用于对比"""
+        _configure_compile_cache(self.compile_cache_dir)
+        print(f"[GPU {self.gpu_id}] ⚙️  Compiling transformer (mode={self.compile_mode}, cache={_compile_cache_dir})")
+        self._eager_transformer = self.pipeline.transformer
+        self.pipeline.transformer = torch.compile(
+            self._eager_transformer,
+            mode=self.compile_mode,
+            dynamic=False
+        )
+    
+    @staticmethod
+    def _resolution_bucket(image: Image.Image, height: int = None, width: int = None) -> tuple:
+        """
+        计算图像对应的分辨率桶（与pipeline内部的尺寸计算保持一致）
+        
+        编译后的图按输入shape特化，同一个桶内的图像共享同一份编译结果
+        """
+        if height is not None and width is not None:
+            return (int(width), int(height))
+        w, h = image.size
+        ratio = w / h
+        bucket_w = math.sqrt(_TARGET_AREA * ratio)
+        bucket_h = bucket_w / ratio
+        return (int(round(bucket_w / 32) * 32), int(round(bucket_h / 32) * 32))
+    
+    def _run_pipeline(self, inputs: Dict[str, Any]) -> Image.Image:
+        """执行一次pipeline推理并等待GPU完成"""
+        with torch.inference_mode():
+            output = self.pipeline(**inputs)
+        torch.cuda.synchronize(self.device)
+        return output.images[0]
+    
+    def _measure_eager(self, bucket: tuple, inputs: Dict[str, Any]):
+        """在未编译的transformer上跑一次，作为该桶的加速比基线"""
+        compiled = self.pipeline.transformer
+        eager_inputs = dict(inputs)
+        eager_inputs.pop("callback_on_step_end", None)
+        eager_inputs["generator"] = torch.Generator(device=self.device).manual_seed(0)
+        self.pipeline.transformer = self._eager_transformer
+        try:
+            start = time.perf_counter()
+            self._run_pipeline(eager_inputs)
+            self.compile_stats["eager"][bucket] = time.perf_counter() - start
+        finally:
+            self.pipeline.transformer = compiled
+    
+    def get_compile_report(self) -> Dict[str, Any]:
+        """
+        汇总编译模式的耗时统计
+        
+        Returns:
+            {"WxH": {"warmup_s", "steady_mean_s", "steady_count", "eager_s", "speedup"}}
+        """
+        report = {}
+        for bucket, warmup in self.compile_stats["warmup"].items():
+            steady = self.compile_stats["steady"].get(bucket, [])
+            eager = self.compile_stats["eager"].get(bucket)
+            steady_mean = sum(steady) / len(steady) if steady else None
+            report[f"{bucket[0]}x{bucket[1]}"] = {
+                "warmup_s": warmup,
+                "steady_mean_s": steady_mean,
+                "steady_count": len(steady),
+                "eager_s": eager,
+                "speedup": (eager / steady_mean) if eager and steady_mean else None,
+            }
+        return report
+    
     def _ensure_model_loaded(self):
         """确保模型已加载"""
         if self._model_loaded:
@@ -152,6 +266,11 @@ class GPUWorker:
             "num_inference_steps": num_steps,
         }
         
+        # 显式指定输出分辨率（重试策略降分辨率时使用）
+        if kwargs.get("height") is not None and kwargs.get("width") is not None:
+            inputs["height"] = kwargs["height"]
+            inputs["width"] = kwargs["width"]
+        
         # 添加去噪进度条（如果启用）
         if show_progress:
             from tqdm import tqdm
@@ -164,17 +283,32 @@ class GPUWorker:
             
             inputs["callback_on_step_end"] = callback
         
+        bucket = None
+        if self.compile_transformer:
+            bucket = self._resolution_bucket(original_image, kwargs.get("height"), kwargs.get("width"))
+            if bucket not in self._warm_buckets and self.compile_measure_speedup:
+                self._measure_eager(bucket, inputs)
+        
         # 执行编辑
+        start = time.perf_counter()
         try:
-            with torch.inference_mode():
-                output = self.pipeline(**inputs)
-                edited_image = output.images[0]
+            with get_tracer().span("edit", cat="diffusion", gpu=self.gpu_id, steps=num_steps):
+                edited_image = self._run_pipeline(inputs)
         finally:
             if show_progress:
                 pbar.close()
+            # 清理GPU缓存（失败时同样释放，便于后续重试）
+            torch.cuda.empty_cache()
+        elapsed = time.perf_counter() - start
         
-        # 清理GPU缓存
-        torch.cuda.empty_cache()
+        # 每个分辨率桶的首次调用包含编译时间，单独记为warmup
+        if bucket is not None:
+            if bucket not in self._warm_buckets:
+                self._warm_buckets.add(bucket)
+                self.compile_stats["warmup"][bucket] = elapsed
+                print(f"[GPU {self.gpu_id}] 🔥 Warmup for bucket {bucket[0]}x{bucket[1]}: {elapsed:.1f}s")
+            else:
+                self.compile_stats["steady"].setdefault(bucket, []).append(elapsed)
         
         return edited_image
     
@@ -182,15 +316,17 @@ class GPUWorker:
         """将模型从GPU卸载到CPU"""
         if self._model_loaded and self.pipeline is not None:
             print(f"[GPU {self.gpu_id}] 🔄 Unloading model from GPU...")
-            self.pipeline.to('cpu')
-            torch.cuda.empty_cache()
+            with get_tracer().span("unload", cat="swap", gpu=self.gpu_id):
+                self.pipeline.to('cpu')
+                torch.cuda.empty_cache()
             print(f"[GPU {self.gpu_id}] ✅ Model unloaded")
     
     def load_to_gpu(self):
         """将模型从CPU加载到GPU"""
         if self._model_loaded and self.pipeline is not None:
             print(f"[GPU {self.gpu_id}] 🔄 Loading model to GPU...")
-            self.pipeline.to(self.device)
+            with get_tracer().span("load", cat="swap", gpu=self.gpu_id):
+                self.pipeline.to(self.device)
             print(f"[GPU {self.gpu_id}] ✅ Model loaded to GPU")
 
 
@@ -234,6 +370,10 @@ class MultiGPUQwenImageEditModel(BaseDiffusionModel):
         
         print(f"[MultiGPUQwenImageEdit] 创建了 {len(self.workers)} 个GPU workers\n")
         
+        # 编辑失败重试策略
+        self.retry_policy = EditRetryPolicy(self.config.get("retry_policy", {}))
+        self.last_edit_outcomes = []
+        
         # ===== 串行加载所有GPU的模型 =====
         print("=" * 70)
         print("🚀 Sequential Model Loading Phase")
@@ -285,6 +425,7 @@ class MultiGPUQwenImageEditModel(BaseDiffusionModel):
     
     def batch_edit(self, images: List[Image.Image],
                    instructions: List[str],
+                   on_result: Optional[Callable[[int, Image.Image], Any]] = None,
                    **kwargs) -> List[Image.Image]:
         """
         多GPU并行批量编辑图像（带批次同步）
@@ -297,11 +438,13 @@ class MultiGPUQwenImageEditModel(BaseDiffusionModel):
         Args:
             images: 原始图像列表
             instructions: 编辑指令列表
+            on_result: 每张图像编辑成功后的回调on_result(index, image)（可选），
+                返回值代替图像放入结果列表（如落盘后的路径，图像本身随即释放）
             **kwargs: 其他参数
                 - enable_batch_sync: 是否启用批次同步（默认True）
             
         Returns:
-            编辑后的图像列表
+            编辑后的图像列表（重试后仍失败的位置为None，详情见last_edit_outcomes）
         """
         if len(images) != len(instructions):
             raise ValueError("Number of images must match number of instructions")
@@ -344,24 +487,53 @@ class MultiGPUQwenImageEditModel(BaseDiffusionModel):
         if enable_sync:
             # 批次同步模式：每批num_gpus个任务，批次间同步
             results = self._batch_edit_with_sync(
-                images, instructions, n, num_gpus, base_seed, **kwargs
+                images, instructions, n, num_gpus, base_seed, on_result, **kwargs
             )
         else:
             # 原始模式：一次性提交所有任务（向后兼容）
             results = self._batch_edit_no_sync(
-                images, instructions, n, num_gpus, base_seed, **kwargs
+                images, instructions, n, num_gpus, base_seed, on_result, **kwargs
             )
         
-        print(f"✅ Batch edit completed: {n} images\n")
+        num_failed = sum(1 for o in self.last_edit_outcomes if o.status == "failed")
+        num_degraded = sum(1 for o in self.last_edit_outcomes if o.status == "ok" and o.scale < 1.0)
+        num_store_failed = sum(1 for o in self.last_edit_outcomes if o.status == "store_failed")
+        print(f"✅ Batch edit completed: {n} images ({num_failed} failed, {num_degraded} at reduced resolution, "
+              f"{num_store_failed} storage errors)\n")
+        
+        if self.workers[0].compile_transformer:
+            self._print_compile_report()
+        
         return results
     
-    def _batch_edit_with_sync(self, images, instructions, n, num_gpus, base_seed, **kwargs):
+    def get_compile_report(self) -> Dict[int, Dict[str, Any]]:
+        """获取各GPU的编译耗时统计（warmup与稳态分开）"""
+        return {worker.gpu_id: worker.get_compile_report() for worker in self.workers}
+    
+    def _print_compile_report(self):
+        """打印编译模式的warmup耗时和稳态加速比"""
+        print("=" * 70)
+        print("⚙️  torch.compile report:")
+        print("=" * 70)
+        for gpu_id, buckets in self.get_compile_report().items():
+            for bucket, stats in buckets.items():
+                line = f"  GPU {gpu_id} [{bucket}] warmup={stats['warmup_s']:.1f}s"
+                if stats["steady_mean_s"] is not None:
+                    line += f", steady={stats['steady_mean_s']:.2f}s/img (n={stats['steady_count']})"
+                if stats["speedup"] is not None:
+                    line += f", eager={stats['eager_s']:.2f}s, speedup={stats['speedup']:.2f}x"
+                print(line)
+        print("=" * 70)
+        print()
+    
+    def _batch_edit_with_sync(self, images, instructions, n, num_gpus, base_seed, on_result=None, **kwargs):
         """
         批次同步模式：确保每批所有GPU完成后再开始下一批
         
         这样可以避免GPU之间进度差异累积，防止卡间通信混乱
         """
         results = [None] * n
+        outcomes = [EditOutcome(index=i) for i in range(n)]
         
         # 计算批次数
         num_batches = (n + num_gpus - 1) // num_gpus
@@ -384,6 +556,8 @@ class MultiGPUQwenImageEditModel(BaseDiffusionModel):
                     # 提交当前批次的任务
                     futures = []
                     indices = []
+                    gpu_ids = []
+                    batch_start_ns = time.perf_counter_ns()
                     
                     for i in range(batch_start, batch_end):
                         worker = self.workers[(i - batch_start) % num_gpus]
@@ -398,31 +572,39 @@ class MultiGPUQwenImageEditModel(BaseDiffusionModel):
                         )
                         futures.append(future)
                         indices.append(i)
+                        gpu_ids.append(worker.gpu_id)
                     
                     # 等待当前批次所有任务完成（同步点）
-                    for future, idx in zip(futures, indices):
+                    for future, idx, gpu_id in zip(futures, indices, gpu_ids):
                         try:
                             result = future.result()
-                            results[idx] = result
                         except Exception as e:
-                            print(f"\n❌ Error editing image {idx}: {e}")
-                            results[idx] = images[idx]  # fallback
+                            print(f"\n❌ Error editing image {idx} on GPU {gpu_id}: {e}")
+                            outcomes[idx].status = "failed"
+                            outcomes[idx].attempts.append(EditAttempt(gpu_id, error=e))
+                        else:
+                            outcomes[idx].attempts.append(EditAttempt(gpu_id))
+                            results[idx] = self._deliver_result(outcomes[idx], result, on_result)
                         finally:
                             pbar.update(1)
                     
                     # 当前批次完成，所有GPU已同步，可以开始下一批
+                    # （时间线上sync_batch与各GPU的edit之差即为同步等待）
+                    get_tracer().add_span("sync_batch", batch_start_ns, time.perf_counter_ns(),
+                                          cat="diffusion", batch=batch_idx, size=batch_size)
                     if batch_idx < num_batches - 1:
                         pbar.set_postfix_str(f"Batch {batch_idx+1}/{num_batches} done, GPUs synced ✓")
         
-        return results
+        return self._retry_failed(images, instructions, results, outcomes, base_seed, on_result, **kwargs)
     
-    def _batch_edit_no_sync(self, images, instructions, n, num_gpus, base_seed, **kwargs):
+    def _batch_edit_no_sync(self, images, instructions, n, num_gpus, base_seed, on_result=None, **kwargs):
         """
         无同步模式：一次性提交所有任务（原始实现）
         
         适用于GPU性能一致或不关心同步的场景
         """
         results = [None] * n
+        outcomes = [EditOutcome(index=i) for i in range(n)]
         
         print(f"⚡ No-sync mode: All {n} tasks submitted at once\n")
         
@@ -441,21 +623,122 @@ class MultiGPUQwenImageEditModel(BaseDiffusionModel):
                     current_seed,
                     **kwargs
                 )
-                future_to_index[future] = idx
+                future_to_index[future] = (idx, worker.gpu_id)
             
             # 收集结果（带进度条）
             with tqdm(total=n, desc="[NO-SYNC] Editing images", unit="img") as pbar:
                 for future in as_completed(future_to_index):
-                    idx = future_to_index[future]
+                    idx, gpu_id = future_to_index[future]
                     try:
                         result = future.result()
-                        results[idx] = result
                     except Exception as e:
-                        print(f"\n❌ Error editing image {idx}: {e}")
-                        results[idx] = images[idx]
+                        print(f"\n❌ Error editing image {idx} on GPU {gpu_id}: {e}")
+                        outcomes[idx].status = "failed"
+                        outcomes[idx].attempts.append(EditAttempt(gpu_id, error=e))
+                    else:
+                        outcomes[idx].attempts.append(EditAttempt(gpu_id))
+                        results[idx] = self._deliver_result(outcomes[idx], result, on_result)
                     finally:
                         pbar.update(1)
         
+        return self._retry_failed(images, instructions, results, outcomes, base_seed, on_result, **kwargs)
+    
+    def _gpus_by_free_memory(self) -> List[int]:
+        """按空闲显存从多到少排列GPU"""
+        def free_memory(gpu_id):
+            try:
+                return torch.cuda.mem_get_info(gpu_id)[0]
+            except Exception:
+                return 0
+        return sorted((w.gpu_id for w in self.workers), key=free_memory, reverse=True)
+    
+    @staticmethod
+    def _scaled_kwargs(image: Image.Image, scale: float, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """按缩放比例计算降分辨率重试时的输出尺寸"""
+        if scale >= 1.0:
+            return kwargs
+        width, height = GPUWorker._resolution_bucket(image)
+        return {
+            **kwargs,
+            "width": max(32, int(round(width * scale / 32)) * 32),
+            "height": max(32, int(round(height * scale / 32)) * 32),
+        }
+    
+    @staticmethod
+    def _deliver_result(outcome: EditOutcome, result, on_result):
+        """
+        把编辑成功的图像交给on_result，返回放入结果列表的值
+        
+        on_result的异常（溢写、写入的I/O错误）不是编辑失败：不计入编辑尝试、不重试，
+        样本标记为store_failed，结果为None
+        """
+        if on_result is None:
+            return result
+        try:
+            return on_result(outcome.index, result)
+        except Exception as e:
+            print(f"\n💾 Error storing edited image {outcome.index}: {e}")
+            outcome.status = "store_failed"
+            outcome.storage_error = e
+            return None
+    
+    def _retry_failed(self, images, instructions, results, outcomes, base_seed, on_result=None, **kwargs):
+        """
+        按重试策略处理失败的样本
+        
+        每轮按全部GPU为每个待重试样本规划（见EditRetryPolicy.plan），每个GPU每轮最多一个任务，
+        选中的GPU本轮已被占用时推迟到下一轮（不因此降低分辨率）；各GPU并行执行，
+        重试耗尽的样本保持None并标记为failed
+        """
+        self.last_edit_outcomes = outcomes
+        pending = [o for o in outcomes if o.status == "failed"]
+        if not pending:
+            return results
+        
+        print(f"\n🔁 Retrying {len(pending)} failed edits (max_retries={self.retry_policy.max_retries})...")
+        workers_by_id = {w.gpu_id: w for w in self.workers}
+        
+        with ThreadPoolExecutor(max_workers=len(self.workers)) as executor:
+            while pending:
+                gpus = self._gpus_by_free_memory()
+                busy = set()
+                round_tasks = []
+                deferred = []
+                
+                for outcome in pending:
+                    action = self.retry_policy.plan(outcome, gpus)
+                    if action is None:
+                        print(f"❌ Image {outcome.index} failed after {len(outcome.attempts)} attempts: "
+                              f"{outcome.last_error}")
+                        continue
+                    if action.gpu_id in busy:
+                        deferred.append(outcome)
+                        continue
+                    busy.add(action.gpu_id)
+                    future = executor.submit(
+                        workers_by_id[action.gpu_id].edit_image,
+                        images[outcome.index],
+                        instructions[outcome.index],
+                        base_seed + outcome.index,
+                        **self._scaled_kwargs(images[outcome.index], action.scale, kwargs)
+                    )
+                    round_tasks.append((future, outcome, action))
+                
+                pending = deferred
+                for future, outcome, action in round_tasks:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        outcome.attempts.append(EditAttempt(action.gpu_id, action.scale, e))
+                        pending.append(outcome)
+                        continue
+                    outcome.status = "ok"
+                    outcome.attempts.append(EditAttempt(action.gpu_id, action.scale))
+                    results[outcome.index] = self._deliver_result(outcome, result, on_result)
+                    if outcome.status == "ok":
+                        print(f"✅ Image {outcome.index} succeeded on retry "
+                              f"(GPU {action.gpu_id}, scale={action.scale})")
+        
         return results
     
     def unload_from_gpu(self):
@@ -7,7 +7,7 @@ Qwen图像编辑模型实现
 
 import torch
 from PIL import Image
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 
 from ..base_diffusion import BaseDiffusionModel
 
@@ -107,6 +107,7 @@ class QwenImageEditModel(BaseDiffusionModel):
     def batch_edit(self,
                    images: list,
                    instructions: list,
+                   on_result: Optional[Callable[[int, Image.Image], Any]] = None,
                    **kwargs) -> list:
         """
         批量编辑图像
@@ -117,6 +118,7 @@ class QwenImageEditModel(BaseDiffusionModel):
         Args:
             images: 原始图像列表
             instructions: 编辑指令列表
+            on_result: 每张图像编辑完成后的回调on_result(index, image)（可选），返回值代替图像放入结果列表
             **kwargs: 其他参数
             
         Returns:
@@ -136,7 +138,7 @@ class QwenImageEditModel(BaseDiffusionModel):
             current_kwargs["seed"] = base_seed + idx
             
             edited_img = self.edit_image(img, inst, **current_kwargs)
-            edited_images.append(edited_img)
+            edited_images.append(on_result(idx, edited_img) if on_result else edited_img)
         
         return edited_images
     
@@ -0,0 +1,90 @@
+"""
+Synthetic diffusion model
+合成负载扩散模型（桩模型，不需要GPU）
+
+按配置的延迟分布模拟编辑耗时，按失败率模拟编辑失败，用多个线程模拟多GPU，
+用于在CPU机器上测量BenchmarkPipeline的编排开销（见tools/bench_synthetic_load.py）。
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+from PIL import Image
+
+from ..base_diffusion import BaseDiffusionModel
+from ...simulation import SimulatedLoad
+from ....utils import get_tracer
+
+
+class SyntheticDiffusionModel(BaseDiffusionModel):
+    """
+    合成负载扩散模型
+
+    配置项：
+        device_ids: 模拟的GPU列表（每个GPU一个线程），默认[0]
+        latency: 每张图像的编辑延迟（秒，或{distribution, mean, std}）
+        swap_latency: 模型加载/卸载的延迟（秒）
+        failure_rate: 编辑失败率（按编辑指令哈希决定，多次运行一致）
+        memory_mb: 模拟模型占用的内存
+        seed: 随机种子
+    """
+
+    def _initialize(self):
+        """初始化模拟负载"""
+        self.device_ids = self.config.get("device_ids", [0])
+        self.load = SimulatedLoad(self.config)
+        self.swap = SimulatedLoad(self.config, latency_key="swap_latency")
+        print(f"[SyntheticDiffusionModel] {len(self.device_ids)} simulated GPUs, "
+              f"latency={self.load.distribution}({self.load.mean}s), "
+              f"failure_rate={self.load.failure_rate}, memory={self.load.memory_mb:.0f}MB")
+
+    def edit_image(self,
+                   original_image: Image.Image,
+                   edit_instruction: str,
+                   **kwargs) -> Image.Image:
+        """
+        模拟一次编辑：休眠采样的延迟后返回原图副本
+
+        Raises:
+            RuntimeError: 该样本被模拟为失败
+        """
+        self.load.wait()
+        if self.load.fails(edit_instruction):
+            raise RuntimeError(f"Simulated edit failure: {edit_instruction}")
+        return original_image.copy()
+
+    def batch_edit(self,
+                   images: list,
+                   instructions: list,
+                   on_result: Optional[Callable[[int, Image.Image], Any]] = None,
+                   **kwargs) -> List[Optional[Image.Image]]:
+        """
+        按GPU数并行编辑，失败的样本返回None（与MultiGPUQwenImageEditModel一致）；
+        on_result(index, image)的返回值代替图像放入结果列表
+        """
+        if len(images) != len(instructions):
+            raise ValueError("Number of images must match number of instructions")
+
+        tracer = get_tracer()
+
+        def edit_on_gpu(slot: int) -> None:
+            gpu_id = self.device_ids[slot]
+            for i in range(slot, len(images), len(self.device_ids)):
+                try:
+                    with tracer.span("edit", cat="diffusion", gpu=gpu_id):
+                        edited = self.edit_image(images[i], instructions[i], **kwargs)
+                    results[i] = on_result(i, edited) if on_result else edited
+                except RuntimeError as e:
+                    print(f"[SyntheticDiffusionModel] GPU {gpu_id}: {e}")
+
+        results: List[Optional[Image.Image]] = [None] * len(images)
+        with ThreadPoolExecutor(max_workers=len(self.device_ids)) as executor:
+            list(executor.map(edit_on_gpu, range(len(self.device_ids))))
+        return results
+
+    def unload_from_gpu(self):
+        """模拟卸载耗时"""
+        self.swap.wait()
+
+    def load_to_gpu(self):
+        """模拟加载耗时"""
+        self.swap.wait()
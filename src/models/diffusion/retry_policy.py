@@ -0,0 +1,158 @@
+"""
+Edit failure retry policy
+图像编辑失败重试策略
+
+决定一次失败的编辑是否重试、在哪个GPU上重试、以及是否降低分辨率。
+多次重试仍失败的样本会被显式标记为失败，而不是用原图代替。
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class EditAttempt:
+    """
+    单次编辑尝试
+
+    Attributes:
+        gpu_id: 执行该次尝试的GPU
+        scale: 相对默认分辨率的缩放比例（1.0表示原始分辨率）
+        error: 失败时的异常（成功时为None）
+    """
+    gpu_id: int
+    scale: float = 1.0
+    error: Optional[BaseException] = None
+
+
+@dataclass
+class EditOutcome:
+    """
+    单个样本的最终编辑结果
+
+    Attributes:
+        index: 样本在batch中的索引
+        status: "ok"、"failed"，或"store_failed"（编辑成功但结果回调落盘失败，不重试）
+        attempts: 所有尝试记录（按时间顺序）
+        storage_error: 结果回调（落盘、写入）的异常
+    """
+    index: int
+    status: str = "ok"
+    attempts: List[EditAttempt] = field(default_factory=list)
+    storage_error: Optional[BaseException] = None
+
+    @property
+    def last_error(self) -> Optional[BaseException]:
+        """最后一次尝试的异常"""
+        return self.attempts[-1].error if self.attempts else None
+
+    @property
+    def scale(self) -> float:
+        """最后一次尝试使用的缩放比例"""
+        return self.attempts[-1].scale if self.attempts else 1.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的字典（用于报告）"""
+        return {
+            "index": self.index,
+            "status": self.status,
+            "attempts": [
+                {
+                    "gpu_id": a.gpu_id,
+                    "scale": a.scale,
+                    "error": str(a.error) if a.error is not None else None
+                }
+                for a in self.attempts
+            ],
+            "storage_error": str(self.storage_error) if self.storage_error is not None else None
+        }
+
+
+@dataclass
+class RetryAction:
+    """
+    下一次重试的计划
+
+    Attributes:
+        gpu_id: 重试使用的GPU
+        scale: 重试使用的分辨率缩放比例
+    """
+    gpu_id: int
+    scale: float = 1.0
+
+
+class EditRetryPolicy:
+    """
+    编辑失败重试策略
+
+    - CUDA OOM：优先换到其他（空闲显存更多的）GPU以原分辨率重试，
+      所有GPU都试过后按downscale_factors逐级降低分辨率
+    - 其他异常：默认不重试（通常是输入问题），可通过retry_non_oom开启换卡重试
+    - 重试次数超过max_retries后放弃，由调用方标记为失败样本
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        初始化重试策略
+
+        Args:
+            config: 策略配置，支持的键：
+                - max_retries: 最大重试次数（不含首次尝试，默认2）
+                - retry_on_other_gpu: OOM时是否换卡重试（默认True）
+                - downscale_factors: 逐级降分辨率的比例列表（默认[0.75, 0.5]）
+                - retry_non_oom: 非OOM异常是否也换卡重试（默认False）
+        """
+        config = config or {}
+        self.max_retries = config.get("max_retries", 2)
+        self.retry_on_other_gpu = config.get("retry_on_other_gpu", True)
+        self.downscale_factors = sorted(config.get("downscale_factors", [0.75, 0.5]), reverse=True)
+        self.retry_non_oom = config.get("retry_non_oom", False)
+
+    @staticmethod
+    def is_oom(error: Optional[BaseException]) -> bool:
+        """判断异常是否为显存不足（不依赖torch导入）"""
+        if error is None:
+            return False
+        if type(error).__name__ == "OutOfMemoryError":
+            return True
+        return "out of memory" in str(error).lower()
+
+    def should_retry(self, outcome: EditOutcome) -> bool:
+        """判断样本是否还有重试机会"""
+        if outcome.last_error is None:
+            return False
+        if len(outcome.attempts) > self.max_retries:
+            return False
+        return self.is_oom(outcome.last_error) or self.retry_non_oom
+
+    def plan(self, outcome: EditOutcome, candidate_gpus: List[int]) -> Optional[RetryAction]:
+        """
+        为失败样本规划下一次重试
+
+        Args:
+            outcome: 样本当前的编辑结果（至少包含一次失败尝试）
+            candidate_gpus: 全部GPU，按优先级排序（如空闲显存从多到少）；
+                选中的GPU本轮已被占用时由调用方推迟到下一轮，而不是改用其他GPU或降低分辨率
+
+        Returns:
+            RetryAction，无法继续重试时返回None
+        """
+        if not candidate_gpus or not self.should_retry(outcome):
+            return None
+
+        current_scale = outcome.scale
+        tried = {a.gpu_id for a in outcome.attempts if a.scale == current_scale}
+        untried = [g for g in candidate_gpus if g not in tried]
+
+        if not self.is_oom(outcome.last_error):
+            # 非OOM异常：只换卡，不降分辨率
+            return RetryAction(untried[0], current_scale) if untried else None
+
+        if self.retry_on_other_gpu and untried:
+            return RetryAction(untried[0], current_scale)
+
+        for factor in self.downscale_factors:
+            if factor < current_scale:
+                return RetryAction(candidate_gpus[0], factor)
+
+        return None
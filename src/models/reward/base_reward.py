@@ -8,6 +8,7 @@ from typing import Any, Dict, Optional
 from PIL import Image
 
 from ..base import BaseModel
+from ...utils import get_tracer
 
 
 class BaseRewardModel(BaseModel):
@@ -17,6 +18,11 @@ class BaseRewardModel(BaseModel):
     所有具体的Reward模型实现都应该继承这个类，并实现score方法
     """
     
+    @property
+    def uses_original_image(self) -> bool:
+        """评分时是否输入原图（compare_with_original）；为False时pipeline不读取、不传递原图"""
+        return bool(self.config.get("compare_with_original", False))
+    
     @abstractmethod
     def score(self,
               edited_image: Image.Image,
@@ -108,18 +114,68 @@ class BaseRewardModel(BaseModel):
             original_images = [None] * n
         
         scores = []
+        tracer = get_tracer()
         for i in range(n):
-            score = self.score(
-                edited_image=edited_images[i],
-                original_description=original_descriptions[i],
-                edit_instruction=edit_instructions[i],
-                system_prompt=system_prompts[i],
-                user_prompt=user_prompts[i],
-                original_image=original_images[i],
-                **kwargs
-            )
+            with tracer.span("score_batch", cat="reward", batch_size=1):
+                score = self.score(
+                    edited_image=edited_images[i],
+                    original_description=original_descriptions[i],
+                    edit_instruction=edit_instructions[i],
+                    system_prompt=system_prompts[i],
+                    user_prompt=user_prompts[i],
+                    original_image=original_images[i],
+                    **kwargs
+                )
             scores.append(score)
         
         return scores
 
 
+    
+    def batch_score_multi(self,
+                          edited_images: list,
+                          original_descriptions: list,
+                          edit_instructions: list,
+                          rubric_prompts: list,
+                          original_images: Optional[list] = None,
+                          **kwargs) -> list:
+        """
+        多维度批量评分：每个样本按多个评分维度（rubric）各得一个分数
+        
+        默认实现按维度逐次调用batch_score；支持复用图像编码的子类应覆盖此方法
+        
+        Args:
+            edited_images: 编辑后的图像列表
+            original_descriptions: 原始图像描述列表
+            edit_instructions: 编辑指令列表
+            rubric_prompts: 每个样本的维度prompt列表，
+                rubric_prompts[i][r] = {"system_prompt": ..., "user_prompt": ...}
+            original_images: 原始图像列表（可选）
+            **kwargs: 其他参数（透传给batch_score）
+            
+        Returns:
+            分数向量列表，scores[i][r]对应第i个样本的第r个维度
+        """
+        n = len(edited_images)
+        if len(rubric_prompts) != n:
+            raise ValueError("rubric_prompts must have the same length as edited_images")
+        if n == 0:
+            return []
+        
+        num_rubrics = len(rubric_prompts[0])
+        if any(len(rubrics) != num_rubrics for rubrics in rubric_prompts):
+            raise ValueError("All samples must have the same number of rubrics")
+        
+        columns = []
+        for r in range(num_rubrics):
+            columns.append(self.batch_score(
+                edited_images=edited_images,
+                original_descriptions=original_descriptions,
+                edit_instructions=edit_instructions,
+                system_prompts=[rubrics[r]["system_prompt"] for rubrics in rubric_prompts],
+                user_prompts=[rubrics[r]["user_prompt"] for rubrics in rubric_prompts],
+                original_images=original_images,
+                **kwargs
+            ))
+        
+        return [[column[i] for column in columns] for i in range(n)]
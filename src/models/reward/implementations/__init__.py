@@ -1,17 +1,32 @@
 """
 Reward model implementations
 Reward模型具体实现
+
+实现模块在首次访问对应的类时才导入（qwen3_vl_reward依赖torch/transformers，
+使用示例模型或子进程评分模型的配置不必在主进程中加载它们）
 """
 
-from .example_reward import ExampleRewardModel
-from .qwen3_vl_reward import Qwen3VLRewardModel
-from .qwen3_vl_subprocess import Qwen3VLSubprocessRewardModel
-from .qwen3_vl_multi_gpu_subprocess import Qwen3VLMultiGPUSubprocessRewardModel
+import importlib
+
+# 类名 -> 所在模块
+_LAZY_IMPORTS = {
+    "ExampleRewardModel": ".example_reward",
+    "Qwen3VLRewardModel": ".qwen3_vl_reward",
+    "Qwen3VLSubprocessRewardModel": ".qwen3_vl_subprocess",
+    "Qwen3VLMultiGPUSubprocessRewardModel": ".qwen3_vl_multi_gpu_subprocess",
+    "SyntheticRewardModel": ".synthetic_reward",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
 
-__all__ = [
-    "ExampleRewardModel", 
-    "Qwen3VLRewardModel", 
-    "Qwen3VLSubprocessRewardModel",
-    "Qwen3VLMultiGPUSubprocessRewardModel"
-]
 
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -3,19 +3,225 @@ Qwen3-VL Multi-GPU Subprocess Reward Model
 使用数据并行：多个GPU各运行一个独立的评分进程
 """
 
+import atexit
 import json
+import os
+import queue
 import tempfile
 import subprocess
+import threading
 import time
-import base64
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 from PIL import Image
-from io import BytesIO
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from tqdm import tqdm
 
 from ..base_reward import BaseRewardModel
-from ....utils import setup_logger
+from ..qwen3_vl_utils import TRANSPORT_FORMATS, encode_transport_image, fit_pixel_budget, read_stream_results
+from ....utils import ImageContentStore, get_tracer, model_weight_files, prefetch_files, setup_logger
+
+# 等待评分子进程时检查是否卡住的间隔（秒）
+STALL_POLL_INTERVAL = 10.0
+
+
+def visible_gpu_ids() -> List[int]:
+    """
+    不导入torch获取可见GPU编号（与torch.cuda.device_count()一致，从0开始编号）
+
+    CUDA_VISIBLE_DEVICES已设置时按其中的设备数，否则查询nvidia-smi；都不可用时返回[0]
+    """
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        devices = []
+        for device in visible.split(","):
+            device = device.strip()
+            if not device or device.startswith("-"):
+                break  # CUDA在第一个无效编号处截断列表
+            devices.append(device)
+        return list(range(len(devices))) or [0]
+    try:
+        result = subprocess.run(["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return [0]
+    count = sum(1 for line in result.stdout.splitlines() if line.strip().isdigit())
+    return list(range(count)) if result.returncode == 0 and count else [0]
+
+
+class ScoringShardError(RuntimeError):
+    """评分子进程失败，附带失败前已完成的部分分数（按任务顺序）"""
+    
+    def __init__(self, message: str, partial_scores: Optional[List[float]] = None):
+        super().__init__(message)
+        self.partial_scores = partial_scores or []
+
+
+class ScoringProgress:
+    """
+    汇总各GPU评分子进程的进度事件：一个总进度条、按GPU的完成数，并转发给回调
+
+    事件格式见qwen3_vl_utils.ProgressChannel；handle可从多个读取线程并发调用
+    """
+    
+    def __init__(self, total: int, callbacks: List[Callable[[int, Dict], None]],
+                 desc: str = "[Multi-GPU] Scoring"):
+        self.pbar = tqdm(total=total, desc=desc, unit="img")
+        self.callbacks = callbacks
+        self.per_gpu: Dict[int, int] = {}
+        self._lock = threading.Lock()
+    
+    def handle(self, gpu_id: int, event: Dict) -> None:
+        """处理一个事件（score事件推进总进度）"""
+        with self._lock:
+            if event.get("event") == "score":
+                self.per_gpu[gpu_id] = self.per_gpu.get(gpu_id, 0) + 1
+                self.pbar.update(1)
+            for callback in self.callbacks:
+                callback(gpu_id, event)
+    
+    def close(self) -> None:
+        self.pbar.close()
+
+
+class ScorerWorker:
+    """
+    常驻评分子进程，每个实例绑定到一个GPU
+    
+    子进程只加载一次模型（standalone脚本的--serve模式），通过stdin/stdout交换JSON lines；
+    stdout和stderr由后台线程持续读取，避免管道写满导致死锁
+    """
+    
+    def __init__(self, gpu_id: int, cmd: List[str]):
+        """
+        初始化评分worker
+        
+        Args:
+            gpu_id: GPU ID
+            cmd: 启动子进程的完整命令
+        """
+        self.gpu_id = gpu_id
+        self.cmd = cmd
+        self.process = None
+        self._responses = queue.Queue()
+        self._request_lock = threading.Lock()
+        self._next_id = 0
+    
+    @property
+    def alive(self) -> bool:
+        """子进程是否仍在运行"""
+        return self.process is not None and self.process.poll() is None
+    
+    def start(self, timeout: float):
+        """启动子进程并等待模型加载完成"""
+        self._responses = queue.Queue()
+        self.process = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        # 读取线程绑定本次启动的进程和响应队列，被终止的旧进程的结束标记不会进入重启后的队列
+        threading.Thread(target=self._read_stdout, args=(self.process, self._responses), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self.process,), daemon=True).start()
+        try:
+            self._wait_response(None, timeout)
+        except TimeoutError:
+            self.kill()
+            raise
+    
+    def _read_stdout(self, process: subprocess.Popen, responses: queue.Queue):
+        """读取协议响应（子进程退出时放入None作为结束标记）"""
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                responses.put(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"[GPU {self.gpu_id}] {line}")
+        responses.put(None)
+    
+    def _read_stderr(self, process: subprocess.Popen):
+        """转发子进程日志"""
+        for line in process.stderr:
+            print(f"[GPU {self.gpu_id}] {line.rstrip()}")
+    
+    def _wait_response(self, request_id: Optional[int], timeout: float) -> Dict:
+        """等待指定id的响应（丢弃超时请求遗留的过期响应）"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                message = self._responses.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                raise TimeoutError(f"GPU {self.gpu_id} scorer did not respond within {timeout}s")
+            if message is None:
+                self._responses.put(None)
+                # stdout已关闭：等待进程退出并回收，保证alive状态准确
+                try:
+                    self.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    pass
+                raise RuntimeError(f"GPU {self.gpu_id} scorer process exited (code {self.process.poll()})")
+            if message.get("id") == request_id:
+                return message
+    
+    def request(self, cmd: str, timeout: float, **payload) -> Dict:
+        """
+        发送一个请求并等待响应
+        
+        Args:
+            cmd: 命令（score, offload, load, shutdown）
+            timeout: 超时时间（秒）
+            **payload: 请求附带的数据（如tasks）
+            
+        Returns:
+            响应字典
+        """
+        with self._request_lock, get_tracer().span(cmd, cat="ipc", gpu=self.gpu_id,
+                                                    num_tasks=len(payload.get("tasks", ()))):
+            self._next_id += 1
+            request_id = self._next_id
+            message = {"id": request_id, "cmd": cmd, **payload}
+            try:
+                self.process.stdin.write(json.dumps(message, ensure_ascii=False) + "\n")
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                raise RuntimeError(f"GPU {self.gpu_id} scorer process is not accepting requests: {e}")
+            try:
+                response = self._wait_response(request_id, timeout)
+            except TimeoutError:
+                # 子进程仍在处理超时的请求，之后的请求只会排在它后面：终止子进程，
+                # 调用方据此把该GPU视为不健康，下次_ensure_workers时重启
+                self.kill()
+                raise
+        
+        if response.get("status") != "ok":
+            raise RuntimeError(f"GPU {self.gpu_id} error: {response.get('error', 'Unknown')}")
+        return response
+    
+    def kill(self):
+        """强制终止子进程并回收"""
+        if self.process is None:
+            return
+        self.process.kill()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            pass
+    
+    def close(self, timeout: float = 30):
+        """关闭子进程"""
+        if not self.alive:
+            return
+        try:
+            self.request("shutdown", timeout)
+            self.process.wait(timeout=timeout)
+        except Exception:
+            self.kill()
 
 
 class Qwen3VLMultiGPUSubprocessRewardModel(BaseRewardModel):
@@ -42,16 +248,57 @@ class Qwen3VLMultiGPUSubprocessRewardModel(BaseRewardModel):
         self.conda_env = config.get("conda_env", None)
         self.python_path = config.get("python_path", None)
         self.timeout = config.get("timeout", 600)
+        # 非常驻模式：任务经stdin流式传给子进程，结果逐条写回（false时使用完整的输入/输出JSON文件）
+        self.stream_tasks = config.get("stream_tasks", True)
+        
+        # 常驻worker配置：模型在各类别之间保持加载，任务从共享队列动态领取
+        self.persistent_workers = config.get("persistent_workers", True)
+        self.startup_timeout = config.get("startup_timeout", 1800)
+        self.offload_mode = config.get("offload_mode", "cpu")  # cpu: 类别间移到内存; shutdown: 关闭进程
+        self.workers = []
+        self._workers_lock = threading.Lock()
+        # 进度回调 callback(gpu_id, event)，见add_progress_callback
+        self.progress_callbacks: List[Callable[[int, Dict], None]] = []
+        self._workers_offloaded = False
+        
+        # 阶段1编辑期间的后台预热：page_cache（把权重文件读入页缓存）、
+        # host_memory（提前启动常驻worker并把模型加载到CPU内存，需要persistent_workers）或none
+        self.prefetch_mode = config.get("prefetch", "page_cache")
+        
+        # 失败隔离：失败的任务重新分配给健康的GPU，最多重试max_task_retries次
+        self.max_task_retries = config.get("max_task_retries", 2)
+        
+        # 多维度评分时复用图像前缀的KV cache
+        self.reuse_image_prefix = config.get("reuse_image_prefix", True)
+        
+        # 回复中出现完整分数后即停止生成
+        self.stop_at_score = config.get("stop_at_score", True)
+        # 子进程中后台线程提前准备的batch数（图像预处理与生成重叠）
+        self.prefetch_batches = config.get("prefetch_batches", 2)
+
+        # 视觉token预算：编辑图在父进程中缩放后再传输（同时减小IPC数据量），原图由子进程按同样的预算缩放
+        self.min_pixels = config.get("min_pixels", None)
+        self.max_pixels = config.get("max_pixels", None)
+        
+        # 编辑图的传输编码：在线程池中并行编码，各GPU的任务在其图像编码完成后立即发出
+        self.transport_format = config.get("transport_format", "png")
+        if self.transport_format not in TRANSPORT_FORMATS:
+            raise ValueError(f"transport_format must be one of {TRANSPORT_FORMATS}, got {self.transport_format}")
+        self.transport_compress_level = config.get("transport_compress_level", 1)
+        self.encode_workers = config.get("encode_workers", min(8, os.cpu_count() or 1))
+
+        # 对比模式：同时输入原图，原图按内容哈希缓存在磁盘上，任务中只传递路径
+        self.compare_with_original = config.get("compare_with_original", False)
+        self.original_store = None
+        if self.compare_with_original:
+            self.original_store = ImageContentStore(config.get("original_cache_dir", "outputs/original_cache"))
+        self.last_failed_indices = []
         
         # 多GPU配置
         device_ids = config.get("device_ids", None)
         if device_ids is None:
-            # 默认使用所有可用GPU
-            import torch
-            if torch.cuda.is_available():
-                self.device_ids = list(range(torch.cuda.device_count()))
-            else:
-                self.device_ids = [0]
+            # 默认使用所有可用GPU（不在主进程中导入torch）
+            self.device_ids = visible_gpu_ids()
         else:
             self.device_ids = device_ids
         
@@ -80,110 +327,318 @@ class Qwen3VLMultiGPUSubprocessRewardModel(BaseRewardModel):
         elif self.python_path:
             self.logger.info(f"  Python: {self.python_path}")
     
-    def _encode_image(self, image: Image.Image) -> str:
-        """将PIL图像编码为base64字符串"""
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+    def _build_command(self, gpu_id: int) -> List[str]:
+        """构建调用standalone脚本的基础命令（不含输入输出参数）"""
+        if self.conda_env:
+            cmd = [
+                'conda', 'run', '-n', self.conda_env, '--no-capture-output',
+                'python', str(self.script_path)
+            ]
+        elif self.python_path:
+            cmd = [self.python_path, str(self.script_path)]
+        else:
+            cmd = ['python', str(self.script_path)]
+        
+        cmd.extend([
+            '--model-name', self.model_name,
+            '--device', f'cuda:{gpu_id}',  # 指定GPU
+            '--dtype', self.dtype,
+            '--batch-size', str(self.batch_size),
+            '--max-new-tokens', str(self.max_new_tokens),
+        ])
+        
+        if self.use_batch_inference:
+            cmd.append('--use-batch-inference')
+        if not self.reuse_image_prefix:
+            cmd.append('--no-prefix-reuse')
+        if not self.stop_at_score:
+            cmd.append('--no-score-stop')
+        cmd.extend(['--prefetch-batches', str(self.prefetch_batches)])
+        if self.min_pixels:
+            cmd.extend(['--min-pixels', str(self.min_pixels)])
+        if self.max_pixels:
+            cmd.extend(['--max-pixels', str(self.max_pixels)])
+        return cmd
+    
+    def _ensure_workers(self, offloaded: bool = False):
+        """
+        启动（或重启）常驻worker，所有GPU并行加载模型
+        
+        Args:
+            offloaded: 模型只加载到CPU内存（后台预热用，评分前由load_to_gpu移到GPU）
+        """
+        with self._workers_lock:
+            if not self.workers:
+                extra_args = ['--serve'] + (['--start-offloaded'] if offloaded else [])
+                self.workers = [ScorerWorker(gpu_id, self._build_command(gpu_id) + extra_args)
+                                for gpu_id in self.device_ids]
+                atexit.register(self.close)
+            
+            to_start = [w for w in self.workers if not w.alive]
+            if to_start:
+                self._start_workers(to_start)
+                # 以--start-offloaded启动的worker（包括关闭后重启的）模型在CPU上
+                if '--start-offloaded' in to_start[0].cmd:
+                    self._workers_offloaded = True
+            
+            # 预热启动的worker在第一次评分前移到GPU
+            if not offloaded and self._workers_offloaded:
+                self._broadcast("load")
+                self._workers_offloaded = False
+    
+    def _start_workers(self, to_start: List[ScorerWorker]):
+        """并行启动worker，全部失败时抛出异常"""
+        self.logger.info(f"Starting {len(to_start)} persistent scorer workers...")
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=len(to_start)) as executor:
+            futures = {executor.submit(w.start, self.startup_timeout): w for w in to_start}
+            for future in as_completed(futures):
+                worker = futures[future]
+                try:
+                    future.result()
+                    self.logger.info(f"  GPU {worker.gpu_id}: scorer ready")
+                except Exception as e:
+                    self.logger.error(f"  GPU {worker.gpu_id}: failed to start scorer: {e}")
+                    worker.close()
+        
+        if not any(w.alive for w in self.workers):
+            raise RuntimeError("No scorer worker could be started")
+        self.logger.info(f"Scorer workers ready in {time.time() - start_time:.1f}s")
+    
+    def prefetch(self):
+        """
+        阶段1编辑期间在后台预热评分模型（不占用显存）
+        
+        host_memory：提前启动常驻worker，模型加载到CPU内存，换入时只需移到GPU；
+        page_cache：把本地权重文件顺序读入页缓存，worker启动时直接命中缓存
+        """
+        if self.prefetch_mode == "host_memory" and self.persistent_workers:
+            self._ensure_workers(offloaded=True)
+        elif self.prefetch_mode in ("page_cache", "host_memory"):
+            files = model_weight_files(self.model_name)
+            if not files:
+                self.logger.info(f"Prefetch skipped: no local weight files under {self.model_name}")
+                return
+            stats = prefetch_files(files)
+            self.logger.info(f"Prefetched {stats['files']} weight files "
+                             f"({stats['bytes'] / 1024 ** 3:.1f} GB) in {stats['seconds']:.1f}s")
+    
+    def add_progress_callback(self, callback: Callable[[int, Dict], None]) -> None:
+        """
+        注册进度回调 callback(gpu_id, event)
+        
+        event为子进程的结构化进度事件（loaded、score、batch，见qwen3_vl_utils.ProgressChannel）；
+        常驻模式下每个完成的任务产生一个score事件。回调在读取线程中调用，应尽快返回
+        """
+        self.progress_callbacks.append(callback)
+    
+    def _encode_task(self, image: Image.Image, task: Dict) -> Dict:
+        """按像素预算缩放编辑图，按transport_format编码后放入任务"""
+        image = fit_pixel_budget(image, self.min_pixels, self.max_pixels)
+        return {**encode_transport_image(image, self.transport_format, self.transport_compress_level), **task}
+    
+    def _encode_tasks(self, executor: Optional[ThreadPoolExecutor], images: List[Image.Image],
+                      tasks: List[Dict]) -> List[Any]:
+        """
+        把编辑图编码进任务
+        
+        有线程池时按索引顺序提交（PIL编码期间释放GIL，多线程并行），返回Future列表，
+        评分端用_resolve_task等待单个任务，先编码完的任务先发出；否则在调用线程中同步编码。
+        从第一个提交到最后一个完成记录为一个encode span
+        """
+        start_ns = time.perf_counter_ns()
+        remaining = {"count": len(tasks)}
+        lock = threading.Lock()
+        
+        def encode(image, task):
+            try:
+                return self._encode_task(image, task)
+            finally:
+                with lock:
+                    remaining["count"] -= 1
+                    if remaining["count"] == 0:
+                        get_tracer().add_span("encode", start_ns, time.perf_counter_ns(), cat="reward",
+                                              num_images=len(tasks), format=self.transport_format)
+        
+        if executor is None:
+            return [encode(image, task) for image, task in zip(images, tasks)]
+        return [executor.submit(encode, image, task) for image, task in zip(images, tasks)]
+    
+    @staticmethod
+    def _resolve_task(task: Any) -> Dict:
+        """等待任务的图像编码完成（编码失败时抛出编码异常）"""
+        return task.result() if isinstance(task, Future) else task
     
-    def _call_subprocess_single_gpu(self, tasks: List[Dict], gpu_id: int) -> List[float]:
+    def _call_subprocess_single_gpu(self,
+                                    tasks: List[Dict],
+                                    gpu_id: int,
+                                    on_event: Optional[Callable[[int, Dict], None]] = None) -> List[float]:
         """
         在指定GPU上调用子进程进行评分
         
+        stream_tasks为true时任务经stdin以JSON lines逐行传入、结果逐条写入输出文件（--stream），
+        子进程收到第一块任务即开始评分，异常退出时已写出的结果可以回收；否则使用输入/输出JSON文件。
+        进度事件经专用管道（--progress-fd）以JSON lines传回，由读取线程阻塞读取并交给on_event；
+        stdout和stderr由后台线程持续读取，避免管道写满导致死锁
+        
         Args:
             tasks: 评分任务列表
             gpu_id: 使用的GPU ID
+            on_event: 进度事件回调 on_event(gpu_id, event)（可选）
             
         Returns:
             分数列表
         """
         if not tasks:
             return []
+        start_ns = time.perf_counter_ns()
         
-        # 创建临时文件
-        input_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
-        output_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
+        # 创建临时文件（流式模式下任务经stdin逐行写入，不需要输入文件）
+        input_file = None
+        output_file = tempfile.NamedTemporaryFile(mode='w', suffix='.jsonl' if self.stream_tasks else '.json',
+                                                  delete=False)
+        output_file.close()
         
         try:
-            # 写入输入数据
-            input_data = {'tasks': tasks}
-            json.dump(input_data, input_file)
-            input_file.close()
-            output_file.close()
-            
-            # 构建命令
-            if self.conda_env:
-                cmd = [
-                    'conda', 'run', '-n', self.conda_env, '--no-capture-output',
-                    'python', str(self.script_path)
-                ]
-            elif self.python_path:
-                cmd = [self.python_path, str(self.script_path)]
+            if self.stream_tasks:
+                io_args = ['--stream', '--output', output_file.name]
             else:
-                cmd = ['python', str(self.script_path)]
+                input_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
+                json.dump({'tasks': [self._resolve_task(t) for t in tasks]}, input_file)
+                input_file.close()
+                io_args = ['--input', input_file.name, '--output', output_file.name]
             
-            # 添加参数（指定GPU）
-            cmd.extend([
-                '--input', input_file.name,
-                '--output', output_file.name,
-                '--model-name', self.model_name,
-                '--device', f'cuda:{gpu_id}',  # 指定GPU
-                '--dtype', self.dtype,
-                '--batch-size', str(self.batch_size),
-                '--max-new-tokens', str(self.max_new_tokens),
-            ])
+            # 进度管道：写端传给子进程，父进程只保留读端
+            progress_read, progress_write = os.pipe()
+            cmd = self._build_command(gpu_id) + io_args + ['--progress-fd', str(progress_write)]
+            try:
+                process = subprocess.Popen(
+                    cmd,
+                    stdin=subprocess.PIPE if self.stream_tasks else subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    pass_fds=(progress_write,)
+                )
+            except Exception:
+                os.close(progress_read)
+                raise
+            finally:
+                os.close(progress_write)
             
-            if self.use_batch_inference:
-                cmd.append('--use-batch-inference')
+            # 按顺序流式收到的分数（子进程崩溃、没有写出输出文件时用于回收）
+            streamed = []
+            stderr_tail = deque(maxlen=20)
+            last_event = {"time": None}
             
-            # 执行子进程（使用Popen实时捕获输出）
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            def read_progress():
+                with os.fdopen(progress_read, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            event = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        last_event["time"] = time.monotonic()
+                        if event.get("event") == "score" and event.get("index") == len(streamed):
+                            streamed.append(event.get("score"))
+                        if on_event is not None:
+                            on_event(gpu_id, event)
             
-            # 实时打印stderr（包含评分进度）
-            stderr_output = []
-            while True:
-                stderr_line = process.stderr.readline()
-                if stderr_line:
-                    # 添加GPU标识
-                    print(f"[GPU {gpu_id}] {stderr_line.rstrip()}")
-                    stderr_output.append(stderr_line)
-                elif process.poll() is not None:
-                    break
+            def read_log(stream, tail=None):
+                for line in stream:
+                    line = line.rstrip()
+                    if tail is not None:
+                        tail.append(line)
+                    self.logger.debug(f"[GPU {gpu_id}] {line}")
             
-            # 获取剩余输出
-            remaining_stderr = process.stderr.read()
-            if remaining_stderr:
-                for line in remaining_stderr.split('\n'):
-                    if line.strip():
-                        print(f"[GPU {gpu_id}] {line}")
-                stderr_output.append(remaining_stderr)
+            encode_error = []
             
-            # 等待进程完成
-            return_code = process.wait(timeout=self.timeout)
+            def write_tasks():
+                """
+                逐行写入任务（每个任务的图像编码完成即写出）；管道写满时阻塞，
+                子进程按块读取，双方内存都不随任务数增长
+                """
+                try:
+                    for task in tasks:
+                        process.stdin.write(json.dumps(self._resolve_task(task), ensure_ascii=False) + '\n')
+                except (BrokenPipeError, OSError, ValueError):
+                    return  # 子进程已退出，由返回码和输出文件判断结果
+                except Exception as e:
+                    # 编码失败：只发出之前的任务，之后的任务作为失败的部分重新分配
+                    encode_error.append(e)
+                try:
+                    process.stdin.close()
+                except (BrokenPipeError, OSError):
+                    pass
             
-            # 检查返回码
-            if return_code != 0:
-                stderr_text = ''.join(stderr_output)
-                raise RuntimeError(f"GPU {gpu_id} subprocess failed: {stderr_text}")
+            threads = [
+                threading.Thread(target=read_progress, daemon=True),
+                threading.Thread(target=read_log, args=(process.stdout,), daemon=True),
+                threading.Thread(target=read_log, args=(process.stderr, stderr_tail), daemon=True),
+            ]
+            if self.stream_tasks:
+                threads.append(threading.Thread(target=write_tasks, daemon=True))
+            for thread in threads:
+                thread.start()
+            
+            # 卡住检测：进度事件或输出文件增长（conda run下进度管道可能没有传给子进程）都算作进展；
+            # 有过进展后超过timeout没有新进展、或启动后超过startup_timeout仍没有任何进展时终止子进程，
+            # 之后回收已完成的结果
+            started = time.monotonic()
+            last_output = {"size": 0, "time": None}
+            while True:
+                try:
+                    return_code = process.wait(timeout=min(self.timeout, STALL_POLL_INTERVAL))
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                try:
+                    size = os.path.getsize(output_file.name)
+                except OSError:
+                    size = 0
+                if size != last_output["size"]:
+                    last_output.update(size=size, time=time.monotonic())
+                activity = [t for t in (last_event["time"], last_output["time"]) if t is not None]
+                if activity:
+                    idle, limit = time.monotonic() - max(activity), self.timeout
+                else:
+                    idle, limit = time.monotonic() - started, self.startup_timeout
+                if idle > limit and process.poll() is None:
+                    self.logger.error(f"GPU {gpu_id} subprocess made no progress for {limit}s, killing it")
+                    process.kill()
+            for thread in threads:
+                thread.join()
             
-            # 读取输出
-            with open(output_file.name, 'r') as f:
-                output_data = json.load(f)
+            # 读取输出（失败时输出中可能包含已完成的部分分数）
+            if self.stream_tasks:
+                output_data = read_stream_results(output_file.name)
+            else:
+                try:
+                    with open(output_file.name, 'r') as f:
+                        output_data = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    output_data = {}
             
-            if output_data.get('status') != 'success':
-                raise RuntimeError(f"GPU {gpu_id} error: {output_data.get('error', 'Unknown')}")
+            if encode_error and return_code == 0:
+                return_code, output_data = None, {**output_data, 'status': 'error',
+                                                  'error': f"Image encoding failed: {encode_error[0]}"}
+            if return_code != 0 or output_data.get('status') != 'success':
+                error = output_data.get('error') or '\n'.join(stderr_tail)
+                partial = output_data.get('scores', [])
+                raise ScoringShardError(
+                    f"GPU {gpu_id} subprocess failed (code {return_code}): {error}",
+                    partial if len(partial) >= len(streamed) else streamed
+                )
             
             return output_data['scores']
         
         finally:
             # 清理临时文件
-            Path(input_file.name).unlink(missing_ok=True)
+            if input_file is not None:
+                Path(input_file.name).unlink(missing_ok=True)
             Path(output_file.name).unlink(missing_ok=True)
+            get_tracer().add_span("subprocess", start_ns, time.perf_counter_ns(),
+                                  cat="ipc", gpu=gpu_id, num_tasks=len(tasks))
     
     def score(self, *args, **kwargs) -> float:
         """评分单张图像（不建议使用，建议使用batch_score）"""
@@ -207,82 +662,332 @@ class Qwen3VLMultiGPUSubprocessRewardModel(BaseRewardModel):
             edit_instructions: 编辑指令列表
             system_prompts: 系统提示列表
             user_prompts: 用户提示列表
-            original_images: 原始图像列表（可选）
+            original_images: 原始图像列表（可选，compare_with_original时使用）
+            **kwargs: 其他参数
+                - on_result: 回调函数 on_result(index, score)，每个任务完成时调用
+                - original_image_b64s: 原图的base64（可选，避免重新编码原图）
             
         Returns:
-            分数列表
+            分数列表（重试后仍无法评分的任务为None，索引记录在last_failed_indices）
         """
         n = len(edited_images)
         self.logger.info(f"Multi-GPU batch scoring {n} images across {self.num_gpus} GPUs...")
         
-        # 编码所有图像为base64
-        self.logger.info(f"Encoding images to base64...")
-        start_time = time.time()
-        image_b64s = [self._encode_image(img) for img in edited_images]
-        encode_time = time.time() - start_time
-        self.logger.info(f"Encoding completed in {encode_time:.2f}s")
+        original_refs = self._original_refs(n, original_images, kwargs.get("original_image_b64s"))
         
-        # 准备所有任务
+        # 准备所有任务（编辑图在_score_tasks中并行编码）
         all_tasks = []
         for i in range(n):
             task = {
-                'image_b64': image_b64s[i],
                 'system_prompt': system_prompts[i],
                 'user_prompt': user_prompts[i],
             }
+            if original_refs[i]:
+                task['original_ref'] = original_refs[i]
             all_tasks.append(task)
         
-        # 按GPU分配任务
-        gpu_tasks = [[] for _ in range(self.num_gpus)]
-        for i, task in enumerate(all_tasks):
-            gpu_idx = i % self.num_gpus
-            gpu_tasks[gpu_idx].append((i, task))  # 保存原始索引
-        
-        # 显示任务分配
-        self.logger.info(f"Task allocation across {self.num_gpus} GPUs:")
-        for gpu_idx, gpu_id in enumerate(self.device_ids):
-            num_tasks = len(gpu_tasks[gpu_idx])
-            self.logger.info(f"  GPU {gpu_id}: {num_tasks} tasks")
-        
-        # 并行执行
-        scores = [0.0] * n  # 预分配结果列表
-        
-        with ThreadPoolExecutor(max_workers=self.num_gpus) as executor:
-            futures = []
-            for gpu_idx, gpu_id in enumerate(self.device_ids):
-                if gpu_tasks[gpu_idx]:
-                    # 提取任务（不包含索引）
-                    tasks_for_gpu = [task for _, task in gpu_tasks[gpu_idx]]
-                    indices_for_gpu = [idx for idx, _ in gpu_tasks[gpu_idx]]
+        return self._score_tasks(edited_images, all_tasks, kwargs.get("on_result"))
+    
+    def batch_score_multi(self,
+                          edited_images: List[Image.Image],
+                          original_descriptions: List[str],
+                          edit_instructions: List[str],
+                          rubric_prompts: List[List[Dict[str, str]]],
+                          original_images: Optional[List[Image.Image]] = None,
+                          **kwargs) -> List[Optional[List[float]]]:
+        """
+        多维度批量评分（多GPU并行）：每张图像只传输、编码一次，子进程内各维度复用图像前缀
+        
+        Args:
+            edited_images: 编辑后的图像列表
+            original_descriptions: 原始图像描述列表
+            edit_instructions: 编辑指令列表
+            rubric_prompts: 每个样本的维度prompt列表（见BaseRewardModel.batch_score_multi）
+            original_images: 原始图像列表（可选）
+            **kwargs: 其他参数
+                - on_result: 回调函数 on_result(index, scores)
+                - original_image_b64s: 原图的base64（可选，避免重新编码原图）
+            
+        Returns:
+            分数向量列表（无法评分的样本为None）
+        """
+        n = len(edited_images)
+        self.logger.info(f"Multi-GPU multi-rubric scoring {n} images across {self.num_gpus} GPUs...")
+        
+        original_refs = self._original_refs(n, original_images, kwargs.get("original_image_b64s"))
+        all_tasks = []
+        for rubrics, original_ref in zip(rubric_prompts, original_refs):
+            task = {'rubrics': rubrics}
+            if original_ref:
+                task['original_ref'] = original_ref
+            all_tasks.append(task)
+        return self._score_tasks(edited_images, all_tasks, kwargs.get("on_result"))
+    
+    def _original_refs(self,
+                       n: int,
+                       original_images: Optional[list],
+                       original_image_b64s: Optional[list]) -> List[Optional[str]]:
+        """
+        对比模式下获取原图的缓存文件路径
+        
+        原图按内容哈希写入original_cache_dir，每张只写一次（跨batch、类别和运行复用），
+        任务中只传递路径；优先使用数据集中已有的base64，避免重新编码
+        """
+        if self.original_store is None or (original_images is None and original_image_b64s is None):
+            return [None] * n
+        return self.original_store.refs(original_images, original_image_b64s)
+    
+    def _score_tasks(self,
+                     edited_images: List[Image.Image],
+                     all_tasks: List[Dict],
+                     on_result: Optional[Callable[[int, Any], None]] = None) -> List[Any]:
+        """
+        编码编辑图并将任务分发到各GPU评分，记录无法评分的任务
+        
+        编码在encode_workers个线程中进行，与评分流水线重叠：非常驻模式下子进程立即启动
+        （加载模型期间继续编码），常驻模式下各GPU领取的块编码完成即发出
+        """
+        encoder = ThreadPoolExecutor(max_workers=self.encode_workers, thread_name_prefix="ImageEncoder") \
+            if self.encode_workers > 0 else None
+        try:
+            all_tasks = self._encode_tasks(encoder, edited_images, all_tasks)
+            with get_tracer().span("score", cat="reward", num_tasks=len(all_tasks)):
+                if self.persistent_workers:
+                    scores = self._batch_score_persistent(all_tasks, on_result)
+                else:
+                    scores = self._batch_score_sharded(all_tasks, on_result)
+        finally:
+            if encoder is not None:
+                encoder.shutdown(wait=True, cancel_futures=True)
+        
+        self.last_failed_indices = [i for i, score in enumerate(scores) if score is None]
+        if self.last_failed_indices:
+            self.logger.error(f"{len(self.last_failed_indices)} tasks could not be scored: {self.last_failed_indices}")
+        
+        self.logger.info(f"Multi-GPU scoring completed!")
+        return scores
+    
+    def _batch_score_sharded(self,
+                             all_tasks: List[Dict],
+                             on_result: Optional[Callable[[int, Any], None]] = None) -> List[Optional[float]]:
+        """
+        每次调用为每个GPU启动一个子进程评分（非常驻模式）
+        
+        失败GPU上已完成的部分分数会被回收，其余任务重新分配给本轮成功的GPU，
+        最多重试max_task_retries轮。各子进程的进度事件汇总为一个进度条，
+        每个样本的分数一到达即触发on_result
+        
+        Args:
+            all_tasks: 所有评分任务
+            on_result: 每个任务完成时的回调 on_result(index, score)
+            
+        Returns:
+            分数列表（无法评分的任务为None）
+        """
+        n = len(all_tasks)
+        scores = [None] * n
+        healthy_gpus = list(self.device_ids)
+        pending = list(range(n))
+        progress = ScoringProgress(n, self.progress_callbacks)
+        reported = set()
+        
+        def shard_listener(indices: List[int]):
+            """把子进程中的任务序号映射回全局索引"""
+            def on_event(gpu_id: int, event: Dict):
+                if event.get("event") == "score" and 0 <= event.get("index", -1) < len(indices):
+                    global_index = indices[event["index"]]
+                    if global_index in reported:
+                        return
+                    reported.add(global_index)
+                    if on_result is not None:
+                        on_result(global_index, event.get("score"))
+                    event = {**event, "index": global_index}
+                progress.handle(gpu_id, event)
+            return on_event
+        
+        for attempt in range(self.max_task_retries + 1):
+            if not pending or not healthy_gpus:
+                break
+            
+            # 按GPU轮询分配任务
+            shards = {gpu_id: pending[k::len(healthy_gpus)] for k, gpu_id in enumerate(healthy_gpus)}
+            self.logger.info(f"Task allocation across {len(healthy_gpus)} GPUs (round {attempt + 1}):")
+            for gpu_id, indices in shards.items():
+                self.logger.info(f"  GPU {gpu_id}: {len(indices)} tasks")
+            
+            pending = []
+            with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+                futures = {
+                    executor.submit(self._call_subprocess_single_gpu, [all_tasks[i] for i in indices], gpu_id,
+                                    shard_listener(indices)):
+                        (gpu_id, indices)
+                    for gpu_id, indices in shards.items() if indices
+                }
+                
+                # 收集结果
+                for future in as_completed(futures):
+                    gpu_id, indices = futures[future]
+                    try:
+                        partial, error = future.result(), None
+                    except ScoringShardError as e:
+                        partial, error = e.partial_scores, e
+                    except Exception as e:
+                        partial, error = [], e
                     
-                    future = executor.submit(
-                        self._call_subprocess_single_gpu,
-                        tasks_for_gpu,
-                        gpu_id
-                    )
-                    futures.append((future, indices_for_gpu))
+                    # 将结果放回正确的位置（未经进度管道到达的分数在此补发回调）
+                    on_event = shard_listener(indices)
+                    for k, (idx, score) in enumerate(zip(indices, partial)):
+                        scores[idx] = score
+                        if idx not in reported:
+                            on_event(gpu_id, {"event": "score", "index": k, "score": score})
+                    
+                    if error is not None:
+                        self.logger.error(f"Error in GPU {gpu_id} worker: {error}")
+                        self.logger.warning(f"  Salvaged {min(len(partial), len(indices))}/{len(indices)} "
+                                            f"scores from GPU {gpu_id}")
+                        pending.extend(indices[len(partial):])
+                        healthy_gpus.remove(gpu_id)
             
-            # 收集结果
-            for future, indices in futures:
+            pending.sort()
+            if pending and healthy_gpus and attempt < self.max_task_retries:
+                self.logger.warning(f"Re-queueing {len(pending)} failed tasks to healthy GPUs {healthy_gpus}")
+        
+        progress.close()
+        self.logger.info("Tasks completed per GPU: " +
+                         ", ".join(f"GPU {g}={c}" for g, c in sorted(progress.per_gpu.items())))
+        return scores
+    
+    def _batch_score_persistent(self,
+                                all_tasks: List[Dict],
+                                on_result: Optional[Callable[[int, float], None]] = None) -> List[Optional[float]]:
+        """
+        使用常驻worker评分：任务按batch_size切块放入共享队列，各GPU空闲时领取下一块
+        
+        快的GPU自然承担更多任务；每块完成后立即写回结果并触发回调。
+        失败的块拆成单个任务重新入队，优先由未尝试过它的GPU领取，最多重试max_task_retries次；
+        子进程已退出的worker不再领取任务
+        
+        Args:
+            all_tasks: 所有评分任务
+            on_result: 每个任务完成时的回调 on_result(index, score)
+            
+        Returns:
+            分数列表（无法评分的任务为None）
+        """
+        self._ensure_workers()
+        n = len(all_tasks)
+        scores = [None] * n
+        
+        # 待处理的块：(任务索引, 已尝试次数, 已尝试过的GPU)
+        pending = [(list(range(start, min(start + self.batch_size, n))), 0, set())
+                   for start in range(0, n, self.batch_size)]
+        state = {"outstanding": len(pending)}
+        healthy = {w.gpu_id for w in self.workers if w.alive}
+        cond = threading.Condition()
+        
+        progress = ScoringProgress(n, self.progress_callbacks)
+        
+        def take_chunk(gpu_id: int):
+            """领取一个块：优先选本GPU未尝试过的；所有健康GPU都试过时也允许重复"""
+            for k, (indices, attempts, tried) in enumerate(pending):
+                if gpu_id not in tried or healthy <= tried:
+                    return pending.pop(k)
+            return None
+        
+        def finish_chunk(indices: List[int]):
+            state["outstanding"] -= 1
+            cond.notify_all()
+        
+        def worker_loop(worker: ScorerWorker) -> int:
+            completed = 0
+            while True:
+                with cond:
+                    chunk = take_chunk(worker.gpu_id)
+                    while chunk is None and state["outstanding"] > 0:
+                        cond.wait()
+                        chunk = take_chunk(worker.gpu_id)
+                    if chunk is None:
+                        return completed
+                indices, attempts, tried = chunk
+                
                 try:
-                    gpu_scores = future.result()
-                    # 将结果放回正确的位置
-                    for idx, score in zip(indices, gpu_scores):
-                        scores[idx] = score
+                    tasks = [self._resolve_task(all_tasks[i]) for i in indices]
+                    response = worker.request("score", self.timeout, tasks=tasks)
                 except Exception as e:
-                    self.logger.error(f"Error in GPU worker: {e}")
-                    # 对失败的任务使用默认分数
-                    for idx in indices:
-                        scores[idx] = 5.0
+                    self.logger.error(f"Error in GPU {worker.gpu_id} worker: {e}")
+                    exited = not worker.alive
+                    with cond:
+                        if exited:
+                            healthy.discard(worker.gpu_id)
+                        if attempts < self.max_task_retries and healthy:
+                            # 拆成单个任务重新入队，避免一个坏样本拖累整块
+                            for i in indices:
+                                pending.append(([i], attempts + 1, tried | {worker.gpu_id}))
+                            state["outstanding"] += len(indices) - 1
+                            cond.notify_all()
+                        else:
+                            finish_chunk(indices)
+                        
+                        # 没有健康worker时，剩余任务全部放弃
+                        if not healthy:
+                            while pending:
+                                finish_chunk(pending.pop()[0])
+                    if exited:
+                        return completed
+                    continue
+                
+                for i, score in zip(indices, response["scores"]):
+                    scores[i] = score
+                    if on_result is not None:
+                        on_result(i, score)
+                    progress.handle(worker.gpu_id, {"event": "score", "index": i, "score": score})
+                completed += len(indices)
+                with cond:
+                    finish_chunk(indices)
         
-        self.logger.info(f"Multi-GPU scoring completed!")
+        alive_workers = [w for w in self.workers if w.alive]
+        with ThreadPoolExecutor(max_workers=len(alive_workers)) as executor:
+            futures = {executor.submit(worker_loop, w): w for w in alive_workers}
+            per_gpu = {futures[f].gpu_id: f.result() for f in as_completed(futures)}
+        progress.close()
+        
+        self.logger.info("Tasks completed per GPU: " +
+                         ", ".join(f"GPU {g}={c}" for g, c in sorted(per_gpu.items())))
         return scores
     
     def load_to_gpu(self):
-        """加载到GPU（多进程模式下不需要）"""
-        self.logger.info("Multi-GPU subprocess mode: models are loaded on-demand")
+        """将常驻worker的模型移回GPU（非常驻模式下模型按需加载）"""
+        if not self.persistent_workers or not any(w.alive for w in self.workers):
+            self.logger.info("Multi-GPU subprocess mode: models are loaded on-demand")
+            return
+        self._broadcast("load")
+        self._workers_offloaded = False
     
     def unload_from_gpu(self):
-        """从GPU卸载（多进程模式下不需要）"""
-        self.logger.info("Multi-GPU subprocess mode: models are automatically unloaded")
+        """释放常驻worker占用的显存（移到CPU内存或关闭进程）"""
+        if not self.persistent_workers or not any(w.alive for w in self.workers):
+            self.logger.info("Multi-GPU subprocess mode: models are automatically unloaded")
+            return
+        if self.offload_mode == "shutdown":
+            self.close()
+        else:
+            self._broadcast("offload")
+            self._workers_offloaded = True
+    
+    def _broadcast(self, cmd: str):
+        """向所有存活的worker并行发送命令"""
+        alive_workers = [w for w in self.workers if w.alive]
+        self.logger.info(f"Sending '{cmd}' to {len(alive_workers)} scorer workers...")
+        with ThreadPoolExecutor(max_workers=len(alive_workers)) as executor:
+            futures = {executor.submit(w.request, cmd, self.startup_timeout): w for w in alive_workers}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.logger.error(f"GPU {futures[future].gpu_id} failed to {cmd}: {e}")
+    
+    def close(self):
+        """关闭所有常驻worker"""
+        for worker in self.workers:
+            worker.close()
 
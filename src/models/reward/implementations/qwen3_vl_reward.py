@@ -12,6 +12,9 @@ from typing import Any, Dict, Optional
 import io
 
 from ..base_reward import BaseRewardModel
+from ....utils import get_tracer
+from ..qwen3_vl_utils import (COMPARE_IMAGE_LABELS, DEFAULT_RUBRIC_SYSTEM_PROMPT, BatchPrefetcher, clone_processor,
+                              fit_pixel_budget, generate_rubric_responses, score_stopping_criteria)
 
 
 class Qwen3VLRewardModel(BaseRewardModel):
@@ -33,6 +36,16 @@ class Qwen3VLRewardModel(BaseRewardModel):
         self.dtype = self.config.get("dtype", "bfloat16")
         self.max_new_tokens = self.config.get("max_new_tokens", 128)
         self.use_flash_attention = self.config.get("use_flash_attention", False)
+        # 多维度评分：图像前缀只prefill一次，各维度复用KV cache
+        self.reuse_image_prefix = self.config.get("reuse_image_prefix", True)
+        self.rubric_system_prompt = self.config.get("rubric_system_prompt", DEFAULT_RUBRIC_SYSTEM_PROMPT)
+        # 回复中出现完整分数后即停止生成（batch中所有样本都给出分数时整个batch结束）
+        self.stop_at_score = self.config.get("stop_at_score", True)
+        # 后台线程提前准备的batch数（图像预处理与生成重叠，0表示按顺序执行）
+        self.prefetch_batches = self.config.get("prefetch_batches", 2)
+        # 视觉token预算：评分前按像素数缩放图像（None表示不限制）
+        self.min_pixels = self.config.get("min_pixels", None)
+        self.max_pixels = self.config.get("max_pixels", None)
         
         print(f"[Qwen3VLRewardModel] 正在加载模型: {self.model_name}")
         print(f"[Qwen3VLRewardModel] 设备: {self.device}, 数据类型: {self.dtype}")
@@ -68,6 +81,8 @@ class Qwen3VLRewardModel(BaseRewardModel):
         # 加载processor
         print("[Qwen3VLRewardModel] 正在加载 Processor...")
         self.processor = AutoProcessor.from_pretrained(self.model_name)
+        # BatchPrefetcher后台线程使用的独立副本（tokenizer不能与主线程并发使用）
+        self.prefetch_processor = clone_processor(self.processor, padding_side="left")
         
         print("[Qwen3VLRewardModel] 初始化完成")
     
@@ -94,16 +109,14 @@ class Qwen3VLRewardModel(BaseRewardModel):
         Returns:
             评分（0-10的浮点数）
         """
-        # 确保图像是RGB格式
-        if edited_image.mode != 'RGB':
-            edited_image = edited_image.convert('RGB')
+        # 确保图像是RGB格式，并按像素预算缩放
+        edited_image = self._prepare_image(edited_image)
         
         # 构建messages
         # 根据是否需要原图来决定消息格式
-        if original_image is not None and kwargs.get("compare_with_original", False):
+        if original_image is not None and kwargs.get("compare_with_original", self.config.get("compare_with_original", False)):
             # 如果需要对比原图
-            if original_image.mode != 'RGB':
-                original_image = original_image.convert('RGB')
+            original_image = self._prepare_image(original_image)
             
             messages = [
                 {
@@ -113,9 +126,9 @@ class Qwen3VLRewardModel(BaseRewardModel):
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": "Original image:"},
+                        {"type": "text", "text": COMPARE_IMAGE_LABELS[0]},
                         {"type": "image", "image": original_image},
-                        {"type": "text", "text": "Edited image:"},
+                        {"type": "text", "text": COMPARE_IMAGE_LABELS[1]},
                         {"type": "image", "image": edited_image},
                         {"type": "text", "text": user_prompt},
                     ],
@@ -151,7 +164,8 @@ class Qwen3VLRewardModel(BaseRewardModel):
         max_tokens = kwargs.get("max_new_tokens", self.max_new_tokens)
         
         with torch.inference_mode():
-            generated_ids = self.model.generate(**inputs, max_new_tokens=max_tokens)
+            generated_ids = self.model.generate(**inputs, max_new_tokens=max_tokens,
+                                                stopping_criteria=self._stopping_criteria(inputs))
             generated_ids_trimmed = [
                 out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
             ]
@@ -167,6 +181,12 @@ class Qwen3VLRewardModel(BaseRewardModel):
         
         return score
     
+    def _stopping_criteria(self, inputs):
+        """出现完整分数即停止（stop_at_score为false时为None，生成到EOS或max_new_tokens）"""
+        if not self.stop_at_score:
+            return None
+        return score_stopping_criteria(self.processor, inputs["input_ids"].shape[1])
+    
     def _extract_score_from_response(self, response: str) -> float:
         """
         从模型响应中提取分数
@@ -256,86 +276,150 @@ class Qwen3VLRewardModel(BaseRewardModel):
         batch_size = kwargs.get("batch_size", 4)
         print(f"[Qwen3VLRewardModel] Batch scoring {n} images with batch_size={batch_size}")
         
-        # 设置padding_side为left（Qwen官方推荐用于batch generation）
-        original_padding_side = self.processor.tokenizer.padding_side
-        self.processor.tokenizer.padding_side = 'left'
-        
         all_scores = []
+        compare = kwargs.get("compare_with_original", self.config.get("compare_with_original", False))
+        max_tokens = kwargs.get("max_new_tokens", self.max_new_tokens)
+        
+        def prepare(batch_indices):
+            """构建batch messages并完成processor预处理（在后台线程中执行）"""
+            batch_messages = [
+                self._build_messages(edited_images[i], system_prompts[i], user_prompts[i],
+                                     original_images[i], compare)
+                for i in batch_indices
+            ]
+            # 后台线程使用processor副本，其padding_side为left（Qwen官方推荐用于batch generation）
+            return self.prefetch_processor.apply_chat_template(
+                batch_messages,
+                tokenize=True,
+                add_generation_prompt=True,
+                return_dict=True,
+                return_tensors="pt",
+                padding=True  # 关键：batch inference需要padding
+            )
         
-        try:
-            # 分批处理
-            for batch_start in range(0, n, batch_size):
-                batch_end = min(batch_start + batch_size, n)
-                batch_indices = range(batch_start, batch_end)
+        # 下一个batch的CPU预处理与当前batch的生成重叠
+        prefetcher = BatchPrefetcher(
+            prepare,
+            [range(start, min(start + batch_size, n)) for start in range(0, n, batch_size)],
+            depth=self.prefetch_batches
+        )
+        
+        for batch_indices, inputs, error in prefetcher:
+            batch_start, batch_end = batch_indices.start, batch_indices.stop
+            
+            # Batch推理
+            try:
+                if error is not None:
+                    raise error
+                inputs = inputs.to(self.model.device, non_blocking=True)
                 
-                # 构建batch messages
-                batch_messages = []
-                for i in batch_indices:
-                    messages = self._build_messages(
-                        edited_images[i],
-                        system_prompts[i],
-                        user_prompts[i],
-                        original_images[i],
-                        kwargs.get("compare_with_original", False)
+                with torch.inference_mode(), get_tracer().span("score_batch", cat="reward",
+                                                               batch_size=len(batch_indices)):
+                    generated_ids = self.model.generate(**inputs, max_new_tokens=max_tokens,
+                                                        stopping_criteria=self._stopping_criteria(inputs))
+                    generated_ids_trimmed = [
+                        out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
+                    ]
+                    output_texts = self.processor.batch_decode(
+                        generated_ids_trimmed,
+                        skip_special_tokens=True,
+                        clean_up_tokenization_spaces=False
                     )
-                    batch_messages.append(messages)
                 
-                # Batch推理
-                try:
-                    # 准备输入（添加padding参数）
-                    inputs = self.processor.apply_chat_template(
-                        batch_messages,
-                        tokenize=True,
-                        add_generation_prompt=True,
-                        return_dict=True,
-                        return_tensors="pt",
-                        padding=True  # 关键：batch inference需要padding
-                    )
-                    inputs = inputs.to(self.model.device)
-                    
-                    # 生成输出
-                    max_tokens = kwargs.get("max_new_tokens", self.max_new_tokens)
-                    
-                    with torch.inference_mode():
-                        generated_ids = self.model.generate(**inputs, max_new_tokens=max_tokens)
-                        generated_ids_trimmed = [
-                            out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-                        ]
-                        output_texts = self.processor.batch_decode(
-                            generated_ids_trimmed,
-                            skip_special_tokens=True,
-                            clean_up_tokenization_spaces=False
+                # 解析分数
+                batch_scores = [self._extract_score_from_response(text) for text in output_texts]
+                all_scores.extend(batch_scores)
+                
+                print(f"[Qwen3VLRewardModel] Processed batch {batch_start}-{batch_end-1}: avg_score={sum(batch_scores)/len(batch_scores):.3f}")
+                
+            except Exception as e:
+                print(f"[Qwen3VLRewardModel] Error in batch {batch_start}-{batch_end-1}: {e}")
+                print(f"[Qwen3VLRewardModel] Falling back to sequential processing for this batch...")
+                # 等待后台预处理完成，逐个处理期间不与其并发
+                prefetcher.drain()
+                # 回退到逐个处理这个batch
+                for i in batch_indices:
+                    try:
+                        score = self.score(
+                            edited_image=edited_images[i],
+                            original_description=original_descriptions[i],
+                            edit_instruction=edit_instructions[i],
+                            system_prompt=system_prompts[i],
+                            user_prompt=user_prompts[i],
+                            original_image=original_images[i],
+                            **kwargs
                         )
-                    
-                    # 解析分数
-                    batch_scores = [self._extract_score_from_response(text) for text in output_texts]
-                    all_scores.extend(batch_scores)
-                    
-                    print(f"[Qwen3VLRewardModel] Processed batch {batch_start}-{batch_end-1}: avg_score={sum(batch_scores)/len(batch_scores):.3f}")
-                    
-                except Exception as e:
-                    print(f"[Qwen3VLRewardModel] Error in batch {batch_start}-{batch_end-1}: {e}")
-                    print(f"[Qwen3VLRewardModel] Falling back to sequential processing for this batch...")
-                    # 回退到逐个处理这个batch
-                    for i in batch_indices:
-                        try:
-                            score = self.score(
-                                edited_image=edited_images[i],
-                                original_description=original_descriptions[i],
-                                edit_instruction=edit_instructions[i],
-                                system_prompt=system_prompts[i],
-                                user_prompt=user_prompts[i],
-                                original_image=original_images[i],
-                                **kwargs
-                            )
-                            all_scores.append(score)
-                        except Exception as e2:
-                            print(f"[Qwen3VLRewardModel] Error scoring image {i}: {e2}")
-                            all_scores.append(5.0)  # 默认分数
-        
-        finally:
-            # 恢复原始padding_side
-            self.processor.tokenizer.padding_side = original_padding_side
+                        all_scores.append(score)
+                    except Exception as e2:
+                        print(f"[Qwen3VLRewardModel] Error scoring image {i}: {e2}")
+                        all_scores.append(5.0)  # 默认分数
+        
+        stats = prefetcher.summary()
+        print(f"[Qwen3VLRewardModel] Preprocessing {stats['prepare_seconds']:.1f}s, generation waited "
+              f"{stats['wait_seconds']:.1f}s (GPU idle time recovered: {stats['recovered_seconds']:.1f}s)")
+        return all_scores
+    
+    def batch_score_multi(self,
+                          edited_images: list,
+                          original_descriptions: list,
+                          edit_instructions: list,
+                          rubric_prompts: list,
+                          original_images: Optional[list] = None,
+                          **kwargs) -> list:
+        """
+        多维度批量评分（每个样本的图像只编码一次）
+        
+        各维度的评分要求放在图像之后，图像部分的token前缀对所有维度相同：
+        图像只预处理、prefill一次，各维度共享前缀的KV cache，在一次batch generate中生成
+        
+        Args:
+            edited_images: 编辑后的图像列表
+            original_descriptions: 原始图像描述列表
+            edit_instructions: 编辑指令列表
+            rubric_prompts: 每个样本的维度prompt列表（见BaseRewardModel.batch_score_multi）
+            original_images: 原始图像列表（可选）
+            **kwargs: 其他参数
+                - compare_with_original: 是否同时输入原图对比
+                - max_new_tokens: 最大生成token数
+            
+        Returns:
+            分数向量列表（评分失败的样本对应的向量元素为None）
+        """
+        n = len(edited_images)
+        if original_images is None:
+            original_images = [None] * n
+        
+        compare = kwargs.get("compare_with_original", self.config.get("compare_with_original", False))
+        max_tokens = kwargs.get("max_new_tokens", self.max_new_tokens)
+        print(f"[Qwen3VLRewardModel] Multi-rubric scoring {n} images x {len(rubric_prompts[0]) if n else 0} rubrics "
+              f"(reuse_image_prefix={self.reuse_image_prefix})")
+        
+        all_scores = []
+        for i in range(n):
+            images = [self._prepare_image(edited_images[i])]
+            labels = None
+            if compare and original_images[i] is not None:
+                images = [self._prepare_image(original_images[i])] + images
+                labels = COMPARE_IMAGE_LABELS
+            
+            try:
+                with get_tracer().span("score_batch", cat="reward", batch_size=1,
+                                       num_rubrics=len(rubric_prompts[i])):
+                    responses = generate_rubric_responses(
+                        self.model,
+                        self.processor,
+                        images,
+                        rubric_prompts[i],
+                        max_new_tokens=max_tokens,
+                        system_prompt=self.rubric_system_prompt,
+                        image_labels=labels,
+                        reuse_prefix=self.reuse_image_prefix,
+                        stop_at_score=self.stop_at_score
+                    )
+                all_scores.append([self._extract_score_from_response(text) for text in responses])
+            except Exception as e:
+                print(f"[Qwen3VLRewardModel] Error scoring image {i} on multiple rubrics: {e}")
+                all_scores.append([None] * len(rubric_prompts[i]))
         
         return all_scores
     
@@ -354,14 +438,12 @@ class Qwen3VLRewardModel(BaseRewardModel):
         Returns:
             messages列表
         """
-        # 确保图像是RGB格式
-        if edited_image.mode != 'RGB':
-            edited_image = edited_image.convert('RGB')
+        # 确保图像是RGB格式，并按像素预算缩放
+        edited_image = self._prepare_image(edited_image)
         
         if original_image is not None and compare_with_original:
             # 如果需要对比原图
-            if original_image.mode != 'RGB':
-                original_image = original_image.convert('RGB')
+            original_image = self._prepare_image(original_image)
             
             messages = [
                 {
@@ -371,9 +453,9 @@ class Qwen3VLRewardModel(BaseRewardModel):
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": "Original image:"},
+                        {"type": "text", "text": COMPARE_IMAGE_LABELS[0]},
                         {"type": "image", "image": original_image},
-                        {"type": "text", "text": "Edited image:"},
+                        {"type": "text", "text": COMPARE_IMAGE_LABELS[1]},
                         {"type": "image", "image": edited_image},
                         {"type": "text", "text": user_prompt},
                     ],
@@ -397,6 +479,12 @@ class Qwen3VLRewardModel(BaseRewardModel):
         
         return messages
     
+    def _prepare_image(self, image: Image.Image) -> Image.Image:
+        """转换为RGB并按min_pixels/max_pixels缩放（控制视觉token数）"""
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return fit_pixel_budget(image, self.min_pixels, self.max_pixels)
+    
     def _batch_score_sequential(self,
                                 edited_images: list,
                                 original_descriptions: list,
@@ -419,15 +507,16 @@ class Qwen3VLRewardModel(BaseRewardModel):
         
         for i in range(n):
             try:
-                score = self.score(
-                    edited_image=edited_images[i],
-                    original_description=original_descriptions[i],
-                    edit_instruction=edit_instructions[i],
-                    system_prompt=system_prompts[i],
-                    user_prompt=user_prompts[i],
-                    original_image=original_images[i] if original_images else None,
-                    **kwargs
-                )
+                with get_tracer().span("score_batch", cat="reward", batch_size=1):
+                    score = self.score(
+                        edited_image=edited_images[i],
+                        original_description=original_descriptions[i],
+                        edit_instruction=edit_instructions[i],
+                        system_prompt=system_prompts[i],
+                        user_prompt=user_prompts[i],
+                        original_image=original_images[i] if original_images else None,
+                        **kwargs
+                    )
                 scores.append(score)
             except Exception as e:
                 print(f"[Qwen3VLRewardModel] Error scoring image {i}: {e}")
@@ -14,7 +14,8 @@ from io import BytesIO
 from PIL import Image
 
 from ..base_reward import BaseRewardModel
-from ....utils import setup_logger
+from ..qwen3_vl_utils import fit_pixel_budget
+from ....utils import ImageContentStore, get_tracer, model_weight_files, prefetch_files, setup_logger
 
 
 class Qwen3VLSubprocessRewardModel(BaseRewardModel):
@@ -35,12 +36,28 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
         self.max_new_tokens = config.get("max_new_tokens", 128)
         self.batch_size = config.get("batch_size", 4)
         self.use_batch_inference = config.get("use_batch_inference", True)
+        self.reuse_image_prefix = config.get("reuse_image_prefix", True)  # 多维度评分时复用图像前缀
+        self.stop_at_score = config.get("stop_at_score", True)  # 出现完整分数后即停止生成
+        self.prefetch_batches = config.get("prefetch_batches", 2)  # 提前准备的batch数（预处理与生成重叠）
+
+        # 视觉token预算：编辑图在父进程中缩放后再传输（同时减小IPC数据量），原图由子进程按同样的预算缩放
+        self.min_pixels = config.get("min_pixels", None)
+        self.max_pixels = config.get("max_pixels", None)
+
+        # 对比模式：同时输入原图，原图按内容哈希缓存在磁盘上，任务中只传递路径
+        self.compare_with_original = config.get("compare_with_original", False)
+        self.original_store = None
+        if self.compare_with_original:
+            self.original_store = ImageContentStore(config.get("original_cache_dir", "outputs/original_cache"))
         
         # 子进程相关配置
         self.python_path = config.get("python_path", None)  # 新环境的python路径
         self.conda_env = config.get("conda_env", None)      # 或者conda环境名
         self.script_path = config.get("script_path", None)  # standalone脚本路径
         
+        # 阶段1编辑期间把权重文件读入页缓存（page_cache或none），子进程加载时直接命中缓存
+        self.prefetch_mode = config.get("prefetch", "page_cache")
+        
         # 调用父类初始化（会调用_initialize）
         super().__init__(config)
     
@@ -78,12 +95,27 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
             return ["python"]
     
     def _encode_image_to_base64(self, image: Image.Image) -> str:
-        """将PIL图像编码为base64"""
+        """将PIL图像编码为base64（先按像素预算缩放）"""
+        image = fit_pixel_budget(image, self.min_pixels, self.max_pixels)
         buffered = BytesIO()
         image.save(buffered, format="PNG")
         img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
         return img_str
     
+    def _original_refs(self,
+                       n: int,
+                       original_images: Optional[list],
+                       original_image_b64s: Optional[list]) -> List[Optional[str]]:
+        """
+        对比模式下获取原图的缓存文件路径
+        
+        原图按内容哈希写入original_cache_dir，每张只写一次（跨batch、类别和运行复用），
+        任务中只传递路径；优先使用数据集中已有的base64，避免重新编码
+        """
+        if self.original_store is None or (original_images is None and original_image_b64s is None):
+            return [None] * n
+        return self.original_store.refs(original_images, original_image_b64s)
+    
     def _call_subprocess(self, input_data: Dict, timeout: int = 600) -> Dict:
         """
         调用子进程执行评分
@@ -95,6 +127,7 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
         Returns:
             输出数据（包含scores列表）
         """
+        start_ns = time.perf_counter_ns()
         with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f_in:
             input_file = f_in.name
             json.dump(input_data, f_in, ensure_ascii=False)
@@ -118,6 +151,15 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
             
             if self.use_batch_inference:
                 cmd.append('--use-batch-inference')
+            if not self.reuse_image_prefix:
+                cmd.append('--no-prefix-reuse')
+            if not self.stop_at_score:
+                cmd.append('--no-score-stop')
+            cmd.extend(['--prefetch-batches', str(self.prefetch_batches)])
+            if self.min_pixels:
+                cmd.extend(['--min-pixels', str(self.min_pixels)])
+            if self.max_pixels:
+                cmd.extend(['--max-pixels', str(self.max_pixels)])
             
             self.logger.info(f"Calling subprocess: {' '.join(cmd[:5])}...")
             
@@ -125,27 +167,17 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
             start_time = time.time()
             process = subprocess.Popen(
                 cmd,
+                stdin=subprocess.DEVNULL,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stderr=subprocess.STDOUT,  # 合并为一个管道，逐行阻塞读取，不会因某个管道写满而死锁
                 text=True
             )
             
-            # 实时打印stderr（包含评分进度）
+            # 实时打印子进程输出（包含评分进度）
             stderr_output = []
-            while True:
-                stderr_line = process.stderr.readline()
-                if stderr_line:
-                    # 打印评分进度
-                    print(stderr_line.rstrip())
-                    stderr_output.append(stderr_line)
-                elif process.poll() is not None:
-                    break
-            
-            # 获取剩余输出
-            remaining_stderr = process.stderr.read()
-            if remaining_stderr:
-                print(remaining_stderr.rstrip())
-                stderr_output.append(remaining_stderr)
+            for line in process.stdout:
+                print(line.rstrip())
+                stderr_output.append(line)
             
             # 等待进程完成
             return_code = process.wait(timeout=timeout)
@@ -172,6 +204,8 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
             # 清理临时文件
             Path(input_file).unlink(missing_ok=True)
             Path(output_file).unlink(missing_ok=True)
+            get_tracer().add_span("subprocess", start_ns, time.perf_counter_ns(),
+                                  cat="ipc", num_tasks=len(input_data.get('tasks', [])))
     
     def score(self,
              edited_image: Image.Image,
@@ -190,22 +224,24 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
             edit_instruction: 编辑指令
             system_prompt: 系统提示
             user_prompt: 用户提示
-            original_image: 原始图像（可选，当前未使用）
+            original_image: 原始图像（可选，compare_with_original时使用）
             
         Returns:
             评分
         """
         # 编码图像
         image_b64 = self._encode_image_to_base64(edited_image)
+        original_ref = self._original_refs(1, [original_image], None)[0]
         
         # 构建输入数据
-        input_data = {
-            'tasks': [{
-                'image_b64': image_b64,
-                'system_prompt': system_prompt,
-                'user_prompt': user_prompt
-            }]
+        task = {
+            'image_b64': image_b64,
+            'system_prompt': system_prompt,
+            'user_prompt': user_prompt
         }
+        if original_ref:
+            task['original_ref'] = original_ref
+        input_data = {'tasks': [task]}
         
         # 调用子进程
         output_data = self._call_subprocess(input_data)
@@ -231,7 +267,9 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
             edit_instructions: 编辑指令列表
             system_prompts: 系统prompt列表
             user_prompts: 用户prompt列表
-            original_images: 原始图像列表（可选）
+            original_images: 原始图像列表（可选，compare_with_original时使用）
+            **kwargs: 其他参数
+                - original_image_b64s: 原图的base64（可选，避免重新编码原图）
             
         Returns:
             评分列表
@@ -245,7 +283,9 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
         
         # 编码所有图像
         self.logger.info("Encoding images to base64...")
-        images_b64 = [self._encode_image_to_base64(img) for img in edited_images]
+        with get_tracer().span("encode", cat="reward", num_images=n):
+            images_b64 = [self._encode_image_to_base64(img) for img in edited_images]
+        original_refs = self._original_refs(n, original_images, kwargs.get("original_image_b64s"))
         
         # 构建输入数据
         tasks = []
@@ -255,6 +295,8 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
                 'system_prompt': system_prompts[i],
                 'user_prompt': user_prompts[i]
             }
+            if original_refs[i]:
+                task['original_ref'] = original_refs[i]
             tasks.append(task)
         
         input_data = {'tasks': tasks}
@@ -270,6 +312,56 @@ class Qwen3VLSubprocessRewardModel(BaseRewardModel):
         
         return scores[:n]
     
+    def batch_score_multi(self,
+                          edited_images: list,
+                          original_descriptions: list,
+                          edit_instructions: list,
+                          rubric_prompts: list,
+                          original_images: Optional[list] = None,
+                          **kwargs) -> list:
+        """
+        多维度批量评分（每张图像只传输一次，子进程内各维度复用图像前缀）
+        
+        Args:
+            edited_images: 编辑后的图像列表
+            original_descriptions: 原始图像描述列表
+            edit_instructions: 编辑指令列表
+            rubric_prompts: 每个样本的维度prompt列表（见BaseRewardModel.batch_score_multi）
+            original_images: 原始图像列表（可选）
+            
+        Returns:
+            分数向量列表
+        """
+        n = len(edited_images)
+        self.logger.info(f"Multi-rubric scoring {n} images via subprocess...")
+        
+        original_refs = self._original_refs(n, original_images, kwargs.get("original_image_b64s"))
+        tasks = []
+        for img, rubrics, original_ref in zip(edited_images, rubric_prompts, original_refs):
+            task = {'image_b64': self._encode_image_to_base64(img), 'rubrics': rubrics}
+            if original_ref:
+                task['original_ref'] = original_ref
+            tasks.append(task)
+        output_data = self._call_subprocess({'tasks': tasks}, timeout=1800)
+        
+        scores = output_data.get('scores', [])
+        if len(scores) != n:
+            self.logger.warning(f"Expected {n} score vectors, got {len(scores)}")
+            scores = scores + [None] * (n - len(scores))
+        return scores[:n]
+    
+    def prefetch(self):
+        """把本地权重文件读入页缓存（每次调用子进程都重新加载模型，缓存命中时加载更快）"""
+        if self.prefetch_mode == "none":
+            return
+        files = model_weight_files(self.model_name)
+        if not files:
+            self.logger.info(f"Prefetch skipped: no local weight files under {self.model_name}")
+            return
+        stats = prefetch_files(files)
+        self.logger.info(f"Prefetched {stats['files']} weight files "
+                         f"({stats['bytes'] / 1024 ** 3:.1f} GB) in {stats['seconds']:.1f}s")
+    
     def unload_from_gpu(self):
         """卸载模型（子进程模式下无需操作）"""
         self.logger.info("[Qwen3VLSubprocess] No need to unload (subprocess mode)")
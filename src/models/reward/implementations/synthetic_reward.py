@@ -0,0 +1,116 @@
+"""
+Synthetic reward model
+合成负载评分模型（桩模型，不需要GPU）
+
+按batch模拟评分耗时，按失败率模拟评分失败，用多个线程模拟多GPU；
+transport为base64时按子进程模型的方式编码图像，以计入IPC数据准备的开销。
+需要测量真实的子进程IPC时，使用Qwen3VLMultiGPUSubprocessRewardModel并将script_path
+指向synthetic_standalone.py（见tools/bench_synthetic_load.py --reward ipc）。
+"""
+
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from PIL import Image
+
+from ..base_reward import BaseRewardModel
+from ...simulation import SimulatedLoad
+from ....utils import encode_image_to_base64, get_tracer
+
+
+def synthetic_score(key: str) -> float:
+    """由样本内容确定的伪分数（5-9），多次运行一致"""
+    return 5.0 + 4.0 * zlib.crc32(key.encode("utf-8")) / 2 ** 32
+
+
+class SyntheticRewardModel(BaseRewardModel):
+    """
+    合成负载评分模型
+
+    配置项：
+        device_ids: 模拟的GPU列表（每个GPU一个线程），默认[0]
+        batch_size: 每个batch的图像数
+        latency: 每张图像的评分延迟（秒，或{distribution, mean, std}）
+        batch_overhead: 每个batch的固定延迟（秒，或{distribution, mean, std}）
+        swap_latency: 模型加载/卸载的延迟（秒）
+        failure_rate: 评分失败率（按user_prompt哈希决定，多次运行一致）
+        memory_mb: 模拟模型占用的内存
+        transport: none（直接传递PIL图像）或base64（模拟子进程传输前的编码）
+        seed: 随机种子
+    """
+
+    def _initialize(self):
+        """初始化模拟负载"""
+        self.device_ids = self.config.get("device_ids", [0])
+        self.batch_size = self.config.get("batch_size", 4)
+        self.transport = self.config.get("transport", "none")
+        self.load = SimulatedLoad(self.config)
+        self.overhead = SimulatedLoad(self.config, latency_key="batch_overhead")
+        self.swap = SimulatedLoad(self.config, latency_key="swap_latency")
+        print(f"[SyntheticRewardModel] {len(self.device_ids)} simulated GPUs, "
+              f"latency={self.load.distribution}({self.load.mean}s), "
+              f"failure_rate={self.load.failure_rate}, transport={self.transport}")
+
+    def score(self,
+              edited_image: Image.Image,
+              original_description: str,
+              edit_instruction: str,
+              system_prompt: str,
+              user_prompt: str,
+              original_image: Optional[Image.Image] = None,
+              **kwargs) -> Optional[float]:
+        """模拟单张图像评分（失败时返回None）"""
+        self._encode([edited_image])
+        return self._score_batch([user_prompt], 1)[0]
+
+    def _encode(self, images: List[Image.Image]) -> None:
+        """transport为base64时编码图像（与子进程模型传输前的编码开销相同）"""
+        if self.transport == "base64":
+            for image in images:
+                encode_image_to_base64(image)
+
+    def _score_batch(self, user_prompts: List[str], num_images: int) -> List[Optional[float]]:
+        """模拟一个batch的模型推理"""
+        self.overhead.wait()
+        self.load.wait(num_images)
+        return [None if self.load.fails(prompt) else synthetic_score(prompt) for prompt in user_prompts]
+
+    def batch_score(self,
+                   edited_images: list,
+                   original_descriptions: list,
+                   edit_instructions: list,
+                   system_prompts: list,
+                   user_prompts: list,
+                   original_images: Optional[list] = None,
+                   **kwargs) -> List[Optional[float]]:
+        """
+        按batch分发到各模拟GPU评分，结果按原顺序返回
+        """
+        n = len(edited_images)
+        batch_size = kwargs.get("batch_size", self.batch_size)
+        batches = [list(range(start, min(start + batch_size, n))) for start in range(0, n, batch_size)]
+        tracer = get_tracer()
+        scores: List[Optional[float]] = [None] * n
+
+        def score_on_gpu(slot: int) -> None:
+            gpu_id = self.device_ids[slot]
+            for indices in batches[slot::len(self.device_ids)]:
+                with tracer.span("encode", cat="reward", gpu=gpu_id, num_images=len(indices)):
+                    self._encode([edited_images[i] for i in indices])
+                with tracer.span("score_batch", cat="reward", gpu=gpu_id, batch_size=len(indices)):
+                    batch_scores = self._score_batch([user_prompts[i] for i in indices], len(indices))
+                for i, score in zip(indices, batch_scores):
+                    scores[i] = score
+
+        with ThreadPoolExecutor(max_workers=len(self.device_ids)) as executor:
+            list(executor.map(score_on_gpu, range(len(self.device_ids))))
+        self.last_failed_indices = [i for i, score in enumerate(scores) if score is None]
+        return scores
+
+    def unload_from_gpu(self):
+        """模拟卸载耗时"""
+        self.swap.wait()
+
+    def load_to_gpu(self):
+        """模拟加载耗时"""
+        self.swap.wait()
@@ -5,15 +5,17 @@ Qwen3-VL Standalone评分脚本
 
 使用方法：
     python qwen3_vl_standalone.py --input input.json --output output.json
+    python qwen3_vl_standalone.py --serve --device cuda:0   # 常驻服务模式（stdin/stdout JSON lines）
+    python qwen3_vl_standalone.py --stream --output results.jsonl < tasks.jsonl   # 流式单次模式
 """
 
 import argparse
 import json
-import base64
+import functools
+import os
 import sys
 from pathlib import Path
-from io import BytesIO
-from typing import List, Dict
+from typing import List, Dict, Optional
 import re
 
 # 在新环境中导入Qwen3-VL
@@ -26,11 +28,23 @@ except ImportError as e:
     print("Please install: pip install transformers pillow torch", file=sys.stderr, flush=True)
     sys.exit(1)
 
+# 公共评分工具与本脚本位于同一目录（脚本方式运行，不能使用相对导入）
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from qwen3_vl_utils import (COMPARE_IMAGE_LABELS, BatchPrefetcher, ProgressChannel, StreamedResults,
+                            build_messages, clone_processor, decode_transport_image, fit_pixel_budget,
+                            generate_rubric_responses, read_task_chunks, score_stopping_criteria)
+
+# 原图LRU缓存大小（同一张原图在多个类别/维度中复用，常驻模式下跨请求保留）
+ORIGINAL_CACHE_SIZE = 64
+
 
 class Qwen3VLStandaloneScorer:
     """独立的Qwen3-VL评分器"""
     
-    def __init__(self, model_name: str, device: str = "auto", dtype: str = "bfloat16"):
+    def __init__(self, model_name: str, device: str = "auto", dtype: str = "bfloat16",
+                 reuse_prefix: bool = True, min_pixels: Optional[int] = None,
+                 max_pixels: Optional[int] = None, start_offloaded: bool = False,
+                 stop_at_score: bool = True, prefetch_batches: int = 2):
         """
         初始化模型
         
@@ -38,7 +52,20 @@ class Qwen3VLStandaloneScorer:
             model_name: 模型名称或路径
             device: 设备（auto, cuda, cpu）
             dtype: 数据类型
+            reuse_prefix: 多维度评分时是否复用图像前缀的KV cache
+            min_pixels: 图像最小像素数（可选，视觉token预算）
+            max_pixels: 图像最大像素数（可选，视觉token预算）
+            start_offloaded: 先把模型加载到CPU内存，收到load命令时再移到device（后台预热用）
+            stop_at_score: 回复中出现完整分数后即停止生成
+            prefetch_batches: 后台线程提前准备的batch数（0表示按顺序预处理和生成）
         """
+        self.reuse_prefix = reuse_prefix
+        self.stop_at_score = stop_at_score
+        self.prefetch_batches = prefetch_batches
+        # 结构化进度事件（单次模式下由main设置为--progress-fd指定的管道）
+        self.progress = ProgressChannel()
+        self.min_pixels = min_pixels
+        self.max_pixels = max_pixels
         print(f"[Qwen3VL-Standalone] Loading model: {model_name}", file=sys.stderr, flush=True)
         
         # 解析dtype
@@ -55,22 +82,75 @@ class Qwen3VLStandaloneScorer:
         self.model = AutoModelForImageTextToText.from_pretrained(
             model_name,
             torch_dtype=torch_dtype,
-            device_map=device
+            device_map='cpu' if start_offloaded else device
         )
         
         # 加载processor
         self.processor = AutoProcessor.from_pretrained(model_name)
+        # BatchPrefetcher后台线程使用的独立副本（tokenizer不能与主线程并发使用）
+        self.prefetch_processor = clone_processor(self.processor, padding_side="left")
         
-        self.device = next(self.model.parameters()).device
-        print(f"[Qwen3VL-Standalone] Model loaded on device: {self.device}", file=sys.stderr, flush=True)
+        if start_offloaded:
+            # 目标设备保留给load()
+            self.device = torch.device('cuda' if device == 'auto' else device)
+            print(f"[Qwen3VL-Standalone] Model loaded on CPU (target: {self.device})", file=sys.stderr, flush=True)
+        else:
+            self.device = next(self.model.parameters()).device
+            print(f"[Qwen3VL-Standalone] Model loaded on device: {self.device}", file=sys.stderr, flush=True)
+    
+    def offload(self):
+        """将模型移到CPU内存（常驻模式下类别之间释放显存，避免重新加载权重）"""
+        if self.device.type == 'cpu':
+            return
+        device_map = getattr(self.model, 'hf_device_map', None) or {}
+        if len(set(device_map.values())) > 1:
+            # 跨多卡切分的模型无法整体移回单个设备，保持原状
+            print(f"[Qwen3VL-Standalone] Model is sharded across devices, skip offload", file=sys.stderr, flush=True)
+            return
+        self.model.to('cpu')
+        torch.cuda.empty_cache()
+        print(f"[Qwen3VL-Standalone] Model offloaded to CPU", file=sys.stderr, flush=True)
+    
+    def load(self):
+        """将模型从CPU内存移回GPU"""
+        if next(self.model.parameters()).device == self.device:
+            return
+        self.model.to(self.device)
+        print(f"[Qwen3VL-Standalone] Model loaded back to {self.device}", file=sys.stderr, flush=True)
     
-    def decode_base64_image(self, base64_str: str) -> Image.Image:
-        """解码base64图像"""
-        image_data = base64.b64decode(base64_str)
-        image = Image.open(BytesIO(image_data))
+    def decode_task_image(self, task: Dict) -> Image.Image:
+        """解码任务中的编辑图（png/webp/raw，按像素预算缩放，父进程已缩放过时不做任何处理）"""
+        return fit_pixel_budget(decode_transport_image(task), self.min_pixels, self.max_pixels)
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=ORIGINAL_CACHE_SIZE)
+    def load_image_ref(path: str, min_pixels: Optional[int] = None,
+                       max_pixels: Optional[int] = None) -> Image.Image:
+        """按路径读取原图（父进程按内容哈希写入的缓存文件）并按像素预算缩放，带LRU缓存"""
+        image = Image.open(path)
+        image.load()
         if image.mode != 'RGB':
             image = image.convert('RGB')
-        return image
+        return fit_pixel_budget(image, min_pixels, max_pixels)
+    
+    def task_images(self, task: Dict):
+        """
+        解码任务中的图像
+        
+        Returns:
+            (图像列表, 图像说明文字)；任务带original_ref时为[原图, 编辑图]的对比模式
+        """
+        edited = self.decode_task_image(task)
+        if task.get('original_ref'):
+            original = self.load_image_ref(task['original_ref'], self.min_pixels, self.max_pixels)
+            return [original, edited], COMPARE_IMAGE_LABELS
+        return [edited], None
+    
+    def _stopping_criteria(self, inputs):
+        """出现完整分数即停止（--no-score-stop时为None，生成到EOS或max_new_tokens）"""
+        if not self.stop_at_score:
+            return None
+        return score_stopping_criteria(self.processor, inputs["input_ids"].shape[1])
     
     def extract_score(self, response: str) -> float:
         """从响应中提取分数"""
@@ -109,7 +189,8 @@ class Qwen3VLStandaloneScorer:
         return 5.0
     
     def score_single(self, image_b64: str, system_prompt: str, 
-                    user_prompt: str, max_new_tokens: int = 128) -> float:
+                    user_prompt: str, max_new_tokens: int = 128,
+                    original_ref: Optional[str] = None) -> float:
         """
         评分单张图像
         
@@ -118,27 +199,14 @@ class Qwen3VLStandaloneScorer:
             system_prompt: 系统提示
             user_prompt: 用户提示
             max_new_tokens: 最大生成token数
+            original_ref: 原图缓存文件路径（可选，提供时与原图对比评分）
             
         Returns:
             评分
         """
-        # 解码图像
-        image = self.decode_base64_image(image_b64)
-        
-        # 构建messages
-        messages = [
-            {
-                "role": "system",
-                "content": [{"type": "text", "text": system_prompt}]
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": image},
-                    {"type": "text", "text": user_prompt}
-                ]
-            }
-        ]
+        # 解码图像并构建messages
+        images, labels = self.task_images({'image_b64': image_b64, 'original_ref': original_ref})
+        messages = build_messages(images, system_prompt, user_prompt, labels)
         
         # 准备输入
         inputs = self.processor.apply_chat_template(
@@ -152,7 +220,8 @@ class Qwen3VLStandaloneScorer:
         
         # 生成
         with torch.inference_mode():
-            generated_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens)
+            generated_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens,
+                                                stopping_criteria=self._stopping_criteria(inputs))
             generated_ids_trimmed = [
                 out_ids[len(in_ids):] 
                 for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
@@ -167,33 +236,74 @@ class Qwen3VLStandaloneScorer:
         score = self.extract_score(output_text)
         return score
     
+    def score_rubrics(self, task: Dict, max_new_tokens: int = 128) -> List[float]:
+        """
+        按多个评分维度评分同一张图像（图像前缀只prefill一次）
+        
+        Args:
+            task: 任务，包含 image_b64 和 rubrics（[{system_prompt, user_prompt}, ...]），可选 original_ref
+            max_new_tokens: 最大生成token数
+            
+        Returns:
+            每个维度的评分
+        """
+        images, labels = self.task_images(task)
+        responses = generate_rubric_responses(
+            self.model,
+            self.processor,
+            images,
+            task['rubrics'],
+            max_new_tokens=max_new_tokens,
+            image_labels=labels,
+            reuse_prefix=self.reuse_prefix,
+            stop_at_score=self.stop_at_score
+        )
+        return [self.extract_score(text) for text in responses]
+    
     def score_batch(self, tasks: List[Dict], batch_size: int = 4, 
-                   max_new_tokens: int = 128, use_batch_inference: bool = True) -> List[float]:
+                   max_new_tokens: int = 128, use_batch_inference: bool = True,
+                   results: Optional[List[float]] = None) -> List[float]:
         """
         批量评分
         
         Args:
             tasks: 任务列表，每个任务包含 image_b64, system_prompt, user_prompt
+                   （可选 original_ref：原图缓存文件路径，提供时与原图对比评分）
+                   （多维度任务包含 image_b64, rubrics，对应的结果为分数列表）
             batch_size: 批处理大小
             max_new_tokens: 最大生成token数
             use_batch_inference: 是否使用batch inference
+            results: 可选的结果列表，分数边计算边追加（出错时调用方仍能拿到已完成的部分）
             
         Returns:
             评分列表
         """
         n = len(tasks)
+        # 进度事件中的任务序号（流式模式下results已包含之前各块的结果）
+        offset = len(results) if results is not None else 0
+        
+        if any('rubrics' in task for task in tasks):
+            # 多维度评分：逐个样本处理，样本内各维度复用图像前缀
+            scores = results if results is not None else []
+            for i, task in enumerate(tasks):
+                scores.append(self.score_rubrics(task, max_new_tokens))
+                self.progress.emit("score", index=offset + i, score=scores[-1])
+                print(f"[Progress] {i+1}/{n} scored ({len(task['rubrics'])} rubrics)", file=sys.stderr, flush=True)
+            return scores
         
         if not use_batch_inference or batch_size == 1:
             # 串行处理
-            scores = []
+            scores = results if results is not None else []
             for i, task in enumerate(tasks):
                 score = self.score_single(
                     task['image_b64'],
                     task['system_prompt'],
                     task['user_prompt'],
-                    max_new_tokens
+                    max_new_tokens,
+                    original_ref=task.get('original_ref')
                 )
                 scores.append(score)
+                self.progress.emit("score", index=offset + i, score=score)
                 print(f"[Progress] {i+1}/{n} scored", file=sys.stderr, flush=True)
             return scores
         
@@ -201,11 +311,7 @@ class Qwen3VLStandaloneScorer:
         print(f"[Qwen3VL-Standalone] Batch scoring {n} images with batch_size={batch_size}", 
               file=sys.stderr, flush=True)
         
-        # 设置padding_side
-        original_padding_side = self.processor.tokenizer.padding_side
-        self.processor.tokenizer.padding_side = 'left'
-        
-        all_scores = []
+        all_scores = results if results is not None else []
         
         # 打印评分开始信息
         print(f"\n{'='*70}", file=sys.stderr, flush=True)
@@ -214,79 +320,75 @@ class Qwen3VLStandaloneScorer:
         print(f"  Total batches: {(n + batch_size - 1) // batch_size}", file=sys.stderr, flush=True)
         print(f"{'='*70}\n", file=sys.stderr, flush=True)
         
-        try:
-            # 分批处理
-            for batch_start in range(0, n, batch_size):
-                batch_end = min(batch_start + batch_size, n)
-                batch_tasks = tasks[batch_start:batch_end]
-                
-                # 解码图像
-                images = [self.decode_base64_image(t['image_b64']) for t in batch_tasks]
-                
-                # 构建batch messages
-                batch_messages = []
-                for task, image in zip(batch_tasks, images):
-                    messages = [
-                        {
-                            "role": "system",
-                            "content": [{"type": "text", "text": task['system_prompt']}]
-                        },
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "image", "image": image},
-                                {"type": "text", "text": task['user_prompt']}
-                            ]
-                        }
-                    ]
-                    batch_messages.append(messages)
-                
-                # 准备输入
-                inputs = self.processor.apply_chat_template(
-                    batch_messages,
-                    tokenize=True,
-                    add_generation_prompt=True,
-                    return_dict=True,
-                    return_tensors="pt",
-                    padding=True
+        def prepare(batch_tasks):
+            """解码图像、构建batch messages并完成processor预处理（在后台线程中执行）"""
+            batch_messages = []
+            for task in batch_tasks:
+                images, labels = self.task_images(task)
+                batch_messages.append(build_messages(images, task['system_prompt'], task['user_prompt'], labels))
+            return self.prefetch_processor.apply_chat_template(
+                batch_messages,
+                tokenize=True,
+                add_generation_prompt=True,
+                return_dict=True,
+                return_tensors="pt",
+                padding=True
+            )
+        
+        # 下一个batch的CPU预处理与当前batch的生成重叠
+        prefetcher = BatchPrefetcher(
+            prepare,
+            [tasks[start:start + batch_size] for start in range(0, n, batch_size)],
+            depth=self.prefetch_batches
+        )
+        
+        # 分批处理
+        for batch_index, (batch_tasks, inputs, error) in enumerate(prefetcher):
+            if error is not None:
+                raise error
+            batch_start = batch_index * batch_size
+            batch_end = batch_start + len(batch_tasks)
+            inputs = inputs.to(self.model.device, non_blocking=True)
+            
+            # 生成
+            with torch.inference_mode():
+                generated_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens,
+                                                    stopping_criteria=self._stopping_criteria(inputs))
+                generated_ids_trimmed = [
+                    out_ids[len(in_ids):] 
+                    for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
+                ]
+                output_texts = self.processor.batch_decode(
+                    generated_ids_trimmed,
+                    skip_special_tokens=True,
+                    clean_up_tokenization_spaces=False
                 )
-                inputs = inputs.to(self.model.device)
-                
-                # 生成
-                with torch.inference_mode():
-                    generated_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens)
-                    generated_ids_trimmed = [
-                        out_ids[len(in_ids):] 
-                        for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-                    ]
-                    output_texts = self.processor.batch_decode(
-                        generated_ids_trimmed,
-                        skip_special_tokens=True,
-                        clean_up_tokenization_spaces=False
-                    )
-                
-                # 提取分数并打印详细信息
-                batch_scores = []
-                for i, (text, task) in enumerate(zip(output_texts, batch_tasks)):
-                    score = self.extract_score(text)
-                    batch_scores.append(score)
-                    
-                    # 打印每个样本的详细信息
-                    global_idx = batch_start + i
-                    print(f"  [Sample {global_idx:3d}] Score: {score:.2f} | Response: {text[:80]}...", 
-                          file=sys.stderr, flush=True)
-                
-                all_scores.extend(batch_scores)
+            
+            # 提取分数并打印详细信息
+            batch_scores = []
+            for i, (text, task) in enumerate(zip(output_texts, batch_tasks)):
+                score = self.extract_score(text)
+                batch_scores.append(score)
                 
-                # 打印批次统计
-                avg_score = sum(batch_scores) / len(batch_scores)
-                print(f"[Batch {batch_start//batch_size + 1}] Images {batch_start}-{batch_end-1} done, "
-                      f"avg_score={avg_score:.3f}", 
+                # 打印每个样本的详细信息
+                global_idx = batch_start + i
+                self.progress.emit("score", index=offset + global_idx, score=score)
+                print(f"  [Sample {global_idx:3d}] Score: {score:.2f} | Response: {text[:80]}...", 
                       file=sys.stderr, flush=True)
-        
-        finally:
-            # 恢复padding_side
-            self.processor.tokenizer.padding_side = original_padding_side
+            
+            all_scores.extend(batch_scores)
+            self.progress.emit("batch", done=offset + batch_end, total=offset + n)
+            
+            # 打印批次统计
+            avg_score = sum(batch_scores) / len(batch_scores)
+            print(f"[Batch {batch_start//batch_size + 1}] Images {batch_start}-{batch_end-1} done, "
+                  f"avg_score={avg_score:.3f}", 
+                  file=sys.stderr, flush=True)
+        
+        stats = prefetcher.summary()
+        print(f"[Qwen3VL-Standalone] Preprocessing {stats['prepare_seconds']:.1f}s, generation waited "
+              f"{stats['wait_seconds']:.1f}s (GPU idle time recovered: {stats['recovered_seconds']:.1f}s)",
+              file=sys.stderr, flush=True)
         
         # 打印评分总结
         if all_scores:
@@ -301,10 +403,121 @@ class Qwen3VLStandaloneScorer:
         return all_scores
 
 
+def create_scorer(args) -> Qwen3VLStandaloneScorer:
+    """按命令行参数创建评分器"""
+    return Qwen3VLStandaloneScorer(
+        model_name=args.model_name,
+        device=args.device,
+        dtype=args.dtype,
+        reuse_prefix=not args.no_prefix_reuse,
+        min_pixels=args.min_pixels,
+        max_pixels=args.max_pixels,
+        start_offloaded=args.start_offloaded,
+        stop_at_score=not args.no_score_stop,
+        prefetch_batches=args.prefetch_batches
+    )
+
+
+def stream(args) -> int:
+    """
+    流式单次模式：任务从stdin逐行读入（JSON lines），按块评分，结果逐条写入--output
+    
+    第一块任务到达即开始评分，子进程内存中只保留当前块；
+    输出格式见qwen3_vl_utils.StreamedResults，异常退出时已写出的结果仍可回收
+    
+    Returns:
+        进程退出码
+    """
+    results = StreamedResults(args.output)
+    chunk_size = args.chunk_size or args.batch_size * 4
+    try:
+        scorer = create_scorer(args)
+        scorer.progress = ProgressChannel(args.progress_fd)
+        scorer.progress.emit("loaded", device=str(scorer.device))
+        
+        for chunk in read_task_chunks(sys.stdin, chunk_size):
+            scorer.score_batch(
+                tasks=chunk,
+                batch_size=args.batch_size,
+                max_new_tokens=args.max_new_tokens,
+                use_batch_inference=args.use_batch_inference,
+                results=results
+            )
+        results.finish('success')
+        print(f"[Qwen3VL-Standalone] {len(results)} results written to: {args.output}", file=sys.stderr, flush=True)
+        return 0
+    
+    except Exception as e:
+        print(f"[ERROR] {str(e)}", file=sys.stderr, flush=True)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        results.finish('error', str(e))
+        return 1
+
+
+def serve(args):
+    """
+    常驻服务模式：模型只加载一次，通过stdin/stdout交换JSON lines
+    
+    请求（每行一个JSON）：
+        {"id": 1, "cmd": "score", "tasks": [...]}
+        {"id": 2, "cmd": "offload"} / {"id": 3, "cmd": "load"} / {"id": 4, "cmd": "shutdown"}
+    响应（每行一个JSON）：
+        {"event": "ready"}                          # 模型加载完成
+        {"id": 1, "status": "ok", "scores": [...]}
+        {"id": 1, "status": "error", "error": "..."}
+    """
+    # 协议独占原始stdout，其它库打印到stdout的内容重定向到stderr
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8', buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    
+    def reply(message: Dict):
+        protocol_out.write(json.dumps(message, ensure_ascii=False) + '\n')
+        protocol_out.flush()
+    
+    scorer = create_scorer(args)
+    reply({'event': 'ready', 'device': str(scorer.device)})
+    
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        request = json.loads(line)
+        request_id = request.get('id')
+        cmd = request.get('cmd')
+        
+        try:
+            if cmd == 'score':
+                scores = scorer.score_batch(
+                    tasks=request.get('tasks', []),
+                    batch_size=args.batch_size,
+                    max_new_tokens=args.max_new_tokens,
+                    use_batch_inference=args.use_batch_inference
+                )
+                reply({'id': request_id, 'status': 'ok', 'scores': scores})
+            elif cmd == 'offload':
+                scorer.offload()
+                reply({'id': request_id, 'status': 'ok'})
+            elif cmd == 'load':
+                scorer.load()
+                reply({'id': request_id, 'status': 'ok'})
+            elif cmd == 'shutdown':
+                reply({'id': request_id, 'status': 'ok'})
+                break
+            else:
+                reply({'id': request_id, 'status': 'error', 'error': f'Unknown command: {cmd}'})
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            reply({'id': request_id, 'status': 'error', 'error': str(e)})
+
+
 def main():
     parser = argparse.ArgumentParser(description="Qwen3-VL Standalone Scorer")
-    parser.add_argument('--input', required=True, help='Input JSON file')
-    parser.add_argument('--output', required=True, help='Output JSON file')
+    parser.add_argument('--input', help='Input JSON file')
+    parser.add_argument('--output', help='Output JSON file')
+    parser.add_argument('--serve', action='store_true',
+                       help='Run as a persistent worker reading requests from stdin')
     parser.add_argument('--model-name', default='Qwen/Qwen3-VL-30B-Instruct', 
                        help='Model name or path')
     parser.add_argument('--device', default='auto', help='Device: auto, cuda, cpu')
@@ -315,9 +528,42 @@ def main():
                        help='Max new tokens')
     parser.add_argument('--use-batch-inference', action='store_true', default=True,
                        help='Use batch inference')
+    parser.add_argument('--no-prefix-reuse', action='store_true',
+                       help='Disable image prefix KV cache reuse in multi-rubric scoring')
+    parser.add_argument('--min-pixels', type=int, default=None,
+                       help='Upscale images below this pixel count before scoring')
+    parser.add_argument('--max-pixels', type=int, default=None,
+                       help='Downscale images above this pixel count before scoring')
+    parser.add_argument('--no-score-stop', action='store_true',
+                       help='Generate until EOS or max new tokens instead of stopping at the first complete score')
+    parser.add_argument('--prefetch-batches', type=int, default=2,
+                       help='Batches preprocessed ahead on a background thread (0: sequential)')
+    parser.add_argument('--progress-fd', type=int, default=None,
+                       help='File descriptor for JSON-lines progress events (one-shot mode)')
+    parser.add_argument('--start-offloaded', action='store_true',
+                       help='Serve mode: load the model into CPU memory until the first load command')
+    parser.add_argument('--stream', action='store_true',
+                       help='Read tasks as JSON lines from stdin and write results incrementally to --output')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                       help='Stream mode: tasks scored per chunk (default: 4 x batch size)')
     
     args = parser.parse_args()
     
+    if args.serve:
+        serve(args)
+        sys.exit(0)
+    
+    if args.stream:
+        if not args.output:
+            parser.error('--output is required with --stream')
+        sys.exit(stream(args))
+    
+    if not args.input or not args.output:
+        parser.error('--input and --output are required unless --serve or --stream is given')
+    
+    # 已完成的分数（出错时写入输出文件，供调用方回收）
+    partial_scores = []
+    
     try:
         # 读取输入
         print(f"[Qwen3VL-Standalone] Reading input from: {args.input}", file=sys.stderr, flush=True)
@@ -325,11 +571,9 @@ def main():
             input_data = json.load(f)
         
         # 初始化模型
-        scorer = Qwen3VLStandaloneScorer(
-            model_name=args.model_name,
-            device=args.device,
-            dtype=args.dtype
-        )
+        scorer = create_scorer(args)
+        scorer.progress = ProgressChannel(args.progress_fd)
+        scorer.progress.emit("loaded", device=str(scorer.device))
         
         # 评分
         tasks = input_data.get('tasks', [])
@@ -339,7 +583,8 @@ def main():
             tasks=tasks,
             batch_size=args.batch_size,
             max_new_tokens=args.max_new_tokens,
-            use_batch_inference=args.use_batch_inference
+            use_batch_inference=args.use_batch_inference,
+            results=partial_scores
         )
         
         # 写入输出
@@ -353,8 +598,9 @@ def main():
             json.dump(output_data, f, ensure_ascii=False, indent=2)
         
         print(f"[Qwen3VL-Standalone] Results written to: {args.output}", file=sys.stderr, flush=True)
-        print(f"[Qwen3VL-Standalone] Average score: {sum(scores)/len(scores):.3f}", 
-              file=sys.stderr, flush=True)
+        if scores and not isinstance(scores[0], list):
+            print(f"[Qwen3VL-Standalone] Average score: {sum(scores)/len(scores):.3f}", 
+                  file=sys.stderr, flush=True)
         
         sys.exit(0)
     
@@ -363,11 +609,11 @@ def main():
         import traceback
         traceback.print_exc(file=sys.stderr)
         
-        # 写入错误信息
+        # 写入错误信息（附带已完成的部分分数，按任务顺序对应前len(scores)个任务）
         error_data = {
             'status': 'error',
             'error': str(e),
-            'scores': []
+            'scores': partial_scores
         }
         with open(args.output, 'w', encoding='utf-8') as f:
             json.dump(error_data, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,616 @@
+"""
+Qwen3-VL shared scoring helpers
+Qwen3-VL评分的公共工具（进程内模型与standalone脚本共用）
+
+standalone脚本在独立环境中以脚本方式运行，因此本模块只能依赖
+torch/transformers/PIL，不能使用相对导入。
+"""
+
+import base64
+import copy
+import io
+import itertools
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+from typing import Any, Callable, Dict, List, Optional
+
+# 多维度评分时共享的系统prompt：各维度的评分要求放在图像之后的用户消息中，
+# 这样图像部分的token前缀对所有维度完全相同，可以只prefill一次
+DEFAULT_RUBRIC_SYSTEM_PROMPT = (
+    "You are an image editing reward model evaluator. "
+    "Follow the evaluation criteria given after the image and output only the score."
+)
+
+# 对比模式下两张图像前的说明文字（进程内模型与子进程共用）
+COMPARE_IMAGE_LABELS = ["Original image:", "Edited image:"]
+
+# Qwen3-VL的patch大小为16，2x2合并为一个视觉token，边长对齐到32的倍数
+PIXEL_ALIGN_FACTOR = 32
+
+# 父进程传给评分子进程的编辑图格式：png（无损，可调压缩级别）、webp（无损）、raw（未压缩RGB像素）
+TRANSPORT_FORMATS = ("png", "webp", "raw")
+
+# 生成中的完整分数：回复开头的数字且其后已出现空白，或评分标签后的数字且其后已出现非数字字符
+# （"8.5"之后可能还有"00"，"1. "是列表序号而不是分数，都不算完整）
+COMPLETE_SCORE_PATTERNS = [
+    re.compile(r'^\s*(\d+(?:\.\d+)?)(?=\s)'),
+    re.compile(r'(?:score|rating|评分|分数|得分|总分|综合评分)\s*[:：]\s*(\d+(?:\.\d+)?)(?=\.?[^\d.])',
+               re.IGNORECASE),
+]
+
+
+def fit_pixel_budget(image,
+                     min_pixels: Optional[int] = None,
+                     max_pixels: Optional[int] = None,
+                     factor: int = PIXEL_ALIGN_FACTOR):
+    """
+    按像素预算缩放图像（视觉token数与像素数成正比）
+
+    保持宽高比，边长对齐到factor的倍数（超出max_pixels时向下取整，不足min_pixels时向上取整）；
+    已在预算内的图像原样返回，不做任何拷贝
+
+    Args:
+        image: PIL图像
+        min_pixels: 最小像素数（可选）
+        max_pixels: 最大像素数（可选）
+        factor: 边长对齐的倍数
+
+    Returns:
+        缩放后的PIL图像
+    """
+    width, height = image.size
+    pixels = width * height
+    if max_pixels and pixels > max_pixels:
+        scale = math.sqrt(max_pixels / pixels)
+        new_width = max(factor, math.floor(width * scale / factor) * factor)
+        new_height = max(factor, math.floor(height * scale / factor) * factor)
+    elif min_pixels and pixels < min_pixels:
+        scale = math.sqrt(min_pixels / pixels)
+        new_width = math.ceil(width * scale / factor) * factor
+        new_height = math.ceil(height * scale / factor) * factor
+    else:
+        return image
+
+    from PIL import Image
+    return image.resize((new_width, new_height), Image.Resampling.BICUBIC)
+
+
+def encode_transport_image(image,
+                           transport_format: str = "png",
+                           compress_level: Optional[int] = None) -> Dict[str, Any]:
+    """
+    把编辑图编码为任务中的图像字段（三种格式都无损，子进程解码得到相同的像素）
+
+    Args:
+        image: PIL图像
+        transport_format: png、webp或raw（见TRANSPORT_FORMATS）
+        compress_level: PNG压缩级别（0-9，None为PIL默认的6）
+
+    Returns:
+        {"image_b64": ...}；raw格式另带image_format和image_size
+    """
+    if transport_format == "raw":
+        image = image if image.mode == "RGB" else image.convert("RGB")
+        return {
+            "image_b64": base64.b64encode(image.tobytes()).decode("ascii"),
+            "image_format": "raw",
+            "image_size": list(image.size),
+        }
+
+    buffered = io.BytesIO()
+    if transport_format == "webp":
+        image.save(buffered, format="WEBP", lossless=True, method=0)
+    elif transport_format == "png":
+        params = {} if compress_level is None else {"compress_level": compress_level}
+        image.save(buffered, format="PNG", **params)
+    else:
+        raise ValueError(f"Unknown transport format: {transport_format} (expected one of {TRANSPORT_FORMATS})")
+    return {"image_b64": base64.b64encode(buffered.getvalue()).decode("ascii")}
+
+
+def decode_transport_image(task: Dict[str, Any]):
+    """解码任务中的编辑图（encode_transport_image的逆过程），返回RGB的PIL图像"""
+    from PIL import Image
+    data = base64.b64decode(task["image_b64"])
+    if task.get("image_format") == "raw":
+        return Image.frombytes("RGB", tuple(task["image_size"]), data)
+    image = Image.open(io.BytesIO(data))
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def has_complete_score(text: str) -> bool:
+    """生成的文本中是否已出现完整的0-10分数（见COMPLETE_SCORE_PATTERNS）"""
+    for pattern in COMPLETE_SCORE_PATTERNS:
+        match = pattern.search(text)
+        if match and 0 <= float(match.group(1)) <= 10:
+            return True
+    return False
+
+
+class ScoreStoppingCriteria:
+    """
+    出现完整分数后结束该序列（transformers StoppingCriteria接口）
+
+    返回每个序列是否结束的布尔张量：已结束的序列由generate填充pad，
+    batch中所有序列都结束时generate停止，不再等待最长的回复。
+    不继承StoppingCriteria，主进程导入本模块时不需要transformers
+    """
+
+    def __init__(self, tokenizer, prompt_length: int):
+        """
+        Args:
+            tokenizer: 用于解码已生成token的tokenizer
+            prompt_length: 输入序列长度（之后的token为生成内容）
+        """
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.done: Optional[List[bool]] = None
+
+    def __call__(self, input_ids, scores=None, **kwargs):
+        import torch
+
+        if self.done is None:
+            self.done = [False] * input_ids.shape[0]
+        pending = [i for i, done in enumerate(self.done) if not done]
+        if pending:
+            # 一次拷贝所有未结束序列的生成部分，避免逐行同步GPU
+            generated = input_ids[pending, self.prompt_length:].tolist()
+            for i, token_ids in zip(pending, generated):
+                self.done[i] = has_complete_score(self.tokenizer.decode(token_ids, skip_special_tokens=True))
+        return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+
+def score_stopping_criteria(processor, prompt_length: int):
+    """
+    构建generate的stopping_criteria（出现完整分数即停止，见ScoreStoppingCriteria）
+
+    Args:
+        processor: Qwen3-VL的processor（或tokenizer）
+        prompt_length: 输入序列长度
+
+    Returns:
+        StoppingCriteriaList
+    """
+    from transformers import StoppingCriteriaList
+
+    tokenizer = getattr(processor, "tokenizer", processor)
+    return StoppingCriteriaList([ScoreStoppingCriteria(tokenizer, prompt_length)])
+
+
+class ProgressChannel:
+    """
+    评分子进程的结构化进度通道（父进程通过--progress-fd传入的专用管道，与日志和协议输出分开）
+
+    每行一个JSON事件：
+        {"event": "loaded", "device": "cuda:0"}         # 模型加载完成
+        {"event": "score", "index": 3, "score": 7.5}     # index为本次输入中的任务序号
+        {"event": "batch", "done": 8, "total": 32}       # 一个batch完成
+    fd为None或无效（例如经conda run启动时未被继承）时不输出
+    """
+
+    def __init__(self, fd: Optional[int] = None):
+        self._file = None
+        if fd is not None:
+            try:
+                self._file = os.fdopen(fd, "w", encoding="utf-8", buffering=1)
+            except OSError:
+                self._file = None
+
+    def emit(self, event: str, **fields) -> None:
+        """写入一个事件（父进程已关闭读端时停止输出，不影响评分）"""
+        if self._file is None:
+            return
+        try:
+            self._file.write(json.dumps({"event": event, **fields}, ensure_ascii=False) + "\n")
+        except (OSError, ValueError):
+            self._file = None
+
+    def close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+
+def read_task_chunks(stream, chunk_size: int):
+    """
+    从JSON lines流（每行一个任务）中按块读取任务
+
+    读满一块即交给调用方评分，子进程内存中只保留当前块，不必等待全部任务到达
+
+    Args:
+        stream: 文本流（如stdin）
+        chunk_size: 每块的任务数
+    """
+    chunk = []
+    for line in stream:
+        if not line.strip():
+            continue
+        chunk.append(json.loads(line))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class StreamedResults(list):
+    """
+    边追加边写出的结果列表（作为score_batch的results参数）
+
+    每个结果立即以一行{"index", "score"}写入输出文件，结束时写入一行{"status", "num_tasks"[, "error"]}；
+    子进程崩溃或超时被终止时，已写出的结果仍可由read_stream_results回收
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self._file = open(path, "w", encoding="utf-8", buffering=1)
+
+    def append(self, score) -> None:
+        super().append(score)
+        self._file.write(json.dumps({"index": len(self) - 1, "score": score}, ensure_ascii=False) + "\n")
+
+    def extend(self, scores) -> None:
+        for score in scores:
+            self.append(score)
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        """写入结束行并关闭文件"""
+        footer = {"status": status, "num_tasks": len(self)}
+        if error is not None:
+            footer["error"] = error
+        self._file.write(json.dumps(footer, ensure_ascii=False) + "\n")
+        self._file.close()
+
+
+def read_stream_results(path: str) -> Dict[str, Any]:
+    """
+    读取StreamedResults写出的结果文件
+
+    Returns:
+        {"status", "scores", "error"}：scores为从第0个任务开始连续的结果；
+        没有结束行（子进程异常退出）时status为error
+    """
+    scores, footer = [], {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # 异常退出时最后一行可能不完整
+                if "status" in record:
+                    footer = record
+                elif record.get("index") == len(scores):
+                    scores.append(record.get("score"))
+    except OSError:
+        pass
+    return {
+        "status": footer.get("status", "error"),
+        "scores": scores,
+        "error": footer.get("error") or (None if footer else "no final status line (process exited early)"),
+    }
+
+
+def pin_inputs(inputs):
+    """
+    把输入中的CPU张量复制到锁页内存（之后.to(device, non_blocking=True)可异步拷贝）
+
+    没有CUDA时原样返回
+    """
+    import torch
+
+    if not torch.cuda.is_available():
+        return inputs
+    for key, value in inputs.items():
+        if torch.is_tensor(value) and value.device.type == "cpu":
+            inputs[key] = value.pin_memory()
+    return inputs
+
+
+class BatchPrefetcher:
+    """
+    在后台线程中提前准备后续batch，与当前batch的GPU生成重叠
+
+    准备工作（解码图像、apply_chat_template、processor的缩放和patch切分、锁页）
+    是每个batch可观的CPU耗时；按顺序执行时GPU在这段时间空闲。
+    迭代得到(batch, inputs, error)，准备失败时inputs为None、error为异常，由调用方决定如何回退。
+    """
+
+    def __init__(self,
+                 prepare: Callable[[Any], Any],
+                 batches: List[Any],
+                 depth: int = 2,
+                 pin_memory: bool = True):
+        """
+        Args:
+            prepare: 准备单个batch的函数，返回processor输出（CPU张量）
+            batches: batch列表（传给prepare）
+            depth: 最多提前准备的batch数（0表示在调用线程中按顺序准备）
+            pin_memory: 准备好的张量是否放入锁页内存
+        """
+        self.prepare = prepare
+        self.batches = list(batches)
+        self.depth = depth
+        self.pin_memory = pin_memory
+        self.stats = {"batches": 0, "prepare_seconds": 0.0, "wait_seconds": 0.0}
+        self._lock = threading.Lock()
+        # 已提交、尚未交给调用方的(batch, future)
+        self._queued = deque()
+
+    def _prepare(self, batch):
+        start = time.perf_counter()
+        try:
+            inputs = self.prepare(batch)
+            return pin_inputs(inputs) if self.pin_memory else inputs
+        finally:
+            with self._lock:
+                self.stats["prepare_seconds"] += time.perf_counter() - start
+
+    def _take(self, get):
+        """取得一个准备好的batch，等待时间计入wait_seconds"""
+        start = time.perf_counter()
+        try:
+            inputs, error = get(), None
+        except Exception as e:
+            inputs, error = None, e
+        self.stats["wait_seconds"] += time.perf_counter() - start
+        self.stats["batches"] += 1
+        return inputs, error
+
+    def __iter__(self):
+        if self.depth <= 0:
+            for batch in self.batches:
+                yield (batch, *self._take(lambda: self._prepare(batch)))
+            return
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="BatchPrefetch") as executor:
+            remaining = iter(self.batches)
+            queued = self._queued
+            queued.extend((batch, executor.submit(self._prepare, batch))
+                          for batch in itertools.islice(remaining, self.depth))
+            while queued:
+                batch, future = queued.popleft()
+                inputs, error = self._take(future.result)
+                # 交出当前batch之前提交下一个，其准备与当前batch的生成重叠
+                for next_batch in itertools.islice(remaining, 1):
+                    queued.append((next_batch, executor.submit(self._prepare, next_batch)))
+                yield batch, inputs, error
+
+    def drain(self) -> None:
+        """
+        等待已提交的准备完成（调用方在两次迭代之间调用）
+
+        迭代暂停期间不会提交新的准备，drain返回后后台线程空闲，直到下一次迭代；
+        回退到逐个样本处理前调用，避免与后台预处理并发使用processor
+        """
+        futures_wait([future for _, future in self._queued])
+
+    def summary(self) -> Dict[str, float]:
+        """
+        准备耗时统计：prepare_seconds为准备总耗时，wait_seconds为生成循环等待准备的时间，
+        recovered_seconds为被生成掩盖（原本GPU空闲）的准备时间
+        """
+        summary = dict(self.stats)
+        summary["recovered_seconds"] = max(0.0, summary["prepare_seconds"] - summary["wait_seconds"])
+        return summary
+
+
+def clone_processor(processor, padding_side: Optional[str] = None):
+    """
+    复制processor，供BatchPrefetcher的后台线程独占使用
+
+    fast tokenizer不是线程安全的：padding/truncation设置会修改Rust tokenizer的内部状态，
+    与主线程的decode（停止条件、batch_decode）并发时可能抛出"Already borrowed"
+
+    Args:
+        processor: Qwen3-VL的processor
+        padding_side: 副本tokenizer的padding方向（可选，batch生成使用"left"）
+    """
+    clone = copy.deepcopy(processor)
+    if padding_side is not None:
+        clone.tokenizer.padding_side = padding_side
+    return clone
+
+
+def build_messages(images: List[Any],
+                   system_prompt: str,
+                   user_prompt: str,
+                   image_labels: Optional[List[str]] = None) -> List[Dict]:
+    """
+    构建评分messages：系统prompt，然后是图像（可带说明文字），最后是用户prompt
+
+    Args:
+        images: 图像列表（对比模式下为[原图, 编辑图]）
+        system_prompt: 系统prompt
+        user_prompt: 用户prompt
+        image_labels: 每张图像前的说明文字（可选）
+
+    Returns:
+        messages列表
+    """
+    content = []
+    for k, image in enumerate(images):
+        if image_labels:
+            content.append({"type": "text", "text": image_labels[k]})
+        content.append({"type": "image", "image": image})
+    content.append({"type": "text", "text": user_prompt})
+
+    return [
+        {"role": "system", "content": [{"type": "text", "text": system_prompt}]},
+        {"role": "user", "content": content},
+    ]
+
+
+def build_rubric_messages(images: List[Any],
+                          rubric: Dict[str, str],
+                          system_prompt: str = DEFAULT_RUBRIC_SYSTEM_PROMPT,
+                          image_labels: Optional[List[str]] = None) -> List[Dict]:
+    """
+    构建单个评分维度的messages（图像在前，维度说明在后）
+
+    Args:
+        images: 图像列表（对比模式下为[原图, 编辑图]）
+        rubric: 评分维度，包含system_prompt和user_prompt
+        system_prompt: 所有维度共享的系统prompt
+        image_labels: 每张图像前的说明文字（可选，如"Original image:"）
+
+    Returns:
+        messages列表
+    """
+    rubric_text = f"{rubric['system_prompt'].strip()}\n\n{rubric['user_prompt']}"
+    return build_messages(images, system_prompt, rubric_text, image_labels)
+
+
+def common_prefix_length(sequences: List[List[int]]) -> int:
+    """计算多个token序列的最长公共前缀长度"""
+    if not sequences:
+        return 0
+    length = min(len(seq) for seq in sequences)
+    for k in range(length):
+        token = sequences[0][k]
+        if any(seq[k] != token for seq in sequences[1:]):
+            return k
+    return length
+
+
+def split_rubric_prompts(texts: List[str], image_token: str, num_images: int) -> Optional[int]:
+    """
+    计算各维度prompt文本的公共前缀的切分位置（最后一个图像占位符之后）
+
+    占位符是特殊token，两侧分别tokenize与整体tokenize的结果相同；
+    公共前缀没有包含全部图像时返回None（不能复用前缀）
+
+    Args:
+        texts: 各维度apply_chat_template(tokenize=False)得到的文本
+        image_token: 图像占位符（processor.image_token）
+        num_images: 图像数
+
+    Returns:
+        切分位置（字符下标），或None
+    """
+    prefix = texts[0][:common_prefix_length(texts)]
+    if num_images == 0 or prefix.count(image_token) != num_images:
+        return None
+    return prefix.rfind(image_token) + len(image_token)
+
+
+def generate_rubric_responses(model,
+                              processor,
+                              images: List[Any],
+                              rubrics: List[Dict[str, str]],
+                              max_new_tokens: int = 128,
+                              system_prompt: str = DEFAULT_RUBRIC_SYSTEM_PROMPT,
+                              image_labels: Optional[List[str]] = None,
+                              reuse_prefix: bool = True,
+                              stop_at_score: bool = True) -> List[str]:
+    """
+    对同一组图像按多个评分维度生成回复
+
+    reuse_prefix=True时，processor只对所有维度共同的前缀（系统prompt+图像）运行一次，
+    图像预处理、视觉编码和图像部分的prefill都只执行一次；各维度只tokenize自己的文本后缀。
+    前缀的KV cache复制为R行（R为维度数），所有维度在一次batch generate中生成；
+    后缀长度不同时在前缀与后缀之间填充pad（attention mask为0），并按行修正rope_deltas，
+    使每行的位置编码与单独生成时相同。KV cache显存为前缀长度的R倍
+
+    Args:
+        model: Qwen3-VL模型
+        processor: 对应的processor
+        images: 图像列表
+        rubrics: 评分维度列表，每项包含system_prompt和user_prompt
+        max_new_tokens: 最大生成token数
+        system_prompt: 共享的系统prompt
+        image_labels: 每张图像前的说明文字（可选）
+        reuse_prefix: 是否复用图像前缀
+        stop_at_score: 出现完整分数后即停止生成
+
+    Returns:
+        每个维度的回复文本（与rubrics顺序一致）
+    """
+    import torch
+
+    messages = [build_rubric_messages(images, rubric, system_prompt, image_labels) for rubric in rubrics]
+
+    split = None
+    if reuse_prefix and len(rubrics) > 1:
+        texts = [processor.apply_chat_template(m, tokenize=False, add_generation_prompt=True) for m in messages]
+        split = split_rubric_prompts(texts, getattr(processor, "image_token", "<|image_pad|>"), len(images))
+
+    responses = []
+    with torch.inference_mode():
+        if split is None:
+            # 不复用前缀：每个维度独立预处理和生成
+            for message in messages:
+                inputs = processor.apply_chat_template(
+                    message,
+                    tokenize=True,
+                    add_generation_prompt=True,
+                    return_dict=True,
+                    return_tensors="pt"
+                ).to(model.device)
+                generate_kwargs = {}
+                if stop_at_score:
+                    generate_kwargs["stopping_criteria"] = score_stopping_criteria(processor,
+                                                                                   inputs["input_ids"].shape[1])
+                generated_ids = model.generate(**inputs, max_new_tokens=max_new_tokens, **generate_kwargs)
+                responses.append(processor.batch_decode(
+                    generated_ids[:, inputs["input_ids"].shape[1]:],
+                    skip_special_tokens=True,
+                    clean_up_tokenization_spaces=False
+                )[0])
+            return responses
+
+        # 前缀：图像只预处理、编码一次
+        prefix = processor(text=[texts[0][:split]], images=images, return_tensors="pt").to(model.device)
+        prefix_ids = prefix["input_ids"]
+        vision_inputs = {k: v for k, v in prefix.items() if k not in ("input_ids", "attention_mask")}
+        prefix_out = model(
+            input_ids=prefix_ids,
+            attention_mask=prefix["attention_mask"],
+            use_cache=True,
+            logits_to_keep=1,
+            **vision_inputs
+        )
+        cache = prefix_out.past_key_values
+        cache.batch_repeat_interleave(len(rubrics))
+
+        # 后缀：只tokenize文本，在前缀与后缀之间填充到相同长度
+        tokenizer = processor.tokenizer
+        suffixes = tokenizer([text[split:] for text in texts], add_special_tokens=False)["input_ids"]
+        suffix_len = max(len(ids) for ids in suffixes)
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        num_pads = [suffix_len - len(ids) for ids in suffixes]
+        padded = torch.tensor([[pad_id] * n + ids for n, ids in zip(num_pads, suffixes)], device=model.device)
+        input_ids = torch.cat([prefix_ids.expand(len(rubrics), -1), padded], dim=1)
+        suffix_mask = (torch.arange(suffix_len, device=model.device)[None, :]
+                       >= torch.tensor(num_pads, device=model.device)[:, None])
+        attention_mask = torch.cat([prefix["attention_mask"].expand(len(rubrics), -1),
+                                    suffix_mask.to(prefix["attention_mask"].dtype)], dim=1)
+
+        # 带cache的生成按rope_deltas计算位置（M-RoPE），每行减去填充数，填充不占位置
+        rope_owner = getattr(model, "model", model)
+        rope_deltas = getattr(rope_owner, "rope_deltas", None)
+        if rope_deltas is not None:
+            rope_owner.rope_deltas = rope_deltas.expand(len(rubrics), -1) - torch.tensor(
+                num_pads, device=rope_deltas.device, dtype=rope_deltas.dtype)[:, None]
+
+        generate_kwargs = {"past_key_values": cache}
+        if stop_at_score:
+            generate_kwargs["stopping_criteria"] = score_stopping_criteria(processor, input_ids.shape[1])
+        generated_ids = model.generate(input_ids=input_ids, attention_mask=attention_mask,
+                                       max_new_tokens=max_new_tokens, **generate_kwargs)
+        responses = processor.batch_decode(
+            generated_ids[:, input_ids.shape[1]:],
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=False
+        )
+
+    return responses
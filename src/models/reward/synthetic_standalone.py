@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Synthetic standalone scorer
+qwen3_vl_standalone.py的合成负载替身（命令行参数和--serve协议与之相同，不需要GPU）
+
+图像照常从base64/原图缓存文件解码，模型推理以按配置延迟休眠代替，
+用于在CPU机器上测量子进程评分的IPC与调度开销。
+
+模拟参数通过环境变量SYNTHETIC_SCORER_CONFIG（JSON）传入，例如：
+    {"latency": {"distribution": "lognormal", "mean": 0.05, "std": 0.02},
+     "batch_overhead": 0.01, "swap_latency": 0.5, "failure_rate": 0.01}
+
+使用方法（由Qwen3VLMultiGPUSubprocessRewardModel启动，script_path指向本脚本）：
+    python synthetic_standalone.py --input input.json --output output.json
+    python synthetic_standalone.py --serve --device cuda:0
+    python synthetic_standalone.py --stream --output results.jsonl < tasks.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+# 模拟负载与本脚本同属src/models（脚本方式运行，不能使用相对导入）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from simulation import SimulatedLoad
+from qwen3_vl_utils import ProgressChannel, StreamedResults, decode_transport_image, read_task_chunks
+
+
+class SyntheticStandaloneScorer:
+    """模拟的独立评分器"""
+
+    def __init__(self, config: Dict):
+        self.load_sim = SimulatedLoad(config)
+        self.overhead = SimulatedLoad(config, latency_key="batch_overhead")
+        self.progress = ProgressChannel()
+        self.swap = SimulatedLoad(config, latency_key="swap_latency")
+        self.swap.wait()  # 模拟加载权重
+
+    def task_images(self, task: Dict) -> List[Image.Image]:
+        """解码任务中的图像（与真实脚本一样解码，计入解码开销）"""
+        images = [decode_transport_image(task)]
+        if task.get('original_ref'):
+            images.insert(0, Image.open(task['original_ref']).convert('RGB'))
+        return images
+
+    def score_task(self, task: Dict):
+        """模拟单个任务的评分（多维度任务返回分数列表）"""
+        self.task_images(task)
+        prompts = ([r['user_prompt'] for r in task['rubrics']] if 'rubrics' in task
+                   else [task['user_prompt']])
+        self.load_sim.wait(len(prompts))
+        for prompt in prompts:
+            if self.load_sim.fails(prompt):
+                raise ValueError(f"Simulated scoring failure: {prompt[:50]}")
+        scores = [5.0 + 4.0 * zlib.crc32(p.encode('utf-8')) / 2 ** 32 for p in prompts]
+        return scores if 'rubrics' in task else scores[0]
+
+    def score_batch(self, tasks: List[Dict], results: Optional[List] = None) -> List:
+        """批量评分（results用于出错时回收已完成的部分分数）"""
+        scores = results if results is not None else []
+        self.overhead.wait()
+        for task in tasks:
+            scores.append(self.score_task(task))
+            self.progress.emit("score", index=len(scores) - 1, score=scores[-1])
+        self.progress.emit("batch", done=len(scores), total=len(scores))
+        return scores
+
+
+def serve(scorer: SyntheticStandaloneScorer):
+    """常驻服务模式（协议同qwen3_vl_standalone.serve）"""
+    def reply(message: Dict):
+        sys.stdout.write(json.dumps(message) + '\n')
+        sys.stdout.flush()
+
+    reply({'event': 'ready', 'device': 'synthetic'})
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        request = json.loads(line)
+        request_id = request.get('id')
+        cmd = request.get('cmd')
+        try:
+            if cmd == 'score':
+                reply({'id': request_id, 'status': 'ok', 'scores': scorer.score_batch(request.get('tasks', []))})
+            elif cmd in ('offload', 'load'):
+                scorer.swap.wait()
+                reply({'id': request_id, 'status': 'ok'})
+            elif cmd == 'shutdown':
+                reply({'id': request_id, 'status': 'ok'})
+                break
+            else:
+                reply({'id': request_id, 'status': 'error', 'error': f'Unknown command: {cmd}'})
+        except Exception as e:
+            reply({'id': request_id, 'status': 'error', 'error': str(e)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic standalone scorer")
+    parser.add_argument('--input', help='Input JSON file')
+    parser.add_argument('--output', help='Output JSON file')
+    parser.add_argument('--serve', action='store_true')
+    # 以下参数与qwen3_vl_standalone.py保持兼容，本脚本忽略
+    parser.add_argument('--model-name')
+    parser.add_argument('--device')
+    parser.add_argument('--dtype')
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--max-new-tokens', type=int)
+    parser.add_argument('--use-batch-inference', action='store_true')
+    parser.add_argument('--no-prefix-reuse', action='store_true')
+    parser.add_argument('--min-pixels', type=int)
+    parser.add_argument('--max-pixels', type=int)
+    parser.add_argument('--no-score-stop', action='store_true')
+    parser.add_argument('--prefetch-batches', type=int)
+    parser.add_argument('--start-offloaded', action='store_true')
+    parser.add_argument('--progress-fd', type=int)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--chunk-size', type=int)
+    args = parser.parse_args()
+
+    scorer = SyntheticStandaloneScorer(json.loads(os.environ.get('SYNTHETIC_SCORER_CONFIG', '{}')))
+    if args.serve:
+        serve(scorer)
+        sys.exit(0)
+
+    scorer.progress = ProgressChannel(args.progress_fd)
+    scorer.progress.emit("loaded", device=args.device)
+    if args.stream:
+        results = StreamedResults(args.output)
+        try:
+            for chunk in read_task_chunks(sys.stdin, args.chunk_size or (args.batch_size or 4) * 4):
+                scorer.score_batch(chunk, results)
+        except Exception as e:
+            results.finish('error', str(e))
+            sys.exit(1)
+        results.finish('success')
+        sys.exit(0)
+    
+    partial_scores = []
+    try:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            tasks = json.load(f).get('tasks', [])
+        scores = scorer.score_batch(tasks, partial_scores)
+        output = {'status': 'success', 'scores': scores, 'num_tasks': len(tasks)}
+        exit_code = 0
+    except Exception as e:
+        output = {'status': 'error', 'error': str(e), 'scores': partial_scores}
+        exit_code = 1
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Simulated model load
+模拟模型负载（合成负载测试用的桩模型共用）
+
+按配置的分布采样延迟、按确定性的失败率让样本失败，并占用指定大小的内存，
+用于在没有GPU的机器上测量pipeline自身的编排开销。
+"""
+
+import math
+import random
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+
+class SimulatedLoad:
+    """
+    模拟负载
+
+    配置示例：
+        latency: {distribution: lognormal, mean: 0.05, std: 0.02}  # 秒
+        failure_rate: 0.01
+        memory_mb: 256
+        seed: 0
+    """
+
+    DISTRIBUTIONS = ("constant", "normal", "lognormal", "uniform")
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, latency_key: str = "latency"):
+        """
+        初始化模拟负载
+
+        Args:
+            config: 模型配置（读取latency_key, failure_rate, memory_mb, seed）
+            latency_key: 延迟配置的键名（一个模型可有多种延迟，如每张图像/每个batch）
+        """
+        config = config or {}
+        latency = config.get(latency_key, 0.0)
+        if not isinstance(latency, dict):
+            latency = {"distribution": "constant", "mean": latency}
+        self.distribution = latency.get("distribution", "constant")
+        if self.distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {self.distribution}")
+        self.mean = float(latency.get("mean", 0.0))
+        self.std = float(latency.get("std", 0.0))
+        self.failure_rate = float(config.get("failure_rate", 0.0))
+        self.seed = config.get("seed", 0)
+
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        # 占用内存模拟模型权重（写满内容，确保计入RSS）
+        self._ballast = b"\x01" * (int(config.get("memory_mb", 0)) * 1024 * 1024)
+
+    def sample_latency(self) -> float:
+        """采样一次延迟（秒，不小于0）"""
+        if self.mean <= 0:
+            return 0.0
+        with self._lock:
+            if self.distribution == "normal":
+                value = self._rng.gauss(self.mean, self.std)
+            elif self.distribution == "lognormal":
+                # 按目标均值/标准差换算对数正态分布的参数
+                sigma2 = math.log1p((self.std / self.mean) ** 2)
+                mu = math.log(self.mean) - sigma2 / 2
+                value = self._rng.lognormvariate(mu, math.sqrt(sigma2))
+            elif self.distribution == "uniform":
+                value = self._rng.uniform(self.mean - self.std, self.mean + self.std)
+            else:
+                value = self.mean
+        return max(0.0, value)
+
+    def wait(self, count: int = 1) -> float:
+        """休眠count次采样的延迟之和，返回休眠时间"""
+        latency = sum(self.sample_latency() for _ in range(count))
+        if latency > 0:
+            time.sleep(latency)
+        return latency
+
+    def fails(self, key: str) -> bool:
+        """
+        样本是否失败
+
+        按(seed, key)哈希决定，与调度顺序和线程数无关，多次运行结果一致
+        """
+        if self.failure_rate <= 0:
+            return False
+        return zlib.crc32(f"{self.seed}:{key}".encode("utf-8")) / 2 ** 32 < self.failure_rate
+
+    @property
+    def memory_mb(self) -> float:
+        """占用的内存（MB）"""
+        return len(self._ballast) / (1024 * 1024)
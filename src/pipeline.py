@@ -5,6 +5,10 @@ Main benchmark evaluation pipeline
 
 import json
 import importlib
+import inspect
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, Optional
 from tqdm import tqdm
@@ -13,8 +17,11 @@ import logging
 from .data import BenchmarkLoader, BenchmarkData, DataPair
 from .models.diffusion.base_diffusion import BaseDiffusionModel
 from .models.reward.base_reward import BaseRewardModel
-from .evaluation import Scorer, Reporter
-from .utils import decode_base64_image, save_image, setup_logger, PromptManager
+from .evaluation import (Scorer, Reporter, summarize_performance, current_rss_mb, peak_rss_mb, StratifiedSampler,
+                         SampleState, SequentialStopper, estimate_mean, estimate_stratified_mean, load_baseline,
+                         run_fingerprint)
+from .utils import (decode_base64_image, setup_logger, PromptManager, Tracer, set_tracer, AsyncImageWriter,
+                    ImageSpillStore)
 
 
 class BenchmarkPipeline:
@@ -50,6 +57,15 @@ class BenchmarkPipeline:
         self.logger.info("Initializing Benchmark Evaluation Pipeline")
         self.logger.info("="*60)
         
+        # 阶段计时（Chrome trace-event导出 / 报告中的性能摘要）；两者都关闭时span为空操作
+        self.trace_config = config.get("evaluation", {}).get("trace", {})
+        self.performance_summary = config.get("evaluation", {}).get("performance_summary", True)
+        self.tracer = Tracer(
+            enabled=self.trace_config.get("enabled", False) or self.performance_summary,
+            process_name="image_edit_benchmark"
+        )
+        set_tracer(self.tracer)
+        
         # 创建输出目录
         self._setup_output_dirs()
         
@@ -58,9 +74,14 @@ class BenchmarkPipeline:
         self.diffusion_model = self._load_diffusion_model()
         self.reward_model = self._load_reward_model()
         self.prompt_manager = PromptManager(config.get("prompts", {}))
+        bootstrap_config = config.get("evaluation", {}).get("bootstrap", {})
         self.scorer = Scorer(
             metrics=config.get("evaluation", {}).get("metrics", ["mean", "std", "median"]),
-            logger=self.logger
+            logger=self.logger,
+            bootstrap_resamples=bootstrap_config.get("num_resamples", 1000)
+            if bootstrap_config.get("enabled", True) else 0,
+            confidence_level=bootstrap_config.get("confidence_level", 0.95),
+            seed=bootstrap_config.get("seed", 0)
         )
         # 获取输出目录（兼容output_dir和results_dir两种配置）
         eval_config = self.config.get("evaluation", {})
@@ -76,6 +97,77 @@ class BenchmarkPipeline:
         self.resume_from_checkpoint = config.get("evaluation", {}).get("resume_from_checkpoint", False)
         self.checkpoint_data = self._load_checkpoint() if self.resume_from_checkpoint else {}
         
+        # 各类别的失败样本记录（失败样本不计入统计）
+        self.failures = {}
+        
+        # 多维度评分：每个样本按所有维度的prompt评分，图像只编码一次
+        multi_rubric_config = eval_config.get("multi_rubric", {})
+        self.rubrics = []
+        if multi_rubric_config.get("enabled", False):
+            self.rubrics = multi_rubric_config.get("rubrics") or self.prompt_manager.list_categories()
+            self.logger.info(f"Multi-rubric scoring enabled: {self.rubrics}")
+        self.rubric_scores = {}
+        
+        # 编辑结果的后台写入器（首次保存图像时创建）
+        self.image_writer = None
+        self._writer_lock = threading.Lock()
+        
+        # 内存受限模式：编辑结果溢写到磁盘（每次run创建），评分时按块读回
+        self.memory_config = eval_config.get("memory", {})
+        self.spill_store = None
+        # 最近一张溢写图像的像素字节数（估算评分块大小时使用，避免从磁盘读回图像）
+        self.spilled_image_bytes = 0
+        
+        # 阶段1编辑期间在后台预热评分模型（见BaseModel.prefetch），换入评分模型前等待其完成
+        self.prefetch_reward_model = eval_config.get("prefetch_reward_model", True)
+        # 模型切换的累计次数和耗时（自适应模式按类别报告）
+        self.swap_stats = {"count": 0, "seconds": 0.0}
+        self._prefetch_thread = None
+        
+        # 分层抽样快速评测：每个类别只处理确定性抽取的样本，报告中估计全量平均分（见evaluation.sampling）
+        self.sampling_config = eval_config.get("sampling", {})
+        self.sampler = None
+        self.sample_state = None
+        self.sampling_stats = {}
+        if self.sampling_config.get("enabled", False):
+            self.sampler = StratifiedSampler(
+                pairs_per_category=self.sampling_config.get("pairs_per_category", 20),
+                seed=self.sampling_config.get("seed", 0)
+            )
+            self.sample_state = SampleState(
+                self.sampling_config.get("state_path", "outputs/sampling_state.json"),
+                fingerprint=run_fingerprint(config),
+                logger=self.logger
+            )
+            self.logger.info(f"Sampling mode: {self.sampler.pairs_per_category} pairs per category "
+                             f"(seed {self.sampler.seed})")
+        
+        # 自适应评测：按随机顺序分批处理样本，类别的置信区间足够窄或与基线的比较已有定论时停止
+        self.adaptive_config = eval_config.get("adaptive", {})
+        self.stopper = None
+        self.baseline = {}
+        self.adaptive_stats = {}
+        self.edit_batches_per_swap = max(1, self.adaptive_config.get("edit_batches_per_swap", 4))
+        if self.adaptive_config.get("enabled", False):
+            if self.sampler is not None:
+                raise ValueError("evaluation.sampling and evaluation.adaptive cannot both be enabled")
+            self.sampler = StratifiedSampler(
+                pairs_per_category=self.adaptive_config.get("batch_size", 16),
+                seed=self.adaptive_config.get("seed", 0)
+            )
+            self.stopper = SequentialStopper(
+                target_half_width=self.adaptive_config.get("target_half_width", 0.1),
+                min_pairs=self.adaptive_config.get("min_pairs", 32),
+                confidence_level=self.adaptive_config.get("confidence_level", 0.99)
+            )
+            baseline_report = self.adaptive_config.get("baseline_report")
+            if baseline_report:
+                self.baseline = load_baseline(baseline_report)
+                self.logger.info(f"Adaptive mode baseline: {baseline_report} ({len(self.baseline)} categories)")
+            self.logger.info(f"Adaptive mode: batches of {self.sampler.pairs_per_category} pairs, "
+                             f"{self.edit_batches_per_swap} batches per model swap, "
+                             f"target CI half-width {self.stopper.target_half_width}")
+        
         self.logger.info("Pipeline initialized successfully")
     
     def _setup_output_dirs(self):
@@ -159,16 +251,31 @@ class BenchmarkPipeline:
         self.logger.info("="*80)
         self.logger.info("Starting benchmark evaluation (Two-Stage Processing)")
         self.logger.info("="*80)
+        run_start = time.perf_counter()
+        
+        if self.memory_config.get("spill_edited_images", False):
+            self.spill_store = ImageSpillStore(
+                spill_dir=self.memory_config.get("spill_dir", "outputs/spill"),
+                image_format=self.memory_config.get("spill_format", "BMP"),
+                logger=self.logger
+            )
         
         # 1. 加载benchmark数据
-        benchmark_data = self._load_benchmark_data()
+        with self.tracer.span("load"):
+            benchmark_data = self._load_benchmark_data()
         
         # 2. 初始化模型状态：确保Diffusion在GPU，Reward在CPU
         self.logger.info("\n" + "="*60)
         self.logger.info("[初始化] 设置模型状态")
         self.logger.info("="*60)
-        self.diffusion_model.load_to_gpu()  # 确保Diffusion在GPU
-        self.reward_model.unload_from_gpu()  # 确保Reward在CPU
+        with self.tracer.span("swap", target="diffusion"):
+            self.diffusion_model.load_to_gpu()  # 确保Diffusion在GPU
+            self.reward_model.unload_from_gpu()  # 确保Reward在CPU
+        
+        if self.prefetch_reward_model:
+            self._prefetch_thread = threading.Thread(target=self._prefetch_reward_model,
+                                                     name="RewardPrefetch", daemon=True)
+            self._prefetch_thread.start()
         
         # 3. 按类别处理数据
         category_scores = {}
@@ -179,7 +286,13 @@ class BenchmarkPipeline:
             self.logger.info(f"{'#'*80}")
             
             category_data = benchmark_data.get_category(category_name)
-            scores = self._process_category(category_data)
+            with self.tracer.span("category", category=category_name):
+                if self.stopper is not None:
+                    scores = self._process_adaptive_category(category_data)
+                elif self.sampler is not None:
+                    scores = self._process_sampled_category(category_data)
+                else:
+                    scores = self._process_category(category_data)
             category_scores[category_name] = scores
             
             # 更新CategoryData的scores
@@ -190,16 +303,23 @@ class BenchmarkPipeline:
                 self.logger.info(f"\n{'='*60}")
                 self.logger.info(f"[准备下一类别] 恢复模型状态：Diffusion → GPU, Reward → CPU")
                 self.logger.info(f"{'='*60}")
-                self.reward_model.unload_from_gpu()
-                self.diffusion_model.load_to_gpu()
+                self._swap_models("diffusion")
         
         # 4. 计算统计指标
         self.logger.info("\n" + "="*80)
         self.logger.info("Computing statistics...")
         self.logger.info("="*80)
         
-        category_statistics = self.scorer.compute_all_statistics(category_scores)
-        overall_statistics = self.scorer.compute_overall_statistics(category_scores)
+        with self.tracer.span("statistics"):
+            category_statistics = self.scorer.compute_all_statistics(category_scores)
+            overall_statistics = self.scorer.compute_overall_statistics(category_scores)
+            rubric_statistics = {
+                category: {
+                    rubric: self.scorer.compute_category_statistics(scores, f"{category}/{rubric}")
+                    for rubric, scores in rubric_scores.items()
+                }
+                for category, rubric_scores in self.rubric_scores.items()
+            }
         
         # 5. 生成报告
         self.logger.info("\n" + "="*60)
@@ -214,25 +334,253 @@ class BenchmarkPipeline:
             "categories": benchmark_data.category_names
         }
         
+        spill_stats = None
+        if self.spill_store is not None:
+            spill_stats = self.spill_store.cleanup()
+            self.spill_store = None
+        memory = self._memory_summary(spill_stats)
+        
+        sampling = None
+        adaptive = None
+        if self.stopper is not None:
+            adaptive = self._adaptive_report(category_scores)
+        elif self.sampler is not None:
+            sampling = self._sampling_report(category_scores)
+        
+        performance = None
+        if self.performance_summary:
+            performance = summarize_performance(self.tracer, time.perf_counter() - run_start)
+            if memory:
+                performance["memory"] = memory
+        
         report = self.reporter.generate_report(
             category_statistics=category_statistics,
             overall_statistics=overall_statistics,
-            metadata=metadata
+            metadata=metadata,
+            failures=self.failures,
+            rubric_statistics=rubric_statistics,
+            performance=performance,
+            sampling=sampling,
+            adaptive=adaptive
         )
         
-        # 6. 保存报告
-        json_path = self.reporter.save_report(report)
-        md_path = self.reporter.save_markdown_report(report)
+        # 6. 保存报告（先等待后台图像写入完成）
+        if self.image_writer is not None:
+            with self.tracer.span("flush_images"):
+                writer_stats = self.image_writer.close()
+            self.image_writer = None
+            self.logger.info(f"Saved {writer_stats['written']} edited images "
+                             f"({writer_stats['bytes'] / 1e6:.1f} MB, {writer_stats['failed']} failed)")
+        
+        with self.tracer.span("report"):
+            json_path = self.reporter.save_report(report)
+            md_path = self.reporter.save_markdown_report(report)
+        trace_path = self._save_trace()
         
         self.logger.info("\n" + "="*80)
         self.logger.info("✓ Evaluation completed successfully!")
         self.logger.info("="*80)
         self.logger.info(f"JSON report: {json_path}")
         self.logger.info(f"Markdown report: {md_path}")
+        if trace_path:
+            self.logger.info(f"Trace: {trace_path}")
         self.logger.info("="*80)
         
         return report
     
+    def _process_sampled_category(self, category_data) -> list:
+        """
+        抽样模式下处理单个类别：只编辑、评分抽中且尚未评分的样本，已保存的分数直接复用
+        
+        Returns:
+            抽中样本中成功评分的分数（包括复用的分数）
+        """
+        category_name = category_data.category_name
+        population = len(category_data)
+        sampled = self.sampler.sample(category_data)
+        restored = self.sample_state.restore(category_name, sampled)
+        restored_ids = {pair.pair_id for pair in restored}
+        pending = [pair for pair in sampled if pair.pair_id not in restored_ids]
+        self.logger.info(f"[抽样] {category_name}: 抽取 {len(sampled)}/{population} 个样本，"
+                         f"复用 {len(restored)} 个，新处理 {len(pending)} 个")
+        
+        # 复用的样本中降分辨率编辑的样本（与新处理的样本一起计入edit_degraded）
+        edit_degraded = self.sample_state.degraded_ids(category_name, restored)
+        if pending:
+            category_data.data_pairs = pending
+            self._process_category(category_data)
+            new_degraded = self.failures.get(category_name, {}).get("edit_degraded", [])
+            edit_degraded += new_degraded
+            self.sample_state.record(category_name, pending, new_degraded)
+            self.sample_state.save()
+        
+        # 统计覆盖全部抽中的样本
+        category_data.data_pairs = sampled
+        columns = category_data.columns()
+        self.failures[category_name] = {
+            "edit_failed": columns.ids_with_status("edit_failed"),
+            "score_failed": columns.ids_with_status("score_failed"),
+            "edit_degraded": edit_degraded
+        }
+        if self.rubrics:
+            self.rubric_scores[category_name] = self._collect_rubric_scores(sampled)
+        self.sampling_stats[category_name] = {
+            "population": population,
+            "sampled": len(sampled),
+            "reused": len(restored),
+            "new": len(pending)
+        }
+        return columns.scored()
+    
+    def _process_adaptive_category(self, category_data) -> list:
+        """
+        自适应模式下处理单个类别：按抽样顺序每轮编辑、评分edit_batches_per_swap批样本（每轮两次模型切换），
+        评分后按批检查停止条件（见SequentialStopper），满足时丢弃本轮停止点之后的样本并不再处理剩余样本
+        
+        Returns:
+            已处理样本中成功评分的分数
+        """
+        category_name = category_data.category_name
+        population = len(category_data)
+        order = self.sampler.order(category_data)
+        batch_size = self.sampler.pairs_per_category
+        baseline = self.baseline.get(category_name)
+        
+        round_size = batch_size * self.edit_batches_per_swap
+        swaps_before = dict(self.swap_stats)
+        
+        used = []
+        edit_degraded = []
+        decision = {}
+        processed = 0
+        while processed < population and not decision.get("stop"):
+            if processed:
+                # 下一轮的编辑阶段需要扩散模型
+                self._swap_models("diffusion")
+            round_pairs = order[processed:processed + round_size]
+            category_data.data_pairs = round_pairs
+            self._process_category(category_data)
+            round_degraded = set(self.failures[category_name]["edit_degraded"])
+            processed += len(round_pairs)
+            
+            # 按抽样顺序逐批检查停止条件（与每批切换一次模型时的停止点相同），停止点之后的样本不计入结果
+            for start in range(0, len(round_pairs), batch_size):
+                batch = round_pairs[start:start + batch_size]
+                used.extend(batch)
+                edit_degraded.extend(p.pair_id for p in batch if p.pair_id in round_degraded)
+                decision = self.stopper.check([p.score for p in used if p.status == "scored"],
+                                              population, len(used), baseline)
+                half_width = decision.get("ci_half_width")
+                self.logger.info(f"[自适应] {category_name}: 已使用 {len(used)}/{population} 个样本，"
+                                 f"CI半宽 {'n/a' if half_width is None else f'{half_width:.3f}'}")
+                if decision["stop"]:
+                    self.logger.info(f"[自适应] {category_name}: 停止（{decision['stop_reason']}），"
+                                     f"丢弃本轮多处理的 {processed - len(used)} 个样本")
+                    break
+        
+        category_data.data_pairs = used
+        columns = category_data.columns()
+        self.failures[category_name] = {
+            "edit_failed": columns.ids_with_status("edit_failed"),
+            "score_failed": columns.ids_with_status("score_failed"),
+            "edit_degraded": edit_degraded
+        }
+        if self.rubrics:
+            self.rubric_scores[category_name] = self._collect_rubric_scores(used)
+        decision.pop("stop", None)
+        self.adaptive_stats[category_name] = {
+            "pairs_used": len(used), **decision, "population": population,
+            "pairs_discarded": processed - len(used),
+            "swaps": self.swap_stats["count"] - swaps_before["count"],
+            "swap_seconds": self.swap_stats["seconds"] - swaps_before["seconds"]
+        }
+        return columns.scored()
+    
+    def _adaptive_report(self, category_scores: Dict[str, Any]) -> Dict[str, Any]:
+        """自适应评测的报告：各类别实际使用的样本数、停止原因、全量估计和与基线的比较"""
+        populations = {name: stats["population"] for name, stats in self.adaptive_stats.items()}
+        return {
+            "batch_size": self.sampler.pairs_per_category,
+            "edit_batches_per_swap": self.edit_batches_per_swap,
+            "seed": self.sampler.seed,
+            "target_half_width": self.stopper.target_half_width,
+            "confidence_level": self.stopper.confidence_level,
+            "baseline_report": self.adaptive_config.get("baseline_report"),
+            "pairs_used": sum(stats["pairs_used"] for stats in self.adaptive_stats.values()),
+            "swap_seconds": sum(stats["swap_seconds"] for stats in self.adaptive_stats.values()),
+            "categories": self.adaptive_stats,
+            "overall": estimate_stratified_mean(category_scores, populations, self.scorer.confidence_level)
+        }
+    
+    def _sampling_report(self, category_scores: Dict[str, Any]) -> Dict[str, Any]:
+        """抽样评测的报告：各类别及整体全量平均分的估计和置信区间"""
+        confidence_level = self.scorer.confidence_level
+        populations = {name: stats["population"] for name, stats in self.sampling_stats.items()}
+        categories = {
+            name: {**stats, **estimate_mean(category_scores[name], stats["population"], confidence_level)}
+            for name, stats in self.sampling_stats.items()
+        }
+        return {
+            "pairs_per_category": self.sampler.pairs_per_category,
+            "seed": self.sampler.seed,
+            "categories": categories,
+            "overall": estimate_stratified_mean(category_scores, populations, confidence_level)
+        }
+    
+    def _collect_rubric_scores(self, pairs: list) -> Dict[str, list]:
+        """成功评分的样本在各维度上的分数"""
+        scored_pairs = [p for p in pairs if p.status == "scored" and p.rubric_scores]
+        return {
+            rubric: [p.rubric_scores[rubric] for p in scored_pairs if p.rubric_scores.get(rubric) is not None]
+            for rubric in self.rubrics
+        }
+    
+    def _prefetch_reward_model(self):
+        """后台预热评分模型（失败只记录警告，评分前按原流程加载）"""
+        with self.tracer.span("prefetch", target="reward"):
+            try:
+                self.reward_model.prefetch()
+            except Exception as e:
+                self.logger.warning(f"Reward model prefetch failed: {e}")
+    
+    def _swap_models(self, target: str):
+        """切换GPU上的模型（target为"reward"或"diffusion"），累计切换次数和耗时"""
+        start = time.perf_counter()
+        with self.tracer.span("swap", target=target):
+            if target == "reward":
+                self.diffusion_model.unload_from_gpu()
+                self.reward_model.load_to_gpu()
+            else:
+                self.reward_model.unload_from_gpu()
+                self.diffusion_model.load_to_gpu()
+        self.swap_stats["count"] += 1
+        self.swap_stats["seconds"] += time.perf_counter() - start
+    
+    def _save_trace(self) -> Optional[str]:
+        """保存阶段计时trace（evaluation.trace.enabled为false时不保存）"""
+        if not self.trace_config.get("enabled", False):
+            return None
+        trace_path = self.trace_config.get("output_path")
+        if not trace_path:
+            eval_config = self.config.get("evaluation", {})
+            output_dir = eval_config.get("output_dir") or eval_config.get("results_dir", "outputs")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            trace_path = Path(output_dir) / f"trace_{timestamp}.json"
+        return self.tracer.save(trace_path)
+    
+    def _memory_summary(self, spill_stats: Optional[Dict[str, int]]) -> Optional[Dict[str, Any]]:
+        """内存预算与溢写统计（未启用溢写且未设置max_rss_mb时返回None），超出预算时告警"""
+        max_rss_mb = self.memory_config.get("max_rss_mb")
+        if spill_stats is None and not max_rss_mb:
+            return None
+        memory = {"max_rss_mb": max_rss_mb, "spill": spill_stats}
+        peak_rss = peak_rss_mb()
+        if max_rss_mb and peak_rss:
+            memory["within_budget"] = peak_rss["self"] <= max_rss_mb
+            if not memory["within_budget"]:
+                self.logger.warning(f"Peak RSS {peak_rss['self']:.0f} MB exceeded memory budget {max_rss_mb} MB")
+        return memory
+    
     def _load_benchmark_data(self) -> BenchmarkData:
         """加载benchmark数据"""
         benchmark_config = self.config.get("benchmark", {})
@@ -248,7 +596,8 @@ class BenchmarkPipeline:
         benchmark_data = self.data_loader.load(
             data_path=data_path,
             categories=categories,
-            decode_images=False  # 按需解码以节省内存
+            decode_images=False,  # 按需解码以节省内存
+            image_cache_dir=benchmark_config.get("image_cache_dir")
         )
         
         return benchmark_data
@@ -264,9 +613,10 @@ class BenchmarkPipeline:
             category_data: CategoryData对象
             
         Returns:
-            评分列表
+            评分数组（仅包含成功编辑并成功评分的样本，失败样本记录在self.failures中）
         """
         category_name = category_data.category_name
+        edit_degraded = []
         
         self.logger.info(f"\n{'='*60}")
         self.logger.info(f"[阶段1/2] 开始批量图像编辑 - {category_name}")
@@ -276,9 +626,9 @@ class BenchmarkPipeline:
         
         # 准备数据：解码所有图像
         self.logger.info(f"解码原始图像...")
-        for pair in category_data.data_pairs:
-            if pair.original_image is None:
-                pair.original_image = decode_base64_image(pair.original_image_b64)
+        with self.tracer.span("decode", category=category_name, num_images=len(category_data.data_pairs)):
+            for pair in category_data.data_pairs:
+                pair.load("original_image")
         
         # 收集所有图像和指令
         original_images = [pair.original_image for pair in category_data.data_pairs]
@@ -290,11 +640,21 @@ class BenchmarkPipeline:
         try:
             # 检查diffusion_model是否支持batch_edit
             if hasattr(self.diffusion_model, 'batch_edit'):
+                # 内存受限模式下，模型支持on_result时每张图像编辑完成即落盘释放
+                edit_kwargs = {}
+                if (self.spill_store is not None
+                        and "on_result" in inspect.signature(self.diffusion_model.batch_edit).parameters):
+                    pairs = category_data.data_pairs
+                    edit_kwargs["on_result"] = lambda index, image: self._store_edited_image(
+                        pairs[index], category_name, image)
+                
                 # 多GPU并行批量编辑
-                edited_images = self.diffusion_model.batch_edit(
-                    images=original_images,
-                    instructions=edit_instructions
-                )
+                with self.tracer.span("edit_stage", category=category_name, num_images=len(original_images)):
+                    edited_images = self.diffusion_model.batch_edit(
+                        images=original_images,
+                        instructions=edit_instructions,
+                        **edit_kwargs
+                    )
             else:
                 # 回退到逐张处理（单GPU模型）
                 self.logger.warning("Diffusion model不支持batch_edit，使用逐张处理")
@@ -307,13 +667,15 @@ class BenchmarkPipeline:
                     edited_images.append(edited_img)
                 pbar.close()
             
-            # 将编辑后的图像分配回pair对象
+            # 记录降分辨率重试成功的样本
+            for outcome in getattr(self.diffusion_model, "last_edit_outcomes", None) or []:
+                if outcome.status == "ok" and outcome.scale < 1.0:
+                    edit_degraded.append(category_data.data_pairs[outcome.index].pair_id)
+            
+            # 将编辑后的图像分配回pair对象（None表示重试后仍失败；路径表示已在on_result中处理）
             for pair, edited_image in zip(category_data.data_pairs, edited_images):
-                pair.edited_image = edited_image
-                
-                # 保存编辑后的图像到磁盘（如果需要）
-                if self.config.get("evaluation", {}).get("save_generated_images", False):
-                    self._save_edited_image(pair, category_name)
+                if not isinstance(edited_image, str):
+                    self._store_edited_image(pair, category_name, edited_image)
         
         except Exception as e:
             self.logger.error(f"Error during batch editing: {e}")
@@ -326,22 +688,29 @@ class BenchmarkPipeline:
                         original_image=pair.original_image,
                         edit_instruction=pair.edit_instruction
                     )
-                    pair.edited_image = edited_image
-                    
-                    if self.config.get("evaluation", {}).get("save_generated_images", False):
-                        self._save_edited_image(pair, category_name)
+                    self._store_edited_image(pair, category_name, edited_image)
                 except Exception as e2:
                     self.logger.error(f"Error editing image for pair {pair.pair_id}: {e2}")
                     pair.edited_image = None
+                    pair.status = "edit_failed"
             pbar_edit.close()
         
+        # 内存受限模式下原图也在评分时按块重新解码
+        if self.spill_store is not None:
+            for pair in category_data.data_pairs:
+                pair.drop("original_image")
+        
         # ===== 模型切换：卸载Diffusion，加载Reward =====
         self.logger.info(f"\n{'='*60}")
         self.logger.info(f"[模型切换] 卸载Diffusion模型，加载Reward模型")
         self.logger.info(f"{'='*60}")
         
-        self.diffusion_model.unload_from_gpu()
-        self.reward_model.load_to_gpu()
+        if self._prefetch_thread is not None:
+            with self.tracer.span("prefetch_wait"):
+                self._prefetch_thread.join()
+            self._prefetch_thread = None
+        
+        self._swap_models("reward")
         
         # ===== 阶段2: 批量图像评分 =====
         self.logger.info(f"\n{'='*60}")
@@ -350,18 +719,16 @@ class BenchmarkPipeline:
         
         # 收集所有有效的待评分数据
         valid_pairs = []
-        valid_indices = []
-        edited_images = []
         original_descriptions = []
         edit_instructions = []
         system_prompts = []
         user_prompts = []
-        original_images = []
         
-        for idx, pair in enumerate(category_data.data_pairs):
+        for pair in category_data.data_pairs:
             # 检查是否成功编辑
-            if pair.edited_image is None:
+            if not pair.is_available("edited_image"):
                 self.logger.warning(f"Pair {pair.pair_id} 没有编辑后的图像，跳过评分")
+                pair.status = "edit_failed"
                 continue
             
             try:
@@ -374,55 +741,81 @@ class BenchmarkPipeline:
                 
                 # 收集数据
                 valid_pairs.append(pair)
-                valid_indices.append(idx)
-                edited_images.append(pair.edited_image)
                 original_descriptions.append(pair.original_description)
                 edit_instructions.append(pair.edit_instruction)
                 system_prompts.append(prompts["system_prompt"])
                 user_prompts.append(prompts["user_prompt"])
-                original_images.append(pair.original_image)
                 
             except Exception as e:
                 self.logger.error(f"Error preparing pair {pair.pair_id} for scoring: {e}")
+                pair.status = "score_failed"
                 continue
         
         # 使用batch inference评分
-        scores = [0.0] * len(category_data.data_pairs)  # 初始化所有分数为0
         
         if valid_pairs:
             self.logger.info(f"[Qwen3VLRewardModel] 准备评分 {len(valid_pairs)} 张有效图像...")
+            use_original = self.reward_model.uses_original_image
             
             try:
                 # 获取batch_size配置
                 batch_size = self.config.get("reward_model", {}).get("params", {}).get("batch_size", 4)
                 use_batch_inference = self.config.get("reward_model", {}).get("params", {}).get("use_batch_inference", True)
                 
-                # 批量评分
-                batch_scores = self.reward_model.batch_score(
-                    edited_images=edited_images,
-                    original_descriptions=original_descriptions,
-                    edit_instructions=edit_instructions,
-                    system_prompts=system_prompts,
-                    user_prompts=user_prompts,
-                    original_images=original_images,
-                    batch_size=batch_size,
-                    use_batch_inference=use_batch_inference
-                )
+                # 批量评分（按块读入图像，每块评分完成后释放；评分模型不对比原图时不读取原图）
+                chunk_size = self._score_chunk_size(valid_pairs)
+                batch_scores = []
+                with self.tracer.span("score_stage", category=category_name, num_images=len(valid_pairs)):
+                    for start in range(0, len(valid_pairs), chunk_size):
+                        chunk = slice(start, start + chunk_size)
+                        chunk_pairs = valid_pairs[chunk]
+                        chunk_images = [pair.edited_image for pair in chunk_pairs]
+                        chunk_originals = [pair.original_image for pair in chunk_pairs] if use_original else None
+                        chunk_b64s = [pair.original_image_b64 for pair in chunk_pairs] if use_original else None
+                        if self.rubrics:
+                            batch_scores.extend(self._score_rubrics(
+                                category_name,
+                                chunk_pairs,
+                                edited_images=chunk_images,
+                                original_images=chunk_originals,
+                                batch_size=batch_size,
+                                use_batch_inference=use_batch_inference
+                            ))
+                        else:
+                            batch_scores.extend(self.reward_model.batch_score(
+                                edited_images=chunk_images,
+                                original_descriptions=original_descriptions[chunk],
+                                edit_instructions=edit_instructions[chunk],
+                                system_prompts=system_prompts[chunk],
+                                user_prompts=user_prompts[chunk],
+                                original_images=chunk_originals,
+                                original_image_b64s=chunk_b64s,
+                                batch_size=batch_size,
+                                use_batch_inference=use_batch_inference
+                            ))
+                        del chunk_images, chunk_originals, chunk_b64s
+                        self._release_images(chunk_pairs)
                 
-                # 将分数分配回对应的pair
-                for pair, idx, score in zip(valid_pairs, valid_indices, batch_scores):
+                # 将分数分配回对应的pair（None表示评分失败）
+                for pair, score in zip(valid_pairs, batch_scores):
+                    if score is None:
+                        pair.status = "score_failed"
+                        self.logger.warning(f"Pair {pair.pair_id}: 评分失败，排除出统计")
+                        continue
                     pair.score = score
-                    scores[idx] = score
+                    pair.status = "scored"
                     self.logger.debug(f"Pair {pair.pair_id}: score={score:.3f}")
                 
-                self.logger.info(f"✅ 评分完成，平均分: {sum(batch_scores)/len(batch_scores):.3f}")
+                valid_scores = [score for score in batch_scores if score is not None]
+                if valid_scores:
+                    self.logger.info(f"✅ 评分完成，平均分: {sum(valid_scores)/len(valid_scores):.3f}")
                 
             except Exception as e:
                 self.logger.error(f"Error in batch scoring: {e}")
                 self.logger.warning("Falling back to sequential scoring...")
                 
                 # 回退到逐个评分
-                for pair, idx in zip(valid_pairs, valid_indices):
+                for pair in valid_pairs:
                     try:
                         prompts = self.prompt_manager.get_full_prompt(
                             category=category_name,
@@ -436,43 +829,199 @@ class BenchmarkPipeline:
                             edit_instruction=pair.edit_instruction,
                             system_prompt=prompts["system_prompt"],
                             user_prompt=prompts["user_prompt"],
-                            original_image=pair.original_image
+                            original_image=pair.original_image if use_original else None
                         )
                         
                         pair.score = score
-                        scores[idx] = score
+                        pair.status = "scored"
                         
                     except Exception as e2:
                         self.logger.error(f"Error scoring pair {pair.pair_id}: {e2}")
-                        pair.score = 0.0
-                        scores[idx] = 0.0
+                        pair.score = None
+                        pair.status = "score_failed"
+                    finally:
+                        self._release_images([pair])
         else:
             self.logger.warning("没有有效的图像需要评分")
         
-        # ===== 类别处理完成 =====
+        # ===== 类别处理完成：释放本类别的图像 =====
+        for pair in category_data.data_pairs:
+            pair.drop("original_image", "edited_image")
+            pair.release("original_image_b64")
+        if self.spill_store is not None:
+            self.spill_store.discard(category_name)
+        
+        # 统计与失败记录使用列式视图
+        columns = category_data.columns()
+        scores = columns.scored()
+        self.failures[category_name] = {
+            "edit_failed": columns.ids_with_status("edit_failed"),
+            "score_failed": columns.ids_with_status("score_failed"),
+            "edit_degraded": edit_degraded
+        }
+        if self.rubrics:
+            self.rubric_scores[category_name] = self._collect_rubric_scores(category_data.data_pairs)
+        num_failed = len(category_data.data_pairs) - len(scores)
+        
         self.logger.info(f"\n{'='*60}")
-        self.logger.info(f"[完成] {category_name} - 共处理 {len(scores)} 个样本")
-        self.logger.info(f"平均分: {sum(scores)/len(scores):.3f}")
+        self.logger.info(f"[完成] {category_name} - 共处理 {len(category_data.data_pairs)} 个样本，"
+                         f"有效 {len(scores)} 个，失败 {num_failed} 个（不计入统计）")
+        if len(scores):
+            self.logger.info(f"平均分: {scores.mean():.3f}")
         self.logger.info(f"{'='*60}\n")
         
         return scores
     
-    def _save_edited_image(self, pair: DataPair, category_name: str):
-        """保存编辑后的图像"""
-        if pair.edited_image is None:
-            return
+    def _score_rubrics(self,
+                       category_name: str,
+                       pairs: list,
+                       edited_images: list,
+                       original_images: list,
+                       **kwargs) -> list:
+        """
+        多维度评分：每个样本按self.rubrics中所有维度的prompt评分
         
-        images_dir = Path(self.config["evaluation"]["images_dir"])
-        category_dir = images_dir / category_name
-        category_dir.mkdir(parents=True, exist_ok=True)
+        各维度分数保存在pair.rubric_scores中；返回的主分数为本类别维度的分数
+        （本类别不在维度列表中时取各维度平均），用于原有的类别统计
         
-        image_path = category_dir / f"{pair.pair_id}.png"
+        Args:
+            category_name: 类别名称
+            pairs: 待评分的数据对
+            edited_images: 对应的编辑后图像
+            original_images: 对应的原始图像
+            **kwargs: 透传给batch_score_multi的参数
+            
+        Returns:
+            主分数列表（评分失败的样本为None）
+        """
+        rubric_prompts = [
+            [
+                self.prompt_manager.get_full_prompt(
+                    category=rubric,
+                    original_description=pair.original_description,
+                    edit_instruction=pair.edit_instruction
+                )
+                for rubric in self.rubrics
+            ]
+            for pair in pairs
+        ]
+        
+        score_vectors = self.reward_model.batch_score_multi(
+            edited_images=edited_images,
+            original_descriptions=[pair.original_description for pair in pairs],
+            edit_instructions=[pair.edit_instruction for pair in pairs],
+            rubric_prompts=rubric_prompts,
+            original_images=original_images,
+            original_image_b64s=[pair.original_image_b64 for pair in pairs] if original_images is not None else None,
+            **kwargs
+        )
         
-        try:
-            save_image(pair.edited_image, str(image_path))
-            self.logger.debug(f"Saved edited image: {image_path}")
-        except Exception as e:
-            self.logger.warning(f"Failed to save image for {pair.pair_id}: {e}")
+        primary_scores = []
+        for pair, vector in zip(pairs, score_vectors):
+            if vector is None or any(score is None for score in vector):
+                primary_scores.append(None)
+                continue
+            pair.rubric_scores = dict(zip(self.rubrics, vector))
+            if category_name in pair.rubric_scores:
+                primary_scores.append(pair.rubric_scores[category_name])
+            else:
+                primary_scores.append(sum(vector) / len(vector))
+        
+        return primary_scores
+    
+    def _store_edited_image(self, pair: DataPair, category_name: str, edited_image) -> Any:
+        """
+        记录编辑结果：按配置保存到输出目录；内存受限模式下溢写到磁盘，pair中只保留路径
+        （可能在batch_edit的工作线程中调用）
+        
+        Returns:
+            溢写路径（内存受限模式）或图像本身，编辑失败时为None
+        """
+        pair.edited_image = None
+        pair.set_loader("edited_image", None)
+        if edited_image is None:
+            pair.status = "edit_failed"
+            return None
+        
+        if self.config.get("evaluation", {}).get("save_generated_images", False):
+            self._save_edited_image(pair, category_name, edited_image)
+        
+        pair.status = "edited"
+        if self.spill_store is None:
+            pair.edited_image = edited_image
+            return edited_image
+        self.spilled_image_bytes = edited_image.width * edited_image.height * len(edited_image.getbands())
+        pair.edited_image_ref = self.spill_store.put(category_name, pair.pair_id, edited_image)
+        pair.set_loader("edited_image", self._load_spilled_image)
+        return pair.edited_image_ref
+    
+    @staticmethod
+    def _release_images(pairs: list) -> None:
+        """
+        释放一块样本在评分时读入的图像和原图base64
+        
+        只释放可由loader重新读回的字段（溢写的编辑结果、由base64解码的原图、磁盘缓存的base64），
+        评分失败回退到逐个评分时仍可读回；全内存模式下的编辑结果保留到类别结束
+        """
+        for pair in pairs:
+            pair.release("edited_image", "original_image", "original_image_b64")
+    
+    def _load_spilled_image(self, pair: DataPair):
+        """溢写图像的loader：从磁盘读回编辑结果"""
+        return self.spill_store.get(pair.edited_image_ref)
+    
+    def _score_chunk_size(self, pairs: list) -> int:
+        """
+        评分阶段每块的图像数
+        
+        memory.score_chunk_size优先；否则设置了memory.max_rss_mb时按剩余内存估算；
+        都未设置时一次评分全部图像
+        """
+        chunk_size = self.memory_config.get("score_chunk_size")
+        if chunk_size:
+            return max(1, int(chunk_size))
+        
+        max_rss_mb = self.memory_config.get("max_rss_mb")
+        rss_mb = current_rss_mb()
+        if not max_rss_mb or rss_mb is None or not pairs:
+            return max(1, len(pairs))
+        
+        # 每张图像按编辑结果与原图的像素字节估算，并为评分时的编码/预处理副本留出同等余量
+        # （溢写模式使用溢写时记录的尺寸，不从磁盘读回图像）
+        image_bytes = self.spilled_image_bytes if self.spill_store is not None else 0
+        if not image_bytes:
+            image = pairs[0].edited_image
+            image_bytes = image.width * image.height * len(image.getbands())
+            self._release_images(pairs[:1])
+        per_image_mb = image_bytes * 3 / (1024 * 1024)
+        chunk_size = int((max_rss_mb - rss_mb) / per_image_mb) if per_image_mb > 0 else len(pairs)
+        chunk_size = max(1, min(len(pairs), chunk_size))
+        self.logger.info(f"Score chunk size: {chunk_size} (RSS {rss_mb:.0f} MB, budget {max_rss_mb} MB)")
+        return chunk_size
+    
+    def _save_edited_image(self, pair: DataPair, category_name: str, edited_image=None):
+        """提交编辑后的图像到后台写入器（写入队列已满时阻塞）"""
+        edited_image = edited_image if edited_image is not None else pair.edited_image
+        if edited_image is None:
+            return
+        
+        with self._writer_lock:
+            if self.image_writer is None:
+                writer_config = self.config.get("evaluation", {}).get("image_writer", {})
+                self.image_writer = AsyncImageWriter(
+                    num_workers=writer_config.get("workers", 2),
+                    max_pending=writer_config.get("max_pending", 32),
+                    image_format=writer_config.get("format", "PNG"),
+                    compress_level=writer_config.get("compress_level", None),
+                    lossless=writer_config.get("lossless", True),
+                    quality=writer_config.get("quality", None),
+                    fsync=writer_config.get("fsync", False),
+                    logger=self.logger
+                )
+        
+        images_dir = Path(self.config.get("evaluation", {}).get("images_dir", "outputs/images"))
+        image_path = self.image_writer.path_for(images_dir / category_name, pair.pair_id)
+        self.image_writer.submit(edited_image, str(image_path))
     
     def run_single_pair(self, 
                        original_image_b64: str,
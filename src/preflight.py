@@ -0,0 +1,294 @@
+"""
+Preflight validation
+运行前检查（不加载模型，几秒内完成）
+
+在加载模型之前检查一次运行所需的全部条件：模型class_path可导入、数据可解析、
+每个样本的每个prompt都能渲染、输出目录可写、磁盘空间足够，并估算本次运行的资源需求。
+避免某个类别的prompt笔误在阶段1的GPU编辑全部完成后才暴露。
+"""
+
+import base64
+import binascii
+import importlib
+import io
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from .data import BenchmarkLoader
+from .models.diffusion.base_diffusion import BaseDiffusionModel
+from .models.reward.base_reward import BaseRewardModel
+from .utils import PromptManager
+
+# 估算图像尺寸时每个类别抽样的样本数
+SAMPLE_PER_CATEGORY = 8
+
+# 每个渲染错误最多列出的样本ID数
+MAX_EXAMPLES = 5
+
+
+class PreflightChecker:
+    """
+    运行前检查器
+
+    每项检查记录为{"name", "status", "message"}，status为ok、warning或error；
+    有error时不应启动运行
+    """
+
+    def __init__(self, config: Dict[str, Any], logger: Optional[logging.Logger] = None):
+        """
+        初始化检查器
+
+        Args:
+            config: 配置字典（与BenchmarkPipeline相同）
+            logger: 日志记录器（可选）
+        """
+        self.config = config
+        self.eval_config = config.get("evaluation", {})
+        self.logger = logger or logging.getLogger(__name__)
+        self.checks: List[Dict[str, str]] = []
+        self.estimate: Dict[str, Any] = {}
+
+    def _record(self, name: str, status: str, message: str) -> None:
+        self.checks.append({"name": name, "status": status, "message": message})
+
+    def run(self) -> Dict[str, Any]:
+        """
+        执行全部检查
+
+        Returns:
+            {"ok": 无error, "checks": [...], "estimate": 资源估算}
+        """
+        self.check_models()
+        benchmark_data = self.check_data()
+        if benchmark_data is not None:
+            self.check_prompts(benchmark_data)
+            self.estimate_resources(benchmark_data)
+        self.check_output_dirs()
+        self.check_disk_space()
+        return {
+            "ok": not any(check["status"] == "error" for check in self.checks),
+            "checks": self.checks,
+            "estimate": self.estimate,
+        }
+
+    def check_models(self) -> None:
+        """检查模型class_path可导入且继承自对应的基类（不实例化模型）"""
+        for section, base_class in (("diffusion_model", BaseDiffusionModel), ("reward_model", BaseRewardModel)):
+            model_config = self.config.get(section, {})
+            class_path = model_config.get("class_path")
+            name = f"{section}.class_path"
+            if not class_path or "." not in class_path:
+                self._record(name, "error", f"{section}.class_path not specified")
+                continue
+            module_path, class_name = class_path.rsplit(".", 1)
+            try:
+                model_class = getattr(importlib.import_module(module_path), class_name)
+            except Exception as e:
+                self._record(name, "error", f"Cannot import {class_path}: {type(e).__name__}: {e}")
+                continue
+            if not (isinstance(model_class, type) and issubclass(model_class, base_class)):
+                self._record(name, "error", f"{class_path} is not a {base_class.__name__}")
+                continue
+            self._record(name, "ok", class_path)
+
+            # 子进程评分模型：检查评分脚本和解释器
+            params = model_config.get("params", {})
+            for key in ("script_path", "python_path"):
+                if params.get(key) and not Path(params[key]).exists():
+                    self._record(f"{section}.params.{key}", "error", f"Not found: {params[key]}")
+
+    def check_data(self):
+        """解析数据索引，检查各类别都有数据、每个样本都带有图像"""
+        benchmark_config = self.config.get("benchmark", {})
+        data_path = benchmark_config.get("data_path")
+        categories = benchmark_config.get("categories", [])
+        if not data_path or not categories:
+            self._record("benchmark", "error", "benchmark.data_path and benchmark.categories are required")
+            return None
+        try:
+            benchmark_data = BenchmarkLoader(logger=self.logger).load(data_path, categories, decode_images=False)
+        except Exception as e:
+            self._record("benchmark.data_path", "error", f"Cannot load {data_path}: {type(e).__name__}: {e}")
+            return None
+
+        missing = [c for c in categories if c not in benchmark_data.categories]
+        if missing:
+            self._record("benchmark.categories", "error", f"No data for categories: {missing}")
+        self._record("benchmark.data_path", "ok",
+                     f"{benchmark_data.total_pairs} pairs in {len(benchmark_data.category_names)} categories")
+
+        bad_images = []
+        for pair in benchmark_data.get_all_pairs():
+            if not pair.original_image_b64:
+                bad_images.append(pair.pair_id)
+        if bad_images:
+            self._record("benchmark.images", "error",
+                         f"{len(bad_images)} pairs without image data, e.g. {bad_images[:MAX_EXAMPLES]}")
+        return benchmark_data
+
+    def check_prompts(self, benchmark_data) -> None:
+        """为每个样本渲染其类别（及多维度评分的全部维度）的prompt"""
+        try:
+            prompt_manager = PromptManager(self.config.get("prompts", {}))
+        except Exception as e:
+            self._record("prompts", "error", str(e))
+            return
+
+        multi_rubric = self.eval_config.get("multi_rubric", {})
+        rubrics = []
+        if multi_rubric.get("enabled", False):
+            rubrics = multi_rubric.get("rubrics") or prompt_manager.list_categories()
+
+        # (渲染的类别, 错误信息) -> 出错的样本ID
+        errors: Dict[tuple, List[str]] = {}
+        num_rendered = 0
+        for category_name in benchmark_data.category_names:
+            for pair in benchmark_data.get_category(category_name).data_pairs:
+                for prompt_category in [category_name] + [r for r in rubrics if r != category_name]:
+                    try:
+                        prompt_manager.get_full_prompt(
+                            category=prompt_category,
+                            original_description=pair.original_description,
+                            edit_instruction=pair.edit_instruction
+                        )
+                        num_rendered += 1
+                    except Exception as e:
+                        errors.setdefault((prompt_category, f"{type(e).__name__}: {e}"), []).append(pair.pair_id)
+
+        for (prompt_category, message), pair_ids in errors.items():
+            self._record(f"prompts.{prompt_category}", "error",
+                         f"{message} ({len(pair_ids)} pairs, e.g. {pair_ids[:MAX_EXAMPLES]})")
+        if not errors:
+            self._record("prompts", "ok", f"{num_rendered} prompts rendered")
+
+    def estimate_resources(self, benchmark_data) -> None:
+        """
+        估算资源需求：模型调用次数、主机内存和磁盘
+
+        图像尺寸由每个类别的少量样本的图像头估算（不解码像素）
+        """
+        pixel_counts = []
+        for category_name in benchmark_data.category_names:
+            for pair in benchmark_data.get_category(category_name).data_pairs[:SAMPLE_PER_CATEGORY]:
+                size = _image_size(pair.original_image_b64)
+                if size:
+                    pixel_counts.append(size[0] * size[1])
+        mean_pixels = sum(pixel_counts) / len(pixel_counts) if pixel_counts else 0
+        raw_mb = mean_pixels * 3 / (1024 * 1024)
+
+        category_sizes = {name: len(benchmark_data.get_category(name)) for name in benchmark_data.category_names}
+        largest = max(category_sizes.values(), default=0)
+        multi_rubric = self.eval_config.get("multi_rubric", {})
+        num_rubrics = len(multi_rubric.get("rubrics") or self.config.get("prompts", {})) \
+            if multi_rubric.get("enabled", False) else 1
+
+        memory_config = self.eval_config.get("memory", {})
+        data_mb = Path(self.config["benchmark"]["data_path"]).stat().st_size / (1024 * 1024)
+        if memory_config.get("spill_edited_images", False):
+            # 溢写模式：同时驻留的图像受评分块大小限制
+            resident = min(largest, memory_config.get("score_chunk_size") or largest)
+        else:
+            resident = largest
+        spill_mb = largest * raw_mb if memory_config.get("spill_edited_images", False) else 0.0
+        saved_mb = benchmark_data.total_pairs * raw_mb if self.eval_config.get("save_generated_images", False) else 0.0
+
+        self.estimate = {
+            "total_pairs": benchmark_data.total_pairs,
+            "pairs_per_category": category_sizes,
+            "mean_megapixels": mean_pixels / 1e6,
+            "edit_calls": benchmark_data.total_pairs,
+            "score_calls": benchmark_data.total_pairs * num_rubrics,
+            "model_swaps": 2 * len(category_sizes),
+            # 数据索引（base64常驻内存）+ 同时驻留的原图和编辑结果
+            "host_memory_mb": data_mb + resident * 2 * raw_mb,
+            # 输出图像按未压缩大小估算（上限），溢写目录同时只保存一个类别
+            "disk_mb": saved_mb + spill_mb,
+        }
+
+    def check_output_dirs(self) -> None:
+        """创建输出目录并检查可写"""
+        output_dir = self.eval_config.get("output_dir") or self.eval_config.get("results_dir", "outputs")
+        dirs = [
+            output_dir,
+            self.eval_config.get("results_dir", "outputs/results"),
+            self.eval_config.get("images_dir", "outputs/images"),
+            self.eval_config.get("logs_dir", "outputs/logs"),
+        ]
+        memory_config = self.eval_config.get("memory", {})
+        if memory_config.get("spill_edited_images", False):
+            dirs.append(memory_config.get("spill_dir", "outputs/spill"))
+        trace_path = self.eval_config.get("trace", {}).get("output_path")
+        if trace_path:
+            dirs.append(str(Path(trace_path).parent))
+
+        not_writable = []
+        for directory in dict.fromkeys(dirs):
+            try:
+                Path(directory).mkdir(parents=True, exist_ok=True)
+                with tempfile.TemporaryFile(dir=directory):
+                    pass
+            except OSError as e:
+                not_writable.append(f"{directory} ({e.strerror or e})")
+        if not_writable:
+            self._record("output_dirs", "error", f"Not writable: {not_writable}")
+        else:
+            self._record("output_dirs", "ok", ", ".join(dict.fromkeys(dirs)))
+
+    def check_disk_space(self) -> None:
+        """检查输出目录所在磁盘的剩余空间是否满足估算需求"""
+        output_dir = self.eval_config.get("output_dir") or self.eval_config.get("results_dir", "outputs")
+        try:
+            free_mb = shutil.disk_usage(output_dir).free / (1024 * 1024)
+        except OSError as e:
+            self._record("disk_space", "warning", f"Cannot stat {output_dir}: {e}")
+            return
+        need_mb = self.estimate.get("disk_mb", 0.0)
+        self.estimate["disk_free_mb"] = free_mb
+        if need_mb > free_mb:
+            self._record("disk_space", "warning",
+                         f"Estimated need {need_mb:.0f} MB exceeds free space {free_mb:.0f} MB")
+        else:
+            self._record("disk_space", "ok", f"{free_mb:.0f} MB free, estimated need {need_mb:.0f} MB")
+
+
+def _image_size(image_b64: Optional[str]) -> Optional[tuple]:
+    """只读取图像头得到(宽, 高)，无效时返回None"""
+    if not image_b64:
+        return None
+    data = image_b64.split(',', 1)[1] if ',' in image_b64 else image_b64
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(data))) as image:
+            return image.size
+    except (binascii.Error, OSError, ValueError):
+        return None
+
+
+def run_preflight(config: Dict[str, Any], logger: Optional[logging.Logger] = None) -> Dict[str, Any]:
+    """执行运行前检查（见PreflightChecker）"""
+    return PreflightChecker(config, logger=logger).run()
+
+
+def format_preflight(report: Dict[str, Any]) -> str:
+    """生成检查结果文本"""
+    lines = []
+    for check in report["checks"]:
+        lines.append(f"[{check['status'].upper():>7}] {check['name']}: {check['message']}")
+
+    estimate = report.get("estimate", {})
+    if "total_pairs" in estimate:
+        lines.append("")
+        lines.append("Estimated resources:")
+        lines.append(f"  pairs: {estimate['total_pairs']} ({estimate['mean_megapixels']:.2f} MP mean)")
+        lines.append(f"  edit calls: {estimate['edit_calls']}, score calls: {estimate['score_calls']}, "
+                     f"model swaps: {estimate['model_swaps']}")
+        lines.append(f"  host memory: ~{estimate['host_memory_mb']:.0f} MB")
+        lines.append(f"  disk: ~{estimate['disk_mb']:.0f} MB")
+
+    lines.append("")
+    lines.append("Preflight passed" if report["ok"] else "Preflight FAILED")
+    return "\n".join(lines)
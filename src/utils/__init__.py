@@ -4,15 +4,30 @@ Utility modules
 """
 
 from .image_utils import decode_base64_image, encode_image_to_base64, save_image
+from .image_store import ImageContentStore, ImageSpillStore
+from .async_writer import AsyncImageWriter
 from .logger import setup_logger
 from .prompt_manager import PromptManager
+from .tracing import Tracer, get_tracer, set_tracer
+from .import_profile import profile_imports, format_import_report
+from .weight_prefetch import model_weight_files, prefetch_files
 
 __all__ = [
     "decode_base64_image",
     "encode_image_to_base64", 
     "save_image",
+    "ImageContentStore",
+    "ImageSpillStore",
+    "AsyncImageWriter",
     "setup_logger",
-    "PromptManager"
+    "PromptManager",
+    "Tracer",
+    "get_tracer",
+    "set_tracer",
+    "profile_imports",
+    "format_import_report",
+    "model_weight_files",
+    "prefetch_files"
 ]
 
 
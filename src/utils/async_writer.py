@@ -0,0 +1,144 @@
+"""
+Asynchronous image writer
+后台图像写入器
+
+编辑结果的编码和写盘在后台线程中进行，与评分阶段重叠；
+队列有上限（写盘跟不上时submit阻塞，避免图像在内存中堆积），
+flush()作为写入屏障，在生成报告前确保所有图像已落盘。
+"""
+
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+# 格式 -> 文件扩展名
+FORMAT_EXTENSIONS = {"PNG": ".png", "WEBP": ".webp", "JPEG": ".jpg", "BMP": ".bmp"}
+
+_STOP = object()
+
+
+class AsyncImageWriter:
+    """
+    后台图像写入线程池
+
+    文件先写入临时文件再原子重命名，中断时不会留下不完整的图像
+    """
+
+    def __init__(self,
+                 num_workers: int = 2,
+                 max_pending: int = 32,
+                 image_format: str = "PNG",
+                 compress_level: Optional[int] = None,
+                 lossless: bool = True,
+                 quality: Optional[int] = None,
+                 fsync: bool = False,
+                 logger: Optional[logging.Logger] = None):
+        """
+        初始化写入器
+
+        Args:
+            num_workers: 写入线程数（0表示在调用线程中同步写入）
+            max_pending: 队列中最多等待写入的图像数（达到后submit阻塞）
+            image_format: 图像格式（PNG, WEBP, JPEG, BMP）
+            compress_level: PNG压缩级别（0-9，越小越快，None为PIL默认的6）
+            lossless: WEBP是否无损
+            quality: WEBP/JPEG质量（可选）
+            fsync: 是否在每个文件写入后fsync
+            logger: 日志记录器（可选）
+        """
+        self.image_format = image_format.upper()
+        if self.image_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.extension = FORMAT_EXTENSIONS[self.image_format]
+        self.fsync = fsync
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.save_params: Dict[str, Any] = {}
+        if self.image_format == "PNG" and compress_level is not None:
+            self.save_params["compress_level"] = compress_level
+        if self.image_format == "WEBP":
+            self.save_params["lossless"] = lossless
+        if quality is not None and self.image_format in ("WEBP", "JPEG"):
+            self.save_params["quality"] = quality
+
+        self.stats = {"written": 0, "failed": 0, "bytes": 0}
+        self._stats_lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_pending))
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"ImageWriter-{k}", daemon=True)
+            for k in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def path_for(self, directory: str, stem: str) -> Path:
+        """按当前格式生成文件路径"""
+        return Path(directory) / f"{stem}{self.extension}"
+
+    def submit(self, image: Image.Image, path: str) -> None:
+        """
+        提交一张图像（队列已满时阻塞，直到有图像写完）
+
+        Args:
+            image: PIL图像
+            path: 目标文件路径
+        """
+        if not self._workers:
+            self._write(image, Path(path))
+            return
+        self._queue.put((image, Path(path)))
+
+    def flush(self) -> Dict[str, int]:
+        """等待已提交的图像全部写完，返回写入统计"""
+        if self._workers:
+            self._queue.join()
+        return dict(self.stats)
+
+    def close(self) -> Dict[str, int]:
+        """写完剩余图像并停止写入线程"""
+        stats = self.flush()
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        return stats
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, image: Image.Image, path: Path) -> None:
+        """编码并原子写入单张图像（失败只记录，不抛出）"""
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                image.save(f, format=self.image_format, **self.save_params)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+                size = f.tell()
+            os.replace(tmp_path, path)
+            with self._stats_lock:
+                self.stats["written"] += 1
+                self.stats["bytes"] += size
+        except Exception as e:
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            with self._stats_lock:
+                self.stats["failed"] += 1
+            self.logger.warning(f"Failed to save image {path}: {e}")
@@ -0,0 +1,179 @@
+"""
+Image stores
+磁盘图像存储
+
+ImageContentStore用于向评分子进程传递原图：每张原图只写入磁盘一次，
+之后的batch、类别和运行都只传递文件路径，不再重复编码和传输。
+ImageSpillStore用于内存受限模式：编辑结果落盘后释放，评分时再读回。
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from .async_writer import AsyncImageWriter
+from .image_utils import encode_image_to_base64
+
+
+class ImageContentStore:
+    """
+    按内容哈希存储图像
+
+    文件名为base64内容的SHA1，内容为解码后的原始图像字节（保持数据集中的原始编码格式）。
+    进程内按base64字符串的(长度, hash)记忆路径，不持有base64字符串本身；
+    str的hash缓存在对象上，同一字符串对象重复查询时不再计算SHA1。
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        初始化图像缓存
+
+        Args:
+            cache_dir: 缓存目录（跨运行复用）
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._paths: Dict[Tuple[int, int], str] = {}
+        self.stats = {"hits": 0, "writes": 0}
+
+    def ref_for_b64(self, image_b64: str) -> str:
+        """
+        获取base64图像对应的缓存文件路径（首次遇到时写入磁盘）
+
+        Args:
+            image_b64: base64编码的图像（可带data URL前缀）
+
+        Returns:
+            缓存文件路径
+        """
+        memo_key = (len(image_b64), hash(image_b64))
+        path = self._paths.get(memo_key)
+        if path is not None:
+            self.stats["hits"] += 1
+            return path
+
+        path = self.write_b64(image_b64)
+        self._paths[memo_key] = path
+        return path
+
+    def write_b64(self, image_b64: str) -> str:
+        """
+        写入base64图像并返回缓存文件路径（不在进程内记忆base64字符串，调用方可随即释放它）
+
+        Args:
+            image_b64: base64编码的图像（可带data URL前缀）
+
+        Returns:
+            缓存文件路径
+        """
+        data = image_b64.split(',', 1)[1] if ',' in image_b64 else image_b64
+        key = hashlib.sha1(data.encode('ascii')).hexdigest()
+        file_path = self.cache_dir / f"{key}.img"
+        if file_path.exists():
+            self.stats["hits"] += 1
+        else:
+            # 先写临时文件再原子重命名，避免并发进程读到不完整的文件
+            tmp_path = file_path.with_name(f"{key}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(base64.b64decode(data))
+            os.replace(tmp_path, file_path)
+            self.stats["writes"] += 1
+        return str(file_path)
+
+    def refs(self,
+             images: Optional[List[Optional[Image.Image]]] = None,
+             images_b64: Optional[List[Optional[str]]] = None) -> List[Optional[str]]:
+        """
+        批量获取缓存路径，优先使用已有的base64（避免重新编码）
+
+        Args:
+            images: PIL图像列表（没有base64时才编码）
+            images_b64: base64列表（可选）
+
+        Returns:
+            路径列表（图像缺失的位置为None）
+        """
+        n = len(images_b64 if images_b64 is not None else images or [])
+        paths = []
+        for i in range(n):
+            image_b64 = images_b64[i] if images_b64 is not None else None
+            if image_b64 is None and images is not None and images[i] is not None:
+                image_b64 = encode_image_to_base64(images[i])
+            paths.append(self.ref_for_b64(image_b64) if image_b64 else None)
+        return paths
+
+
+class ImageSpillStore:
+    """
+    编辑结果的临时落盘存储（内存受限模式）
+
+    编辑阶段产生的图像经后台写入器落盘后即可释放，评分时按路径逐块读回；
+    每次运行使用独立的子目录，类别评分完成后删除该类别的文件。
+    默认使用BMP（不压缩，编解码几乎不耗CPU，文件大小即像素字节数）。
+    """
+
+    def __init__(self,
+                 spill_dir: str,
+                 image_format: str = "BMP",
+                 num_workers: int = 2,
+                 max_pending: int = 8,
+                 logger: Optional[logging.Logger] = None):
+        """
+        初始化溢写存储
+
+        Args:
+            spill_dir: 溢写根目录（建议使用本地磁盘）
+            image_format: 溢写格式（需无损：BMP、PNG或无损WEBP）
+            num_workers: 写入线程数
+            max_pending: 等待写入的图像上限（限制写盘跟不上时堆积在内存中的图像）
+            logger: 日志记录器（可选）
+        """
+        self.spill_dir = Path(spill_dir) / f"run_{os.getpid()}_{int(time.time() * 1000)}"
+        self.writer = AsyncImageWriter(
+            num_workers=num_workers,
+            max_pending=max_pending,
+            image_format=image_format,
+            compress_level=1,
+            lossless=True,
+            logger=logger
+        )
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """写入统计（written, failed, bytes）"""
+        return dict(self.writer.stats)
+
+    def put(self, category: str, pair_id: str, image: Image.Image) -> str:
+        """
+        提交图像落盘（队列已满时阻塞）
+
+        Returns:
+            图像文件路径（flush后可读）
+        """
+        path = self.writer.path_for(str(self.spill_dir / category), pair_id)
+        self.writer.submit(image, str(path))
+        return str(path)
+
+    def get(self, path: str) -> Image.Image:
+        """读回图像（先等待未完成的写入）"""
+        self.writer.flush()
+        with Image.open(path) as image:
+            image.load()
+            return image.convert("RGB")
+
+    def discard(self, category: str) -> None:
+        """删除某个类别的溢写文件"""
+        self.writer.flush()
+        shutil.rmtree(self.spill_dir / category, ignore_errors=True)
+
+    def cleanup(self) -> Dict[str, int]:
+        """停止写入线程并删除本次运行的溢写目录，返回写入统计"""
+        stats = self.writer.close()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        return stats
@@ -0,0 +1,92 @@
+"""
+Import-time profiling
+启动导入耗时分析
+
+在子进程中以 python -X importtime 导入指定模块，汇总各模块的自身耗时和累计耗时，
+并标出torch/transformers等重量级依赖是否被加载（用于检查轻量配置的启动开销）。
+"""
+
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+# 需要关注的重量级依赖（顶层包名）
+HEAVY_PACKAGES = ("torch", "transformers", "diffusers", "accelerate", "vllm")
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    解析 -X importtime 的输出
+
+    Returns:
+        按导入完成顺序排列的条目列表：{"module", "self_ms", "cumulative_ms", "depth"}
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            entries.append({
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                # 名称前有一个空格，之后每层嵌套缩进两个空格
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            })
+        except ValueError:
+            continue
+    return entries
+
+
+def profile_imports(modules: List[str],
+                    python: Optional[str] = None,
+                    cwd: Optional[str] = None,
+                    timeout: float = 300) -> Dict[str, Any]:
+    """
+    在新的解释器中导入模块并统计导入耗时
+
+    Args:
+        modules: 要导入的模块名列表
+        python: Python解释器路径（默认为当前解释器）
+        cwd: 子进程工作目录（需能导入src包时设为项目根目录）
+        timeout: 超时时间（秒）
+
+    Returns:
+        {"total_ms", "num_modules", "heavy", "modules"}
+    """
+    code = "import importlib\n" + "".join(f"importlib.import_module({m!r})\n" for m in modules)
+    result = subprocess.run([python or sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, cwd=cwd, timeout=timeout)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"Failed to import {modules}: {errors[-1] if errors else result.returncode}")
+
+    entries = parse_importtime(result.stderr)
+    loaded = {entry["module"].split(".")[0] for entry in entries}
+    return {
+        "total_ms": sum(entry["cumulative_ms"] for entry in entries if entry["depth"] == 0),
+        "num_modules": len(entries),
+        "heavy": [package for package in HEAVY_PACKAGES if package in loaded],
+        "modules": entries,
+    }
+
+
+def format_import_report(report: Dict[str, Any], top: int = 20) -> str:
+    """
+    生成导入耗时报告文本（累计耗时和自身耗时各取前top个模块）
+    """
+    lines = [f"Import time: {report['total_ms']:.0f} ms ({report['num_modules']} modules)"]
+    if report["heavy"]:
+        lines.append(f"Heavy packages loaded: {', '.join(report['heavy'])}")
+    else:
+        lines.append("Heavy packages loaded: none")
+
+    for title, key in (("cumulative", "cumulative_ms"), ("self", "self_ms")):
+        lines.append("")
+        lines.append(f"Top {top} by {title} time:")
+        lines.append(f"{'ms':>10}  module")
+        for entry in sorted(report["modules"], key=lambda e: e[key], reverse=True)[:top]:
+            lines.append(f"{entry[key]:>10.1f}  {'  ' * entry['depth']}{entry['module']}")
+    return "\n".join(lines)
+
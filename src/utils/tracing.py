@@ -0,0 +1,202 @@
+"""
+Lightweight span tracer
+轻量级阶段计时（导出Chrome trace-event JSON）
+
+用法：
+    tracer = get_tracer()
+    with tracer.span("edit", cat="diffusion", gpu=0, pair_id="pair_1"):
+        ...
+    tracer.save("outputs/trace.json")   # 在 chrome://tracing 或 https://ui.perfetto.dev 中打开
+
+未启用时span()直接返回共享的空上下文管理器，不计时也不记录。
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+class _NullSpan:
+    """未启用追踪时使用的空span"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+# GPU泳道的tid偏移（与真实线程id区分）
+_GPU_TID_BASE = 1000
+
+
+class _Span:
+    """一次计时区间，退出时写入一个complete事件（ph=X）"""
+
+    __slots__ = ("tracer", "name", "cat", "tid", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, tid: int, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.tid = tid
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._record(self.name, self.cat, self.start, end, self.tid, self.args)
+        return False
+
+
+class Tracer:
+    """
+    阶段计时器
+
+    每个span记录名称、类别、线程/进程id以及可选的GPU id；
+    带gpu参数的span放在对应GPU的泳道上，便于在时间线上查看各GPU的空闲和同步等待
+    """
+
+    def __init__(self, enabled: bool = False, process_name: str = "benchmark"):
+        """
+        初始化计时器
+
+        Args:
+            enabled: 是否记录span
+            process_name: trace中显示的进程名
+        """
+        self.enabled = enabled
+        self.process_name = process_name
+        self.pid = os.getpid()
+        self.events: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter_ns()
+        self._thread_ids: Dict[int, int] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _tid(self, gpu: Optional[int]) -> int:
+        """当前线程（或GPU泳道）的紧凑tid"""
+        if gpu is not None:
+            tid = _GPU_TID_BASE + int(gpu)
+            if tid not in self._thread_names:
+                with self._lock:
+                    self._thread_names[tid] = f"GPU {gpu}"
+            return tid
+
+        ident = threading.get_ident()
+        tid = self._thread_ids.get(ident)
+        if tid is None:
+            with self._lock:
+                tid = self._thread_ids.setdefault(ident, len(self._thread_ids) + 1)
+                self._thread_names[tid] = threading.current_thread().name
+        return tid
+
+    def span(self, name: str, cat: str = "pipeline", gpu: Optional[int] = None, **args):
+        """
+        创建一个计时span（上下文管理器）
+
+        Args:
+            name: span名称（如edit, score, swap）
+            cat: 类别（如pipeline, diffusion, reward）
+            gpu: GPU id（可选，span放到该GPU的泳道上）
+            **args: 附加到事件上的参数（如pair_id, category）
+
+        Returns:
+            上下文管理器
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        if gpu is not None:
+            args["gpu"] = gpu
+        return _Span(self, name, cat, self._tid(gpu), args)
+
+    def add_span(self, name: str, start_ns: int, end_ns: int, cat: str = "pipeline",
+                 gpu: Optional[int] = None, **args):
+        """记录一个已在外部计时的span（时间为time.perf_counter_ns()）"""
+        if not self.enabled:
+            return
+        if gpu is not None:
+            args["gpu"] = gpu
+        self._record(name, cat, start_ns, end_ns, self._tid(gpu), args)
+
+    def instant(self, name: str, cat: str = "pipeline", **args):
+        """记录一个瞬时事件"""
+        if not self.enabled:
+            return
+        self.events.append({
+            "name": name, "cat": cat, "ph": "i", "s": "p",
+            "ts": (time.perf_counter_ns() - self._origin) / 1000,
+            "pid": self.pid, "tid": self._tid(None), "args": args
+        })
+
+    def _record(self, name: str, cat: str, start_ns: int, end_ns: int, tid: int, args: Dict[str, Any]):
+        # list.append是原子操作，多线程记录无需加锁
+        self.events.append({
+            "name": name, "cat": cat, "ph": "X",
+            "ts": (start_ns - self._origin) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": self.pid, "tid": tid, "args": args
+        })
+
+    def spans(self, name: Optional[str] = None, cat: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按名称/类别筛选已记录的span（dur单位为微秒）"""
+        return [
+            e for e in self.events
+            if e["ph"] == "X" and (name is None or e["name"] == name) and (cat is None or e["cat"] == cat)
+        ]
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """转换为Chrome trace-event格式"""
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                     "args": {"name": self.process_name}}]
+        for tid, thread_name in sorted(self._thread_names.items()):
+            metadata.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                             "args": {"name": thread_name}})
+            metadata.append({"name": "thread_sort_index", "ph": "M", "pid": self.pid, "tid": tid,
+                             "args": {"sort_index": tid}})
+        return {"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}
+
+    def save(self, path: str) -> Optional[str]:
+        """
+        保存为Chrome trace-event JSON
+
+        Args:
+            path: 输出文件路径
+
+        Returns:
+            保存的文件路径（未启用时返回None）
+        """
+        if not self.enabled:
+            return None
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        return str(path)
+
+
+_tracer = Tracer(enabled=False)
+
+
+def get_tracer() -> Tracer:
+    """获取全局计时器（模型实现中通过它记录span，无需逐层传递）"""
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    """设置全局计时器，返回之前的计时器"""
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    return previous
@@ -0,0 +1,67 @@
+"""
+Model weight prefetch
+模型权重预读（在后台把权重文件读入OS页缓存）
+
+评分模型（尤其是子进程中的30B模型）首次加载时大部分时间花在从磁盘读取权重上；
+在阶段1编辑期间预先顺序读取权重文件，之后的加载直接命中页缓存。
+读取的数据立即丢弃，不占用本进程内存；多个评分子进程共享同一份页缓存。
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 按优先级查找的权重文件格式（找到一种即停止）
+WEIGHT_PATTERNS = ("*.safetensors", "*.bin")
+
+
+def model_weight_files(model_name: str) -> List[Path]:
+    """
+    模型的本地权重文件
+
+    model_name可以是本地目录，或已下载到HuggingFace缓存的hub模型ID（解析为缓存中的snapshot目录，
+    不访问网络）；都找不到时返回空列表
+    """
+    model_dir = Path(model_name)
+    if not model_dir.is_dir():
+        try:
+            from huggingface_hub import snapshot_download
+            model_dir = Path(snapshot_download(model_name, local_files_only=True))
+        except Exception:
+            return []  # 未安装huggingface_hub、不是合法的模型ID或缓存中没有该模型
+    for pattern in WEIGHT_PATTERNS:
+        files = sorted(model_dir.glob(pattern))
+        if files:
+            return files
+    return []
+
+
+def prefetch_files(paths: List[Path],
+                   chunk_mb: int = 16,
+                   stop_event: Optional[threading.Event] = None) -> Dict[str, float]:
+    """
+    顺序读取文件，使其进入OS页缓存
+
+    Args:
+        paths: 文件路径列表
+        chunk_mb: 每次读取的块大小（MB，复用同一个缓冲区）
+        stop_event: 设置后提前停止（可选）
+
+    Returns:
+        {"files": 文件数, "bytes": 读取的字节数, "seconds": 耗时}
+    """
+    view = memoryview(bytearray(chunk_mb * 1024 * 1024))
+    total = 0
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, "rb", buffering=0) as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            while not (stop_event is not None and stop_event.is_set()):
+                n = f.readinto(view)
+                if not n:
+                    break
+                total += n
+    return {"files": len(paths), "bytes": total, "seconds": time.perf_counter() - start}
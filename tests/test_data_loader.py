@@ -5,15 +5,18 @@ Unit tests for data loader
 
 import unittest
 import json
+import shutil
 import tempfile
 from pathlib import Path
 import sys
+from PIL import Image
 
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from src.data import BenchmarkLoader, DataPair
+from src.data import BenchmarkLoader, CategoryData, DataPair
+from src.utils import encode_image_to_base64
 
 
 class TestBenchmarkLoader(unittest.TestCase):
@@ -81,6 +84,64 @@ class TestBenchmarkLoader(unittest.TestCase):
         self.assertEqual(pairs[0].edit_instruction, "Make it red")
 
 
+class TestDataPair(unittest.TestCase):
+    """测试DataPair的延迟字段和CategoryData的列式视图"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.image_b64 = encode_image_to_base64(Image.new("RGB", (6, 4), color="blue"))
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_lazy_fields(self):
+        """原图在首次访问时解码，释放后可重新解码；没有loader的字段释放后为None"""
+        pair = DataPair("p0", "cat", self.image_b64, "instruction", "description", metadata={"difficulty": 1})
+        self.assertFalse(pair.is_loaded("original_image"))
+        self.assertEqual(pair.original_image.size, (6, 4))
+        self.assertTrue(pair.is_loaded("original_image"))
+        
+        pair.drop("original_image", "metadata")
+        self.assertFalse(pair.is_loaded("original_image"))
+        self.assertTrue(pair.is_available("original_image"))
+        self.assertIsNone(pair.metadata)
+        self.assertFalse(hasattr(pair, "__dict__"))
+        
+        pair.set_loader("edited_image", lambda p: Image.new("RGB", (2, 2)))
+        self.assertTrue(pair.is_available("edited_image"))
+        self.assertEqual(pair.edited_image.size, (2, 2))
+    
+    def test_image_cache_dir(self):
+        """设置image_cache_dir时样本不保留base64，访问时从缓存文件读取"""
+        data_path = Path(self.temp_dir) / "data.json"
+        data_path.write_text(json.dumps([
+            {"subset": "cat", "original_image_path": f"images/p{i}.png", "src_img_b64": self.image_b64,
+             "edit_instruction_en": "x", "difficulty": i}
+            for i in range(2)
+        ]))
+        data = BenchmarkLoader().load(str(data_path), ["cat"], image_cache_dir=str(Path(self.temp_dir) / "cache"))
+        pair = data.get_category("cat").data_pairs[1]
+        
+        self.assertFalse(pair.is_loaded("original_image_b64"))
+        self.assertNotIn("src_img_b64", pair.metadata)
+        self.assertEqual(pair.metadata["difficulty"], 1)
+        self.assertEqual(pair.original_image.size, (6, 4))
+        self.assertEqual(pair.original_image_b64, self.image_b64)
+        self.assertEqual(len(list((Path(self.temp_dir) / "cache").iterdir())), 1)
+    
+    def test_columns(self):
+        """列式视图的分数、状态和ID"""
+        pairs = [DataPair(f"p{i}", "cat", "", "", "") for i in range(4)]
+        for pair, (status, score) in zip(pairs, [("scored", 7.0), ("edit_failed", None),
+                                                  ("scored", 5.0), ("score_failed", None)]):
+            pair.status, pair.score = status, score
+        columns = CategoryData("cat", pairs).columns()
+        
+        self.assertEqual(columns.scored().tolist(), [7.0, 5.0])
+        self.assertEqual(columns.ids_with_status("edit_failed"), ["p1"])
+        self.assertEqual(int(columns.status.size), 4)
+
+
 if __name__ == "__main__":
     unittest.main()
 
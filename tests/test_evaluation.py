@@ -0,0 +1,134 @@
+"""
+Unit tests for evaluation statistics
+评估统计测试
+"""
+
+import unittest
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data import CategoryData, DataPair
+from src.evaluation import (Scorer, Reporter, StratifiedSampler, SampleState, SequentialStopper, estimate_mean,
+                            estimate_stratified_mean)
+
+
+class TestScorer(unittest.TestCase):
+    """测试Scorer的bootstrap置信区间"""
+
+    def setUp(self):
+        self.scores = np.random.default_rng(1).normal(6.0, 1.5, size=50)
+
+    def test_bootstrap_ci(self):
+        """区间包含点估计，固定种子结果可复现，分块重采样不改变结果"""
+        scorer = Scorer(bootstrap_resamples=500, seed=3)
+        stats = scorer.compute_category_statistics(list(self.scores), "cat")
+
+        self.assertLess(stats["mean_ci_low"], stats["mean"])
+        self.assertGreater(stats["mean_ci_high"], stats["mean"])
+        self.assertLessEqual(stats["median_ci_low"], stats["median"])
+        self.assertGreaterEqual(stats["median_ci_high"], stats["median"])
+        self.assertEqual(stats["ci_level"], 0.95)
+        self.assertEqual(scorer.compute_category_statistics(self.scores, "cat"), stats)
+
+        blocked = Scorer(bootstrap_resamples=500, seed=3)
+        blocked.MAX_RESAMPLE_ELEMENTS = 7 * len(self.scores)
+        self.assertEqual(blocked.bootstrap_ci(self.scores), scorer.bootstrap_ci(self.scores))
+
+        # 标准误的近似：95%区间宽度约为 2 × 1.96 × std / sqrt(N)
+        expected_width = 2 * 1.96 * np.std(self.scores) / np.sqrt(len(self.scores))
+        self.assertAlmostEqual(stats["mean_ci_high"] - stats["mean_ci_low"], expected_width,
+                               delta=expected_width * 0.25)
+
+    def test_disabled_and_markdown(self):
+        """B=0时不输出区间；Markdown报告显示区间"""
+        self.assertNotIn("mean_ci_low", Scorer().compute_category_statistics([1.0, 2.0], "cat"))
+
+        scorer = Scorer(bootstrap_resamples=200)
+        category_stats = scorer.compute_all_statistics({"cat": self.scores})
+        overall = scorer.compute_overall_statistics({"cat": self.scores})
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir, True)
+        reporter = Reporter(output_dir=output_dir)
+        report = reporter.generate_report(category_stats, overall, metadata={})
+        self.assertIn("95% CI", reporter.generate_markdown_report(report))
+
+
+class TestSampling(unittest.TestCase):
+    """测试分层抽样与全量估计"""
+
+    def _category(self, name, n):
+        return CategoryData(name, [DataPair(f"{name}_{i}", name, None, "", "") for i in range(n)])
+
+    def test_sampler_is_deterministic_and_nested(self):
+        """抽样与数据顺序无关；k增大时包含原样本集；不同种子抽到不同样本"""
+        category = self._category("cat", 40)
+        small = [p.pair_id for p in StratifiedSampler(5, seed=1).sample(category)]
+        category.data_pairs.reverse()
+        large = [p.pair_id for p in StratifiedSampler(12, seed=1).sample(category)]
+        self.assertEqual(large[:5], small)
+        self.assertNotEqual([p.pair_id for p in StratifiedSampler(5, seed=2).sample(category)], small)
+        self.assertEqual(len(StratifiedSampler(100).sample(category)), 40)
+
+    def test_estimates(self):
+        """有限总体校正：全部抽中时区间宽度为0；分层估计按总样本数加权"""
+        scores = np.random.default_rng(0).normal(6.0, 1.0, size=30)
+        partial = estimate_mean(scores[:10], population_size=30)
+        self.assertLess(partial["ci_low"], partial["estimated_mean"])
+        full = estimate_mean(scores, population_size=30)
+        self.assertAlmostEqual(full["ci_high"] - full["ci_low"], 0.0)
+        self.assertIsNone(estimate_mean([5.0], population_size=30)["ci_low"])
+
+        overall = estimate_stratified_mean({"a": [2.0, 4.0], "b": [8.0, 8.0], "c": []},
+                                           {"a": 30, "b": 10, "c": 5})
+        self.assertAlmostEqual(overall["estimated_mean"], 0.75 * 3.0 + 0.25 * 8.0)
+        self.assertEqual((overall["num_sampled"], overall["population"]), (4, 40))
+
+    def test_sample_state(self):
+        """已评分的样本及降分辨率标记可恢复；失败的样本不记录；配置指纹变化时状态失效"""
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir, True)
+        path = str(Path(output_dir) / "state.json")
+        pairs = self._category("cat", 3).data_pairs
+        pairs[0].score, pairs[0].status = 7.5, "scored"
+        pairs[1].status = "edit_failed"
+        pairs[2].score, pairs[2].status = 6.0, "scored"
+        state = SampleState(path, fingerprint="a")
+        state.record("cat", pairs, degraded_ids=["cat_2"])
+        state.save()
+
+        fresh = self._category("cat", 3).data_pairs
+        reloaded = SampleState(path, fingerprint="a")
+        restored = reloaded.restore("cat", fresh)
+        self.assertEqual([(p.pair_id, p.score, p.status) for p in restored],
+                         [("cat_0", 7.5, "scored"), ("cat_2", 6.0, "scored")])
+        # 降分辨率编辑的标记随分数保存，复用时仍计入edit_degraded
+        self.assertEqual(reloaded.degraded_ids("cat", restored), ["cat_2"])
+        self.assertEqual(SampleState(path, fingerprint="b").restore("cat", fresh), [])
+
+    def test_sequential_stopper(self):
+        """达到目标半宽或与基线的比较有定论时停止；分数不足min_pairs时不停止；全部用完时停止"""
+        scores = list(np.random.default_rng(2).normal(6.0, 0.5, size=40))
+        stopper = SequentialStopper(target_half_width=0.3, min_pairs=10)
+        self.assertFalse(stopper.check(scores[:8], 1000, 8)["stop"])
+        decision = stopper.check(scores, 1000, 40)
+        self.assertEqual(decision["stop_reason"], "target_width")
+        self.assertLessEqual(decision["ci_half_width"], 0.3)
+
+        no_target = SequentialStopper(target_half_width=None, min_pairs=10)
+        self.assertFalse(no_target.check(scores, 1000, 40, baseline={"mean": 6.0, "std_error": 0.0})["stop"])
+        decision = no_target.check(scores, 1000, 40, baseline={"mean": 4.0, "std_error": 0.1})
+        self.assertEqual(decision["stop_reason"], "baseline_decisive")
+        self.assertGreater(decision["difference_ci_low"], 0.0)
+        self.assertEqual(no_target.check(scores[:3], 5, 5)["stop_reason"], "exhausted")
+
+
+if __name__ == "__main__":
+    unittest.main()
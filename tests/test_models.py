@@ -5,7 +5,11 @@ Unit tests for models
 
 import unittest
 from PIL import Image
+import io
 import sys
+import tempfile
+import time
+import types
 from pathlib import Path
 
 # 添加项目根目录到Python路径
@@ -14,6 +18,13 @@ sys.path.insert(0, str(project_root))
 
 from src.models.diffusion.implementations.example_model import ExampleDiffusionModel
 from src.models.reward.implementations.example_reward import ExampleRewardModel
+from src.models.diffusion.implementations.multi_gpu_qwen_edit import GPUWorker, MultiGPUQwenImageEditModel
+from src.models.diffusion.retry_policy import EditRetryPolicy, EditOutcome, EditAttempt
+from src.models.reward.qwen3_vl_utils import (BatchPrefetcher, ScoreStoppingCriteria, StreamedResults,
+                                              build_rubric_messages, clone_processor, common_prefix_length,
+                                              decode_transport_image, encode_transport_image, fit_pixel_budget,
+                                              generate_rubric_responses, has_complete_score, read_stream_results,
+                                              read_task_chunks, split_rubric_prompts)
 
 
 class TestDiffusionModel(unittest.TestCase):
@@ -53,6 +64,120 @@ class TestDiffusionModel(unittest.TestCase):
             self.assertIsInstance(img, Image.Image)
 
 
+class TestGPUWorkerCompile(unittest.TestCase):
+    """测试GPUWorker编译模式的统计逻辑（不需要GPU）"""
+    
+    def test_resolution_bucket(self):
+        """同一宽高比的图像落入同一个分辨率桶"""
+        bucket_a = GPUWorker._resolution_bucket(Image.new("RGB", (1472, 1104)))
+        bucket_b = GPUWorker._resolution_bucket(Image.new("RGB", (736, 552)))
+        self.assertEqual(bucket_a, bucket_b)
+        self.assertEqual(bucket_a[0] % 32, 0)
+        self.assertEqual(bucket_a[1] % 32, 0)
+        
+        # 显式指定尺寸时直接使用
+        self.assertEqual(GPUWorker._resolution_bucket(Image.new("RGB", (10, 10)), 512, 768), (768, 512))
+    
+    def test_compile_report(self):
+        """warmup与稳态耗时分开统计"""
+        worker = GPUWorker(gpu_id=0, model_name="test", config={"compile_transformer": True})
+        worker.compile_stats["warmup"][(1024, 1024)] = 60.0
+        worker.compile_stats["steady"][(1024, 1024)] = [2.0, 4.0]
+        worker.compile_stats["eager"][(1024, 1024)] = 6.0
+        
+        report = worker.get_compile_report()["1024x1024"]
+        self.assertEqual(report["warmup_s"], 60.0)
+        self.assertEqual(report["steady_mean_s"], 3.0)
+        self.assertEqual(report["steady_count"], 2)
+        self.assertAlmostEqual(report["speedup"], 2.0)
+
+
+class TestEditRetryPolicy(unittest.TestCase):
+    """测试编辑失败重试策略"""
+    
+    def setUp(self):
+        self.policy = EditRetryPolicy({"max_retries": 3, "downscale_factors": [0.5]})
+        self.oom = RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")
+    
+    def test_oom_prefers_other_gpu(self):
+        """OOM时先换到未尝试过的GPU"""
+        outcome = EditOutcome(index=0, status="failed", attempts=[EditAttempt(0, error=self.oom)])
+        action = self.policy.plan(outcome, [0, 1])
+        self.assertEqual((action.gpu_id, action.scale), (1, 1.0))
+    
+    def test_oom_downscales_after_all_gpus_tried(self):
+        """所有GPU都OOM后降低分辨率"""
+        outcome = EditOutcome(index=0, status="failed", attempts=[
+            EditAttempt(0, error=self.oom), EditAttempt(1, error=self.oom)
+        ])
+        action = self.policy.plan(outcome, [1, 0])
+        self.assertEqual((action.gpu_id, action.scale), (1, 0.5))
+    
+    def test_gives_up(self):
+        """非OOM异常默认不重试；重试次数耗尽后放弃"""
+        outcome = EditOutcome(index=0, status="failed", attempts=[EditAttempt(0, error=ValueError("bad input"))])
+        self.assertIsNone(self.policy.plan(outcome, [0, 1]))
+        
+        outcome = EditOutcome(index=0, status="failed", attempts=[
+            EditAttempt(0, error=self.oom), EditAttempt(1, error=self.oom),
+            EditAttempt(1, 0.5, self.oom), EditAttempt(0, 0.5, self.oom)
+        ])
+        self.assertIsNone(self.policy.plan(outcome, [0, 1]))
+
+
+class FakeEditWorker:
+    """按GPU模拟编辑：oom_gpus上全分辨率编辑OOM，降分辨率时成功"""
+    
+    def __init__(self, gpu_id: int, oom_gpus):
+        self.gpu_id = gpu_id
+        self.oom_gpus = oom_gpus
+        self.calls = []
+    
+    def edit_image(self, image, instruction, seed, **kwargs):
+        self.calls.append(kwargs.get("width"))
+        if self.gpu_id in self.oom_gpus and "width" not in kwargs:
+            raise RuntimeError("CUDA out of memory")
+        return image
+
+
+class TestEditRetryScheduling(unittest.TestCase):
+    """测试多GPU编辑模型的失败重试调度与结果回调"""
+    
+    def _model(self, oom_gpus):
+        model = MultiGPUQwenImageEditModel.__new__(MultiGPUQwenImageEditModel)
+        model.workers = [FakeEditWorker(gpu_id, oom_gpus) for gpu_id in (0, 1)]
+        model.retry_policy = EditRetryPolicy({"max_retries": 3})
+        model._gpus_by_free_memory = lambda: [1, 0]
+        return model
+    
+    def test_busy_gpu_defers_instead_of_downscaling(self):
+        """多个OOM样本都未尝试过同一GPU时，依次在该GPU上以原分辨率重试，而不是降分辨率"""
+        model = self._model(oom_gpus={0})
+        oom = RuntimeError("CUDA out of memory")
+        outcomes = [EditOutcome(index=i, status="failed", attempts=[EditAttempt(0, error=oom)]) for i in range(3)]
+        images = [Image.new("RGB", (64, 64)) for _ in range(3)]
+        
+        results = model._retry_failed(images, ["edit"] * 3, [None] * 3, outcomes, 0)
+        
+        self.assertEqual(results, images)
+        self.assertEqual([(o.status, o.scale, o.attempts[-1].gpu_id) for o in outcomes], [("ok", 1.0, 1)] * 3)
+        self.assertEqual(model.workers[1].calls, [None] * 3)
+    
+    def test_storage_error_is_not_an_edit_failure(self):
+        """on_result的异常标记为store_failed，不计入编辑尝试也不重试"""
+        model = self._model(oom_gpus=set())
+        outcome = EditOutcome(index=0)
+        
+        def on_result(index, image):
+            raise OSError("No space left on device")
+        
+        self.assertIsNone(model._deliver_result(outcome, Image.new("RGB", (8, 8)), on_result))
+        self.assertEqual(outcome.status, "store_failed")
+        self.assertIn("No space left", outcome.to_dict()["storage_error"])
+        self.assertEqual(model._retry_failed([None], ["edit"], [None], [outcome], 0), [None])
+        self.assertEqual(sum(len(w.calls) for w in model.workers), 0)
+
+
 class TestRewardModel(unittest.TestCase):
     """测试Reward评分模型"""
     
@@ -81,6 +206,233 @@ class TestRewardModel(unittest.TestCase):
         self.assertIsInstance(score, float)
         self.assertGreaterEqual(score, 0.0)
         self.assertLessEqual(score, 10.0)
+    
+    def test_batch_score_multi(self):
+        """默认多维度评分返回每个样本一个分数向量"""
+        images = [Image.new("RGB", (64, 64), color="blue") for _ in range(3)]
+        rubrics = [{"system_prompt": "s", "user_prompt": f"rubric {r}"} for r in range(2)]
+        
+        scores = self.model.batch_score_multi(
+            edited_images=images,
+            original_descriptions=["d"] * 3,
+            edit_instructions=["e"] * 3,
+            rubric_prompts=[rubrics] * 3
+        )
+        
+        self.assertEqual(len(scores), 3)
+        self.assertTrue(all(len(vector) == 2 for vector in scores))
+
+
+class TestRubricUtils(unittest.TestCase):
+    """测试多维度评分的公共工具"""
+    
+    def test_image_precedes_rubric_text(self):
+        """图像位于维度说明之前，保证各维度的图像前缀相同"""
+        image = Image.new("RGB", (8, 8))
+        messages = [
+            build_rubric_messages([image], {"system_prompt": f"rubric {r}", "user_prompt": "score"})
+            for r in range(2)
+        ]
+        self.assertEqual(messages[0][0], messages[1][0])
+        self.assertEqual(messages[0][1]["content"][0], messages[1][1]["content"][0])
+        self.assertEqual(messages[0][1]["content"][-1]["type"], "text")
+    
+    def test_common_prefix_length(self):
+        self.assertEqual(common_prefix_length([[1, 2, 3, 4], [1, 2, 5], [1, 2, 3]]), 2)
+        self.assertEqual(common_prefix_length([[1, 2], [1, 2]]), 2)
+        self.assertEqual(common_prefix_length([]), 0)
+    
+    def test_split_rubric_prompts(self):
+        """切分在公共前缀中最后一个图像占位符之后；前缀没有包含全部图像时不切分"""
+        texts = ["sys <img><pad></img> <img><pad></img> rubric A", "sys <img><pad></img> <img><pad></img> rubric B"]
+        split = split_rubric_prompts(texts, "<pad>", 2)
+        self.assertEqual(texts[0][:split], "sys <img><pad></img> <img><pad>")
+        self.assertIsNone(split_rubric_prompts(texts, "<pad>", 3))
+    
+    def test_rubric_responses_share_prefix(self):
+        """复用前缀时图像只预处理一次，所有维度在一次batch generate中生成，填充不占位置"""
+        import torch
+        
+        class Inputs(dict):
+            def to(self, device):
+                return self
+        
+        class Tokenizer:
+            pad_token_id = 0
+            
+            def __call__(self, texts, add_special_tokens=True):
+                return {"input_ids": [[ord(c) for c in text] for text in texts]}
+        
+        class Processor:
+            image_token = "<pad>"
+            tokenizer = Tokenizer()
+            
+            def __init__(self):
+                self.image_calls = 0
+            
+            def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+                return f"{messages[0]['content'][0]['text']}<pad>{messages[1]['content'][-1]['text']}>"
+            
+            def __call__(self, text, images, return_tensors="pt"):
+                self.image_calls += 1
+                ids = torch.tensor([[ord(c) for c in text[0]]])
+                return Inputs(input_ids=ids, attention_mask=torch.ones_like(ids), pixel_values=torch.zeros(1))
+            
+            def batch_decode(self, ids, **kwargs):
+                return ["".join(map(chr, row.tolist())) for row in ids]
+        
+        class Cache:
+            def batch_repeat_interleave(self, repeats):
+                self.repeats = repeats
+        
+        class Model:
+            device = "cpu"
+            
+            def __init__(self):
+                self.model = types.SimpleNamespace(rope_deltas=None)
+                self.generate_calls = []
+            
+            def __call__(self, **inputs):
+                self.prefill_length = inputs["input_ids"].shape[1]
+                self.model.rope_deltas = torch.tensor([[-5]])
+                return types.SimpleNamespace(past_key_values=Cache())
+            
+            def generate(self, input_ids, attention_mask, max_new_tokens, past_key_values):
+                self.generate_calls.append((input_ids, attention_mask, past_key_values.repeats))
+                return torch.cat([input_ids, torch.full((input_ids.shape[0], 1), ord("7"))], dim=1)
+        
+        processor, model = Processor(), Model()
+        rubrics = [{"system_prompt": "a", "user_prompt": "x"}, {"system_prompt": "bbb", "user_prompt": "x"}]
+        responses = generate_rubric_responses(model, processor, [Image.new("RGB", (8, 8))], rubrics,
+                                              system_prompt="sys", stop_at_score=False)
+        
+        self.assertEqual(responses, ["7", "7"])
+        self.assertEqual(processor.image_calls, 1)
+        self.assertEqual(len(model.generate_calls), 1)
+        input_ids, attention_mask, repeats = model.generate_calls[0]
+        self.assertEqual((input_ids.shape[0], repeats, model.prefill_length), (2, 2, len("sys<pad>")))
+        # 较短的维度在前缀与后缀之间填充2个pad，不参与注意力且不占位置
+        self.assertEqual(attention_mask[0].tolist().count(0), 2)
+        self.assertEqual(model.model.rope_deltas.tolist(), [[-7], [-5]])
+    
+    def test_fit_pixel_budget(self):
+        """超出预算时等比缩小并对齐到32的倍数，预算内原样返回"""
+        image = Image.new("RGB", (2048, 1536))
+        resized = fit_pixel_budget(image, max_pixels=1024 * 1024)
+        self.assertLessEqual(resized.width * resized.height, 1024 * 1024)
+        self.assertEqual((resized.width % 32, resized.height % 32), (0, 0))
+        self.assertAlmostEqual(resized.width / resized.height, 2048 / 1536, places=1)
+        
+        small = Image.new("RGB", (100, 60))
+        self.assertIs(fit_pixel_budget(small, max_pixels=1024 * 1024), small)
+        upscaled = fit_pixel_budget(small, min_pixels=256 * 256)
+        self.assertGreaterEqual(upscaled.width * upscaled.height, 256 * 256)
+    
+    def test_transport_image_round_trip(self):
+        """png/webp/raw三种传输格式都无损；非RGB图像按RGB传输；未知格式报错"""
+        image = Image.effect_noise((13, 7), 64).convert("RGB")
+        for transport_format in ("png", "webp", "raw"):
+            task = encode_transport_image(image, transport_format, compress_level=1)
+            self.assertEqual(decode_transport_image(task).tobytes(), image.tobytes(), transport_format)
+        
+        decoded = decode_transport_image(encode_transport_image(image.convert("L"), "raw"))
+        self.assertEqual((decoded.mode, decoded.size), ("RGB", (13, 7)))
+        with self.assertRaises(ValueError):
+            encode_transport_image(image, "jpeg")
+    
+    def test_has_complete_score(self):
+        """数字之后出现其他字符才算完整；列表序号和超出0-10的数字不算"""
+        for text in ["8.500\n", " 7 ", "Score: 8.5\n", "The edit is good. Score: 9.\n", "评分：6.5，",
+                     "rating: 10/10"]:
+            self.assertTrue(has_complete_score(text), text)
+        for text in ["8.5", "8.", "Score: 9.", "Score: 8.5", "1. The edit", "Score: 85 ", "The image shows 2 cats"]:
+            self.assertFalse(has_complete_score(text), text)
+    
+    def test_score_stopping_criteria(self):
+        """每个序列给出分数后单独结束，已结束的序列不再解码"""
+        import torch
+        
+        class CharTokenizer:
+            """token id即字符编码"""
+            def __init__(self):
+                self.calls = 0
+            
+            def decode(self, token_ids, skip_special_tokens=True):
+                self.calls += 1
+                return "".join(chr(t) for t in token_ids)
+        
+        tokenizer = CharTokenizer()
+        criteria = ScoreStoppingCriteria(tokenizer, prompt_length=2)
+        generated = ["8.5\nThe e", "Score: 7\n"]
+        done = []
+        for length in range(1, 10):
+            input_ids = torch.tensor([[0, 0] + [ord(c) for c in text[:length]] for text in generated])
+            done.append(criteria(input_ids, None).tolist())
+        
+        self.assertEqual(done[2], [False, False])
+        self.assertEqual(done[3], [True, False])
+        self.assertEqual(done[8], [True, True])
+        self.assertEqual(tokenizer.calls, 4 + 9)
+    
+    def test_batch_prefetcher(self):
+        """下一个batch在当前batch生成时准备：顺序不变，准备失败作为error交给调用方"""
+        def prepare(batch):
+            time.sleep(0.05)
+            if batch == "bad":
+                raise ValueError("cannot decode")
+            return {"batch": batch}
+        
+        prefetcher = BatchPrefetcher(prepare, ["a", "bad", "c", "d"], depth=2, pin_memory=False)
+        results = []
+        for batch, inputs, error in prefetcher:
+            results.append((batch, inputs, type(error).__name__ if error else None))
+            time.sleep(0.05)  # 模拟GPU生成
+        
+        self.assertEqual(results, [("a", {"batch": "a"}, None), ("bad", None, "ValueError"),
+                                   ("c", {"batch": "c"}, None), ("d", {"batch": "d"}, None)])
+        stats = prefetcher.summary()
+        self.assertEqual(stats["batches"], 4)
+        self.assertGreater(stats["recovered_seconds"], 0.08)
+        
+        sequential = BatchPrefetcher(prepare, ["a", "c"], depth=0, pin_memory=False)
+        self.assertEqual([inputs for _, inputs, _ in sequential], [{"batch": "a"}, {"batch": "c"}])
+        self.assertEqual(sequential.summary()["recovered_seconds"], 0.0)
+        
+        # drain之后后台没有正在进行的准备，下一次迭代继续提交
+        prefetcher = BatchPrefetcher(prepare, ["a", "c", "d"], depth=2, pin_memory=False)
+        for batch, _, _ in prefetcher:
+            if batch == "a":
+                prefetcher.drain()
+                self.assertTrue(all(future.done() for _, future in prefetcher._queued))
+        self.assertEqual(prefetcher.summary()["batches"], 3)
+    
+    def test_clone_processor(self):
+        """后台线程使用的processor副本有独立的tokenizer，修改padding_side不影响原processor"""
+        processor = types.SimpleNamespace(tokenizer=types.SimpleNamespace(padding_side="right"))
+        clone = clone_processor(processor, padding_side="left")
+        self.assertIsNot(clone.tokenizer, processor.tokenizer)
+        self.assertEqual((clone.tokenizer.padding_side, processor.tokenizer.padding_side), ("left", "right"))
+    
+    def test_streamed_results_round_trip(self):
+        """任务按块读取；结果逐条写出，缺少结束行时按已完成的连续前缀回收"""
+        stream = io.StringIO("".join(f'{{"user_prompt": "{i}"}}\n' for i in range(5)) + "\n")
+        self.assertEqual([len(chunk) for chunk in read_task_chunks(stream, 2)], [2, 2, 1])
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = f"{temp_dir}/results.jsonl"
+            results = StreamedResults(path)
+            results.extend([7.0, [6.5, 8.0]])
+            self.assertEqual(read_stream_results(path)["scores"], [7.0, [6.5, 8.0]])
+            self.assertEqual(read_stream_results(path)["status"], "error")
+            
+            results.append(5.0)
+            results.finish("success")
+            self.assertEqual(read_stream_results(path), {"status": "success", "scores": [7.0, [6.5, 8.0], 5.0],
+                                                         "error": None})
+            
+            with open(path, "a") as f:
+                f.write('{"index": 3, "sco')
+            self.assertEqual(read_stream_results(path)["scores"], [7.0, [6.5, 8.0], 5.0])
 
 
 if __name__ == "__main__":
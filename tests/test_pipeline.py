@@ -14,6 +14,22 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from src.pipeline import BenchmarkPipeline
+from src.preflight import run_preflight, format_preflight
+from src.models.diffusion.implementations.example_model import ExampleDiffusionModel
+from src.evaluation import summarize_performance
+from src.utils import Tracer, get_tracer, set_tracer
+
+
+TEST_IMAGE_B64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+
+
+class FailingDiffusionModel(ExampleDiffusionModel):
+    """指令中包含"fail"时编辑失败的测试模型"""
+    
+    def edit_image(self, original_image, edit_instruction, **kwargs):
+        if "fail" in edit_instruction:
+            raise RuntimeError("CUDA out of memory")
+        return original_image.copy()
 
 
 class TestBenchmarkPipeline(unittest.TestCase):
@@ -104,6 +120,170 @@ class TestBenchmarkPipeline(unittest.TestCase):
         except Exception as e:
             self.fail(f"Pipeline run failed: {e}")
 
+    
+    def _write_items(self, instructions):
+        """写入列表格式的测试数据（每条指令一个样本）"""
+        items = [
+            {
+                "subset": "test_category",
+                "original_image_path": f"images/pair_{i}.png",
+                "src_img_b64": TEST_IMAGE_B64,
+                "edit_instruction_en": instruction,
+                "original_description_en": "Test description"
+            }
+            for i, instruction in enumerate(instructions)
+        ]
+        with open(self.test_data_file, 'w') as f:
+            json.dump(items, f)
+    
+    def test_failed_pairs_excluded(self):
+        """编辑失败的样本被标记并排除出统计"""
+        self._write_items(["fail", "Test instruction", "Test instruction"])
+        self.config["diffusion_model"]["class_path"] = "tests.test_pipeline.FailingDiffusionModel"
+        
+        report = BenchmarkPipeline(self.config).run()
+        
+        self.assertEqual(report["category_statistics"]["test_category"]["num_samples"], 2)
+        self.assertEqual(report["failures"]["test_category"]["edit_failed"], ["pair_0"])
+        self.assertEqual(report["summary"]["num_failed"], 1)
+    
+    def test_multi_rubric(self):
+        """多维度评分：每个样本按所有维度评分，报告包含各维度统计"""
+        self.config["prompts"]["other_rubric"] = {
+            "system_prompt": "Other system prompt",
+            "user_prompt_template": "Other: {edit_instruction}"
+        }
+        self.config["evaluation"]["multi_rubric"] = {"enabled": True}
+        self._write_items(["Test instruction", "Another instruction"])
+        
+        pipeline = BenchmarkPipeline(self.config)
+        report = pipeline.run()
+        
+        rubric_stats = report["rubric_statistics"]["test_category"]
+        self.assertEqual(set(rubric_stats), {"test_category", "other_rubric"})
+        self.assertEqual(rubric_stats["test_category"]["mean"], report["category_statistics"]["test_category"]["mean"])
+        self.assertIn("## Rubric Scores", pipeline.reporter.generate_markdown_report(report))
+    
+    def test_save_generated_images(self):
+        """编辑结果由后台写入器保存，报告生成前全部写完"""
+        self._write_items(["Test instruction", "Another instruction"])
+        self.config["evaluation"]["save_generated_images"] = True
+        self.config["evaluation"]["image_writer"] = {"format": "WEBP", "workers": 1, "max_pending": 1}
+        
+        pipeline = BenchmarkPipeline(self.config)
+        pipeline.run()
+        
+        images_dir = Path(self.config["evaluation"]["images_dir"]) / "test_category"
+        self.assertEqual(sorted(p.name for p in images_dir.iterdir()), ["pair_0.webp", "pair_1.webp"])
+        self.assertIsNone(pipeline.image_writer)
+    
+    def test_trace_export(self):
+        """启用trace时保存Chrome trace-event文件，包含各阶段span"""
+        trace_path = Path(self.temp_dir) / "trace.json"
+        self.config["evaluation"]["trace"] = {"enabled": True, "output_path": str(trace_path)}
+        self._write_items(["Test instruction"])
+        
+        previous = get_tracer()
+        try:
+            BenchmarkPipeline(self.config).run()
+        finally:
+            set_tracer(previous)
+        
+        with open(trace_path) as f:
+            events = json.load(f)["traceEvents"]
+        names = {e["name"] for e in events if e["ph"] == "X"}
+        self.assertTrue({"load", "decode", "edit_stage", "swap", "score_stage", "report"} <= names)
+    
+    def test_preflight(self):
+        """运行前检查：配置正确时通过并给出资源估算"""
+        self._write_items(["Test instruction", "Another instruction"])
+        report = run_preflight(self.config)
+        
+        self.assertTrue(report["ok"], format_preflight(report))
+        self.assertEqual(report["estimate"]["total_pairs"], 2)
+        self.assertEqual(report["estimate"]["model_swaps"], 2)
+        self.assertIn("Preflight passed", format_preflight(report))
+    
+    def test_preflight_errors(self):
+        """运行前检查发现prompt模板变量错误和无法导入的class_path"""
+        self._write_items(["Test instruction", "Another instruction"])
+        self.config["prompts"]["test_category"]["user_prompt_template"] = "Test: {original_descripton}"
+        self.config["reward_model"]["class_path"] = "src.models.reward.implementations.example_reward.Missing"
+        report = run_preflight(self.config)
+        
+        self.assertFalse(report["ok"])
+        errors = {check["name"]: check["message"] for check in report["checks"] if check["status"] == "error"}
+        self.assertIn("original_descripton", errors["prompts.test_category"])
+        self.assertIn("2 pairs", errors["prompts.test_category"])
+        self.assertIn("reward_model.class_path", errors)
+    
+    def test_performance_summary(self):
+        """报告包含性能摘要：阶段耗时、编辑/评分延迟和吞吐"""
+        self._write_items(["Test instruction", "Another instruction", "Third instruction"])
+        
+        pipeline = BenchmarkPipeline(self.config)
+        report = pipeline.run()
+        
+        performance = report["performance"]
+        self.assertIn("edit_stage", performance["stage_seconds"])
+        self.assertEqual(performance["edit"]["latency"]["count"], 3)
+        self.assertEqual(performance["score"]["latency"]["count"], 3)
+        self.assertEqual(performance["swap"]["count"], 2)
+        self.assertIn("## Performance", pipeline.reporter.generate_markdown_report(report))
+        
+        self.config["evaluation"]["performance_summary"] = False
+        self.assertNotIn("performance", BenchmarkPipeline(self.config).run())
+
+
+class TestTracer(unittest.TestCase):
+    """测试阶段计时器"""
+    
+    def test_disabled_records_nothing(self):
+        """未启用时span为空操作"""
+        tracer = Tracer()
+        with tracer.span("edit", gpu=0):
+            pass
+        tracer.add_span("sync_batch", 0, 10)
+        self.assertEqual(tracer.events, [])
+        self.assertIsNone(tracer.save("unused.json"))
+    
+    def test_gpu_lanes(self):
+        """带gpu的span放在各自GPU的泳道上"""
+        tracer = Tracer(enabled=True)
+        with tracer.span("edit", cat="diffusion", gpu=0):
+            pass
+        with tracer.span("edit", cat="diffusion", gpu=1):
+            pass
+        with tracer.span("score_stage"):
+            pass
+        
+        edits = tracer.spans(name="edit")
+        self.assertEqual([e["args"]["gpu"] for e in edits], [0, 1])
+        self.assertNotEqual(edits[0]["tid"], edits[1]["tid"])
+        
+        thread_names = {e["args"]["name"] for e in tracer.to_chrome_trace()["traceEvents"]
+                        if e["name"] == "thread_name"}
+        self.assertTrue({"GPU 0", "GPU 1"} <= thread_names)
+    
+    def test_summarize_performance(self):
+        """批量评分的耗时平均分摊到每张图像，各GPU单独统计吞吐"""
+        tracer = Tracer(enabled=True)
+        tracer.add_span("edit_stage", 0, 4_000_000_000)
+        tracer.add_span("score_stage", 4_000_000_000, 6_000_000_000)
+        for gpu in (0, 1):
+            tracer.add_span("edit", 0, 2_000_000_000, cat="diffusion", gpu=gpu)
+            tracer.add_span("edit", 2_000_000_000, 4_000_000_000, cat="diffusion", gpu=gpu)
+        tracer.add_span("score", 4_000_000_000, 6_000_000_000, cat="ipc", gpu=0, num_tasks=4)
+        tracer.add_span("edit", 0, 1, cat="diffusion", gpu=0, error="RuntimeError")
+        
+        summary = summarize_performance(tracer)
+        self.assertEqual(summary["stage_seconds"], {"edit_stage": 4.0, "score_stage": 2.0})
+        self.assertEqual(summary["edit"]["latency"]["count"], 4)
+        self.assertAlmostEqual(summary["edit"]["latency"]["p50"], 2.0)
+        self.assertAlmostEqual(summary["edit"]["per_gpu"]["1"]["images_per_second"], 0.5)
+        self.assertEqual(summary["score"]["latency"]["count"], 4)
+        self.assertAlmostEqual(summary["score"]["latency"]["p99"], 0.5)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,259 @@
+"""
+Unit tests for subprocess reward models
+子进程评分模型测试（使用模拟的standalone脚本，不需要GPU）
+"""
+
+import unittest
+import tempfile
+import shutil
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+from PIL import Image
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.models.reward.implementations import qwen3_vl_multi_gpu_subprocess as subprocess_module
+from src.models.reward.implementations.qwen3_vl_multi_gpu_subprocess import Qwen3VLMultiGPUSubprocessRewardModel
+from src.utils import encode_image_to_base64
+
+
+# 模拟standalone脚本的--serve协议：分数取自user_prompt，能读到原图缓存文件时加0.5
+FAKE_SERVER = '''
+import json, os, sys
+print(json.dumps({"event": "ready"}), flush=True)
+for line in sys.stdin:
+    request = json.loads(line)
+    if request["cmd"] == "score":
+        scores = [float(t["user_prompt"]) + 0.5 * os.path.exists(t.get("original_ref", ""))
+                  for t in request["tasks"]]
+        print(json.dumps({"id": request["id"], "status": "ok", "scores": scores}), flush=True)
+    else:
+        print(json.dumps({"id": request["id"], "status": "ok"}), flush=True)
+        if request["cmd"] == "shutdown":
+            break
+'''
+
+# 模拟故障：cuda:1上的进程在首次评分时崩溃（单次模式下先写出第一个分数）；
+# user_prompt为"bad"的任务总是返回错误（进程保持存活）
+FLAKY_SERVER = '''
+import json, sys
+crash = "cuda:1" in sys.argv
+def score(tasks):
+    if any(t["user_prompt"] == "bad" for t in tasks):
+        raise ValueError("bad sample")
+    return [float(t["user_prompt"]) for t in tasks]
+if "--serve" not in sys.argv:
+    arg = lambda name: sys.argv[sys.argv.index(name) + 1]
+    tasks = json.load(open(arg("--input")))["tasks"]
+    if crash:
+        json.dump({"status": "error", "error": "crashed", "scores": score(tasks[:1])}, open(arg("--output"), "w"))
+        sys.exit(1)
+    json.dump({"status": "success", "scores": score(tasks)}, open(arg("--output"), "w"))
+    sys.exit(0)
+print(json.dumps({"event": "ready"}), flush=True)
+for line in sys.stdin:
+    request = json.loads(line)
+    if request["cmd"] == "score":
+        if crash:
+            sys.exit(1)
+        try:
+            print(json.dumps({"id": request["id"], "status": "ok", "scores": score(request["tasks"])}), flush=True)
+        except ValueError as e:
+            print(json.dumps({"id": request["id"], "status": "error", "error": str(e)}), flush=True)
+    else:
+        print(json.dumps({"id": request["id"], "status": "ok"}), flush=True)
+        if request["cmd"] == "shutdown":
+            break
+'''
+
+
+# 模拟卡住：cuda:1上的进程收到评分请求后不再响应（进程保持存活）；cuda:0每个请求耗时0.2秒
+HANGING_SERVER = '''
+import json, sys, time
+print(json.dumps({"event": "ready"}), flush=True)
+for line in sys.stdin:
+    request = json.loads(line)
+    if request["cmd"] == "score":
+        time.sleep(600 if "cuda:1" in sys.argv else 0.2)
+        print(json.dumps({"id": request["id"], "status": "ok",
+                          "scores": [float(t["user_prompt"]) for t in request["tasks"]]}), flush=True)
+    else:
+        print(json.dumps({"id": request["id"], "status": "ok"}), flush=True)
+        if request["cmd"] == "shutdown":
+            break
+'''
+
+# 单次文件模式：通过--progress-fd逐个发送score事件；cuda:1上的进程在第3个任务时直接退出（不写输出文件）
+STREAMING_SCRIPT = '''
+import json, os, sys
+arg = lambda name: sys.argv[sys.argv.index(name) + 1]
+tasks = json.load(open(arg("--input")))["tasks"]
+progress = os.fdopen(int(arg("--progress-fd")), "w", buffering=1)
+progress.write(json.dumps({"event": "loaded", "device": arg("--device")}) + "\\n")
+print("noise on stdout " * 10000)
+for k, t in enumerate(tasks):
+    if "cuda:1" in sys.argv and k == 2:
+        os._exit(1)
+    progress.write(json.dumps({"event": "score", "index": k, "score": float(t["user_prompt"])}) + "\\n")
+json.dump({"status": "success", "scores": [float(t["user_prompt"]) for t in tasks]}, open(arg("--output"), "w"))
+'''
+
+# 单次流式模式：不使用进度管道（如conda run下没有传给子进程），只在输出文件中逐条写出结果；
+# cuda:1上的进程启动后既不写进度也不写输出，一直卡住
+SILENT_STREAM_SCRIPT = '''
+import json, sys, time
+arg = lambda name: sys.argv[sys.argv.index(name) + 1]
+if "cuda:1" in sys.argv:
+    time.sleep(600)
+with open(arg("--output"), "w", buffering=1) as out:
+    for k, line in enumerate(sys.stdin):
+        time.sleep(0.3)
+        out.write(json.dumps({"index": k, "score": float(json.loads(line)["user_prompt"])}) + "\\n")
+    out.write(json.dumps({"status": "success"}) + "\\n")
+'''
+
+
+class TestMultiGPUSubprocessRewardModel(unittest.TestCase):
+    """测试多GPU子进程评分模型的常驻worker调度"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.script = Path(self.temp_dir) / "fake_server.py"
+        self.script.write_text(FAKE_SERVER)
+        self.config = {
+            "device_ids": [0, 1],
+            "batch_size": 2,
+            "python_path": sys.executable,
+            "script_path": str(self.script),
+            "timeout": 30,
+            "startup_timeout": 30
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _score(self, model, n, prompts=None, **kwargs):
+        images = [Image.new("RGB", (8, 8), color="white") for _ in range(n)]
+        prompts = prompts or [str(i % 10) for i in range(n)]
+        return model.batch_score(
+            edited_images=images,
+            original_descriptions=[""] * n,
+            edit_instructions=[""] * n,
+            system_prompts=[""] * n,
+            user_prompts=prompts,
+            **kwargs
+        )
+
+    def test_persistent_workers_reused(self):
+        """常驻worker在多次batch_score之间保持运行，结果按原顺序返回"""
+        model = Qwen3VLMultiGPUSubprocessRewardModel(self.config)
+        try:
+            self.assertEqual(self._score(model, 7), [float(i) for i in range(7)])
+            pids = [w.process.pid for w in model.workers]
+
+            model.unload_from_gpu()
+            model.load_to_gpu()
+            self.assertEqual(self._score(model, 3), [0.0, 1.0, 2.0])
+            self.assertEqual([w.process.pid for w in model.workers], pids)
+        finally:
+            model.close()
+        self.assertFalse(any(w.alive for w in model.workers))
+
+    def test_compare_with_original_dedup(self):
+        """对比模式：原图按内容只写入缓存一次，跨batch和模型实例复用"""
+        cache_dir = Path(self.temp_dir) / "originals"
+        self.config.update(compare_with_original=True, original_cache_dir=str(cache_dir))
+        originals = [encode_image_to_base64(Image.new("RGB", (8, 8), color=c)) for c in ("red", "red", "blue")]
+        
+        model = Qwen3VLMultiGPUSubprocessRewardModel(self.config)
+        try:
+            scores = self._score(model, 3, original_images=[None] * 3, original_image_b64s=originals)
+            self.assertEqual(scores, [0.5, 1.5, 2.5])
+            self._score(model, 3, original_images=[None] * 3, original_image_b64s=originals)
+        finally:
+            model.close()
+        self.assertEqual(len(list(cache_dir.iterdir())), 2)
+        self.assertEqual(model.original_store.stats, {"hits": 4, "writes": 2})
+        
+        # 新的模型实例（如下一次运行）直接复用已有缓存文件
+        second = Qwen3VLMultiGPUSubprocessRewardModel(dict(self.config, persistent_workers=False))
+        second.original_store.refs(None, originals)
+        self.assertEqual(second.original_store.stats["writes"], 0)
+
+    def test_persistent_failed_tasks_requeued(self):
+        """崩溃GPU上的任务转到健康GPU，坏样本重试耗尽后返回None"""
+        self.script.write_text(FLAKY_SERVER)
+        model = Qwen3VLMultiGPUSubprocessRewardModel(self.config)
+        try:
+            prompts = ["0", "1", "2", "bad", "4", "5", "6"]
+            scores = self._score(model, 7, prompts)
+        finally:
+            model.close()
+        self.assertEqual(scores, [0.0, 1.0, 2.0, None, 4.0, 5.0, 6.0])
+        self.assertEqual(model.last_failed_indices, [3])
+
+    def test_persistent_hung_worker_killed(self):
+        """常驻worker请求超时后被终止，不再领取新任务；剩余任务由健康GPU完成，下次评分前重启"""
+        self.script.write_text(HANGING_SERVER)
+        self.config.update(timeout=1)
+        model = Qwen3VLMultiGPUSubprocessRewardModel(self.config)
+        try:
+            start = time.monotonic()
+            self.assertEqual(self._score(model, 8), [float(i) for i in range(8)])
+            # 只有一次超时（卡住的worker没有在后续块上重复超时）
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertFalse(model.workers[1].alive)
+            
+            model._ensure_workers()
+            self.assertTrue(model.workers[1].alive)
+        finally:
+            model.close()
+    
+    def test_sharded_salvages_partial_scores(self):
+        """非常驻模式：回收失败分片的部分分数，其余任务重试到健康GPU"""
+        self.script.write_text(FLAKY_SERVER)
+        self.config.update(persistent_workers=False, stream_tasks=False)
+        model = Qwen3VLMultiGPUSubprocessRewardModel(self.config)
+        self.assertEqual(self._score(model, 7), [float(i) for i in range(7)])
+        self.assertEqual(model.last_failed_indices, [])
+
+
+    def test_sharded_progress_events(self):
+        """非常驻模式：进度事件经专用管道到达并映射为全局索引；崩溃子进程的流式分数被回收"""
+        self.script.write_text(STREAMING_SCRIPT)
+        self.config.update(persistent_workers=False, stream_tasks=False)
+        model = Qwen3VLMultiGPUSubprocessRewardModel(self.config)
+        events, results = [], {}
+        model.add_progress_callback(lambda gpu_id, event: events.append((gpu_id, event)))
+        
+        scores = self._score(model, 9, on_result=lambda i, score: results.setdefault(i, score))
+        
+        self.assertEqual(scores, [float(i) for i in range(9)])
+        self.assertEqual(results, {i: float(i) for i in range(9)})
+        self.assertIn((1, {"event": "loaded", "device": "cuda:1"}), events)
+        score_events = sorted(event["index"] for _, event in events if event["event"] == "score")
+        self.assertEqual(score_events, list(range(9)))
+        # cuda:1的分片为[1, 3, 5, 7]，崩溃前流式返回了1和3，其余重试到GPU 0
+        self.assertEqual({event["index"] for gpu, event in events if gpu == 1 and event["event"] == "score"}, {1, 3})
+
+    def test_sharded_stall_detection_without_progress_pipe(self):
+        """非常驻模式：进度管道没有事件时按输出文件增长判断进展；启动后一直没有进展的子进程超时被终止"""
+        self.script.write_text(SILENT_STREAM_SCRIPT)
+        self.config.update(persistent_workers=False, stream_tasks=True, timeout=1, startup_timeout=2)
+        model = Qwen3VLMultiGPUSubprocessRewardModel(self.config)
+        with patch.object(subprocess_module, "STALL_POLL_INTERVAL", 0.1):
+            start = time.monotonic()
+            scores = self._score(model, 6)
+        
+        # GPU 0总耗时超过timeout但输出持续增长，不被终止；GPU 1在startup_timeout后被终止，任务重试到GPU 0
+        self.assertEqual(scores, [float(i) for i in range(6)])
+        self.assertEqual(model.last_failed_indices, [])
+        self.assertLess(time.monotonic() - start, 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
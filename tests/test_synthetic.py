@@ -0,0 +1,329 @@
+"""
+Unit tests for synthetic-load components
+合成负载组件测试（合成数据、桩模型、synthetic_standalone子进程）
+"""
+
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import sys
+from pathlib import Path
+from PIL import Image
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data import BenchmarkLoader, generate_synthetic_benchmark, synthetic_prompts
+from src.models.simulation import SimulatedLoad
+from src.models.reward.implementations.qwen3_vl_multi_gpu_subprocess import Qwen3VLMultiGPUSubprocessRewardModel
+from src.pipeline import BenchmarkPipeline
+
+
+class TestSyntheticLoad(unittest.TestCase):
+    """测试合成数据与桩模型"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data_path = str(Path(self.temp_dir) / "synthetic.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_generated_benchmark_loads(self):
+        """合成数据可被BenchmarkLoader加载并解码"""
+        categories = generate_synthetic_benchmark(self.data_path, num_categories=2, pairs_per_category=3,
+                                                  image_size=(16, 8))
+        data = BenchmarkLoader().load(self.data_path, categories, decode_images=True)
+        self.assertEqual(data.total_pairs, 6)
+        pair = data.get_category(categories[1]).data_pairs[0]
+        self.assertEqual(pair.original_image.size, (16, 8))
+
+    def test_failures_deterministic(self):
+        """失败由(seed, key)决定，与调用顺序无关"""
+        load = SimulatedLoad({"failure_rate": 0.3, "seed": 1})
+        keys = [f"pair_{i}" for i in range(200)]
+        failed = [k for k in keys if load.fails(k)]
+        self.assertEqual(failed, [k for k in reversed(keys) if load.fails(k)][::-1])
+        self.assertTrue(30 < len(failed) < 90)
+        self.assertEqual(load.sample_latency(), 0.0)
+
+    def test_pipeline_with_stub_models(self):
+        """桩模型跑通完整pipeline：失败样本被排除，性能摘要按模拟GPU统计"""
+        categories = generate_synthetic_benchmark(self.data_path, num_categories=2, pairs_per_category=6,
+                                                  image_size=(16, 16))
+        config = {
+            "benchmark": {"data_path": self.data_path, "categories": categories},
+            "diffusion_model": {
+                "class_path": "src.models.diffusion.implementations.synthetic_model.SyntheticDiffusionModel",
+                "params": {"device_ids": [0, 1], "failure_rate": 0.2}
+            },
+            "reward_model": {
+                "class_path": "src.models.reward.implementations.synthetic_reward.SyntheticRewardModel",
+                "params": {"device_ids": [0, 1], "batch_size": 2, "transport": "base64"}
+            },
+            "prompts": synthetic_prompts(categories),
+            "evaluation": {"output_dir": str(Path(self.temp_dir) / "outputs"), "metrics": ["mean"]},
+            "logging": {"level": "WARNING", "console_output": False, "file_output": False}
+        }
+
+        report = BenchmarkPipeline(config).run()
+        num_failed = report["summary"].get("num_failed", 0)
+        self.assertGreater(num_failed, 0)
+        self.assertEqual(report["overall_statistics"]["num_samples"], 12 - num_failed)
+        self.assertEqual(set(report["performance"]["edit"]["per_gpu"]), {"0", "1"})
+        self.assertEqual(report["performance"]["score"]["latency"]["count"], 12 - num_failed)
+        self.assertGreaterEqual(report["performance"]["prefetch"]["wait_seconds"], 0.0)
+
+        # 再次运行结果一致
+        self.assertEqual(BenchmarkPipeline(config).run()["overall_statistics"], report["overall_statistics"])
+
+    def test_sampling_mode_extends_sample(self):
+        """抽样模式只处理抽中的样本并估计全量平均分；增大k后只编辑新增样本，已有分数被复用"""
+        categories = generate_synthetic_benchmark(self.data_path, num_categories=2, pairs_per_category=8,
+                                                  image_size=(16, 16))
+        output_dir = Path(self.temp_dir) / "outputs"
+        config = {
+            "benchmark": {"data_path": self.data_path, "categories": categories},
+            "diffusion_model": {
+                "class_path": "src.models.diffusion.implementations.synthetic_model.SyntheticDiffusionModel",
+                "params": {"device_ids": [0]}
+            },
+            "reward_model": {
+                "class_path": "src.models.reward.implementations.synthetic_reward.SyntheticRewardModel",
+                "params": {"device_ids": [0], "batch_size": 2}
+            },
+            "prompts": synthetic_prompts(categories),
+            "evaluation": {
+                "output_dir": str(output_dir),
+                "metrics": ["mean"],
+                "sampling": {"enabled": True, "pairs_per_category": 3,
+                             "state_path": str(output_dir / "sampling_state.json")}
+            },
+            "logging": {"level": "WARNING", "console_output": False, "file_output": False}
+        }
+
+        first = BenchmarkPipeline(config).run()
+        self.assertEqual(first["overall_statistics"]["num_samples"], 6)
+        for category in categories:
+            stats = first["sampling"]["categories"][category]
+            self.assertEqual((stats["sampled"], stats["population"], stats["reused"], stats["new"]), (3, 8, 0, 3))
+            self.assertLess(stats["ci_low"], stats["ci_high"])
+        self.assertEqual(first["sampling"]["overall"]["population"], 16)
+
+        config["evaluation"]["sampling"]["pairs_per_category"] = 5
+        pipeline = BenchmarkPipeline(config)
+        second = pipeline.run()
+        for category in categories:
+            stats = second["sampling"]["categories"][category]
+            self.assertEqual((stats["sampled"], stats["reused"], stats["new"]), (5, 3, 2))
+        self.assertEqual(pipeline.tracer.spans("edit_stage")[0]["args"]["num_images"], 2)
+
+    def test_adaptive_mode_stops_early(self):
+        """自适应模式：与基线比较有定论的类别提前停止，其余类别用完全部样本；报告记录实际使用的样本数"""
+        categories = generate_synthetic_benchmark(self.data_path, num_categories=2, pairs_per_category=12,
+                                                  image_size=(16, 16))
+        baseline_path = Path(self.temp_dir) / "baseline.json"
+        baseline_path.write_text(json.dumps({"category_statistics": {categories[0]: {"mean": 0.0}}}))
+        config = {
+            "benchmark": {"data_path": self.data_path, "categories": categories},
+            "diffusion_model": {
+                "class_path": "src.models.diffusion.implementations.synthetic_model.SyntheticDiffusionModel",
+                "params": {"device_ids": [0]}
+            },
+            "reward_model": {
+                "class_path": "src.models.reward.implementations.synthetic_reward.SyntheticRewardModel",
+                "params": {"device_ids": [0], "batch_size": 2}
+            },
+            "prompts": synthetic_prompts(categories),
+            "evaluation": {
+                "output_dir": str(Path(self.temp_dir) / "outputs"),
+                "metrics": ["mean"],
+                "adaptive": {"enabled": True, "batch_size": 4, "min_pairs": 4, "target_half_width": 1e-6,
+                             "baseline_report": str(baseline_path)}
+            },
+            "logging": {"level": "WARNING", "console_output": False, "file_output": False}
+        }
+
+        report = BenchmarkPipeline(config).run()
+        stats = report["adaptive"]["categories"]
+        self.assertEqual((stats[categories[0]]["pairs_used"], stats[categories[0]]["stop_reason"]),
+                         (4, "baseline_decisive"))
+        self.assertEqual((stats[categories[1]]["pairs_used"], stats[categories[1]]["stop_reason"]),
+                         (12, "exhausted"))
+        self.assertEqual(report["summary"]["pairs_used"], {categories[0]: 4, categories[1]: 12})
+        self.assertEqual(report["overall_statistics"]["num_samples"], 16)
+        # 默认每轮编辑4批：两个类别都只切换一次模型，类别0停止点之后的8个样本被丢弃
+        self.assertEqual([(stats[c]["swaps"], stats[c]["pairs_discarded"]) for c in categories], [(1, 8), (1, 0)])
+        self.assertGreaterEqual(report["adaptive"]["swap_seconds"], 0.0)
+        
+        # 每批切换一次模型时停止点和估计相同
+        config["evaluation"]["adaptive"]["edit_batches_per_swap"] = 1
+        per_batch = BenchmarkPipeline(config).run()["adaptive"]["categories"]
+        for category in categories:
+            self.assertEqual((per_batch[category]["pairs_used"], per_batch[category]["estimated_mean"]),
+                             (stats[category]["pairs_used"], stats[category]["estimated_mean"]))
+        self.assertEqual(per_batch[categories[1]]["swaps"], 5)
+
+    def test_spill_mode_matches_in_memory(self):
+        """溢写模式按块评分的结果与全内存模式一致，评分时最多驻留一块图像，溢写目录被清理"""
+        categories = generate_synthetic_benchmark(self.data_path, num_categories=2, pairs_per_category=5,
+                                                  image_size=(16, 16))
+        config = {
+            "benchmark": {"data_path": self.data_path, "categories": categories},
+            "diffusion_model": {
+                "class_path": "src.models.diffusion.implementations.synthetic_model.SyntheticDiffusionModel",
+                "params": {"device_ids": [0, 1], "failure_rate": 0.2}
+            },
+            "reward_model": {
+                "class_path": "src.models.reward.implementations.synthetic_reward.SyntheticRewardModel",
+                "params": {"device_ids": [0], "batch_size": 2}
+            },
+            "prompts": synthetic_prompts(categories),
+            "evaluation": {"output_dir": str(Path(self.temp_dir) / "outputs"), "metrics": ["mean"]},
+            "logging": {"level": "WARNING", "console_output": False, "file_output": False}
+        }
+        in_memory = BenchmarkPipeline(config).run()
+
+        spill_dir = Path(self.temp_dir) / "spill"
+        config["evaluation"]["memory"] = {
+            "spill_edited_images": True, "spill_dir": str(spill_dir), "score_chunk_size": 2, "max_rss_mb": 1e6
+        }
+        config["benchmark"]["image_cache_dir"] = str(Path(self.temp_dir) / "image_cache")
+        pipeline = BenchmarkPipeline(config)
+        loaded = []
+        load_data = pipeline._load_benchmark_data
+        pipeline._load_benchmark_data = lambda: loaded.append(load_data()) or loaded[0]
+        
+        # 每次评分调用时驻留内存的图像数（不超过一块；评分模型不对比原图时不读取原图）
+        resident = []
+        batch_score = pipeline.reward_model.batch_score
+        def counting_batch_score(*args, **kwargs):
+            pairs = loaded[0].get_all_pairs()
+            resident.append((sum(p.is_loaded("edited_image") for p in pairs),
+                             sum(p.is_loaded("original_image") or p.is_loaded("original_image_b64") for p in pairs)))
+            return batch_score(*args, **kwargs)
+        pipeline.reward_model.batch_score = counting_batch_score
+        report = pipeline.run()
+        self.assertTrue(resident)
+        self.assertTrue(all(edited <= 2 and originals == 0 for edited, originals in resident), resident)
+        self.assertTrue(any(edited for edited, _ in resident))
+
+        self.assertEqual(report["overall_statistics"], in_memory["overall_statistics"])
+        memory = report["performance"]["memory"]
+        self.assertEqual(memory["spill"]["written"], report["overall_statistics"]["num_samples"])
+        self.assertTrue(memory["within_budget"])
+        self.assertEqual(list(spill_dir.iterdir()), [])
+        pairs = loaded[0].get_all_pairs()
+        self.assertFalse(any(p.is_loaded("original_image") or p.is_loaded("edited_image")
+                             or p.is_loaded("original_image_b64") for p in pairs))
+        self.assertTrue(all(p.edited_image_ref for p in pairs if p.status == "scored"))
+
+    def test_synthetic_standalone_ipc(self):
+        """synthetic_standalone.py可替代真实评分脚本（编辑图以raw格式并行编码传输），模拟失败的任务返回None"""
+        scorer_config = {"failure_rate": 0.3, "seed": 2}
+        os.environ["SYNTHETIC_SCORER_CONFIG"] = json.dumps(scorer_config)
+        self.addCleanup(os.environ.pop, "SYNTHETIC_SCORER_CONFIG", None)
+        model = Qwen3VLMultiGPUSubprocessRewardModel({
+            "device_ids": [0, 1],
+            "batch_size": 2,
+            "transport_format": "raw",
+            "encode_workers": 2,
+            "python_path": sys.executable,
+            "script_path": str(project_root / "src/models/reward/synthetic_standalone.py"),
+            "timeout": 30,
+            "startup_timeout": 30
+        })
+        load = SimulatedLoad(scorer_config)
+        prompts = [f"prompt {i}" for i in range(5)]
+        try:
+            scores = model.batch_score(
+                edited_images=[Image.new("RGB", (8, 8)) for _ in prompts],
+                original_descriptions=[""] * 5,
+                edit_instructions=[""] * 5,
+                system_prompts=[""] * 5,
+                user_prompts=prompts
+            )
+        finally:
+            model.close()
+        expected_failed = [i for i, p in enumerate(prompts) if load.fails(p)]
+        self.assertTrue(expected_failed)
+        self.assertEqual(model.last_failed_indices, expected_failed)
+        self.assertTrue(all(5.0 <= s <= 9.0 for i, s in enumerate(scores) if i not in expected_failed))
+
+    def test_streamed_one_shot_matches_persistent(self):
+        """非常驻流式模式（任务经stdin分块读入、结果逐条写回）：失败分片中已完成的分数被回收，且与常驻模式一致"""
+        scorer_config = {"failure_rate": 0.2, "seed": 3}
+        os.environ["SYNTHETIC_SCORER_CONFIG"] = json.dumps(scorer_config)
+        self.addCleanup(os.environ.pop, "SYNTHETIC_SCORER_CONFIG", None)
+        prompts = [f"prompt {i}" for i in range(11)]
+        
+        results = {}
+        for persistent in (True, False):
+            model = Qwen3VLMultiGPUSubprocessRewardModel({
+                "device_ids": [0, 1],
+                "batch_size": 1,
+                "persistent_workers": persistent,
+                "python_path": sys.executable,
+                "script_path": str(project_root / "src/models/reward/synthetic_standalone.py"),
+                "timeout": 30,
+                "startup_timeout": 30
+            })
+            try:
+                scores = model.batch_score(
+                    edited_images=[Image.new("RGB", (8, 8))] * len(prompts),
+                    original_descriptions=[""] * len(prompts),
+                    edit_instructions=[""] * len(prompts),
+                    system_prompts=[""] * len(prompts),
+                    user_prompts=prompts
+                )
+            finally:
+                model.close()
+            results[persistent] = (scores, model.last_failed_indices)
+        
+        # 失败的样本在两种模式下都无分数；非常驻模式下失败分片中排在失败样本之后的任务也可能无分数，
+        # 但回收到的分数与常驻模式一致
+        load = SimulatedLoad(scorer_config)
+        failing = [i for i, p in enumerate(prompts) if load.fails(p)]
+        self.assertTrue(failing)
+        self.assertEqual(results[True][1], failing)
+        self.assertTrue(set(failing) <= set(results[False][1]))
+        salvaged = [i for i, score in enumerate(results[False][0]) if score is not None]
+        self.assertTrue(salvaged)
+        for i in salvaged:
+            self.assertEqual(results[False][0][i], results[True][0][i])
+    
+    def test_host_memory_prefetch(self):
+        """host_memory预热以--start-offloaded启动常驻worker，首次评分前自动移回GPU"""
+        os.environ["SYNTHETIC_SCORER_CONFIG"] = "{}"
+        self.addCleanup(os.environ.pop, "SYNTHETIC_SCORER_CONFIG", None)
+        model = Qwen3VLMultiGPUSubprocessRewardModel({
+            "device_ids": [0, 1],
+            "python_path": sys.executable,
+            "script_path": str(project_root / "src/models/reward/synthetic_standalone.py"),
+            "prefetch": "host_memory",
+            "timeout": 30,
+            "startup_timeout": 30
+        })
+        try:
+            model.prefetch()
+            self.assertTrue(all(w.alive and "--start-offloaded" in w.cmd for w in model.workers))
+            self.assertTrue(model._workers_offloaded)
+
+            scores = model.batch_score(
+                edited_images=[Image.new("RGB", (8, 8))] * 3,
+                original_descriptions=[""] * 3,
+                edit_instructions=[""] * 3,
+                system_prompts=[""] * 3,
+                user_prompts=[f"prompt {i}" for i in range(3)]
+            )
+        finally:
+            model.close()
+        self.assertFalse(model._workers_offloaded)
+        self.assertEqual(len(scores), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
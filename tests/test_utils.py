@@ -0,0 +1,173 @@
+"""
+Unit tests for utility modules
+工具模块测试
+"""
+
+import unittest
+import tempfile
+import shutil
+import threading
+import types
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+from PIL import Image
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.utils import (AsyncImageWriter, ImageSpillStore, profile_imports, format_import_report,
+                       model_weight_files, prefetch_files)
+
+
+class BlockingImage:
+    """save()阻塞到release被设置的假图像（用于测试背压）"""
+
+    def __init__(self, release: threading.Event):
+        self.release = release
+
+    def save(self, f, format=None, **params):
+        self.release.wait(10)
+        Image.new("RGB", (4, 4)).save(f, format=format, **params)
+
+
+class TestAsyncImageWriter(unittest.TestCase):
+    """测试后台图像写入器"""
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_flush_writes_all_images(self):
+        """flush返回时所有图像已写入，不留临时文件"""
+        writer = AsyncImageWriter(num_workers=2, max_pending=2, compress_level=1)
+        for i in range(6):
+            writer.submit(Image.new("RGB", (16, 16), color="red"), str(self.temp_dir / "cat" / f"{i}.png"))
+        stats = writer.close()
+
+        self.assertEqual(stats["written"], 6)
+        self.assertEqual(sorted(p.name for p in (self.temp_dir / "cat").iterdir()),
+                         [f"{i}.png" for i in range(6)])
+        self.assertEqual(Image.open(self.temp_dir / "cat" / "0.png").size, (16, 16))
+
+    def test_backpressure(self):
+        """队列满时submit阻塞，直到写入线程取走图像"""
+        release = threading.Event()
+        writer = AsyncImageWriter(num_workers=1, max_pending=1)
+        writer.submit(BlockingImage(release), str(self.temp_dir / "a.png"))  # 正在写入
+        writer.submit(BlockingImage(release), str(self.temp_dir / "b.png"))  # 占满队列
+
+        third = threading.Thread(target=writer.submit,
+                                 args=(BlockingImage(release), str(self.temp_dir / "c.png")))
+        third.start()
+        third.join(0.2)
+        self.assertTrue(third.is_alive())
+
+        release.set()
+        third.join(5)
+        self.assertEqual(writer.close()["written"], 3)
+
+    def test_format_and_sync_mode(self):
+        """WEBP格式使用对应扩展名；num_workers=0时同步写入，失败只计数"""
+        writer = AsyncImageWriter(num_workers=0, image_format="webp")
+        path = writer.path_for(str(self.temp_dir), "pair_1")
+        self.assertEqual(path.suffix, ".webp")
+        writer.submit(Image.new("RGB", (8, 8)), str(path))
+        self.assertTrue(path.exists())
+
+        (self.temp_dir / "not_a_dir").write_text("")
+        writer.submit(Image.new("RGB", (8, 8)), str(self.temp_dir / "not_a_dir" / "pair_2.webp"))
+        self.assertEqual(writer.close(), {"written": 1, "failed": 1, "bytes": path.stat().st_size})
+
+
+class TestImageSpillStore(unittest.TestCase):
+    """测试编辑结果的溢写存储"""
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_round_trip_and_cleanup(self):
+        """写入的图像可无损读回；discard删除类别目录，cleanup删除整个运行目录"""
+        store = ImageSpillStore(str(self.temp_dir), max_pending=1)
+        image = Image.effect_noise((12, 10), 64).convert("RGB")
+        path_a = store.put("cat_a", "pair_0", image)
+        path_b = store.put("cat_b", "pair_0", image)
+        self.assertTrue(path_a.endswith(".bmp"))
+        self.assertEqual(store.get(path_a).tobytes(), image.tobytes())
+
+        store.discard("cat_a")
+        self.assertFalse(Path(path_a).exists())
+        self.assertTrue(Path(path_b).exists())
+        self.assertEqual(store.cleanup()["written"], 2)
+        self.assertEqual(list(self.temp_dir.iterdir()), [])
+
+
+class TestImportProfile(unittest.TestCase):
+    """测试导入耗时分析"""
+
+    def test_lightweight_config_skips_torch(self):
+        """pipeline、示例/合成模型和子进程评分模型的主进程端不加载torch"""
+        report = profile_imports([
+            "src.pipeline",
+            "src.models.diffusion.implementations.example_model",
+            "src.models.reward.implementations.synthetic_reward",
+            "src.models.reward.implementations.qwen3_vl_multi_gpu_subprocess",
+        ], cwd=str(project_root))
+
+        self.assertEqual(report["heavy"], [])
+        modules = {entry["module"]: entry for entry in report["modules"]}
+        self.assertEqual(modules["src.pipeline"]["depth"], 0)
+        self.assertGreater(report["total_ms"], 0)
+        self.assertIn("Top 5 by self time", format_import_report(report, top=5))
+
+    def test_lazy_package_attributes(self):
+        """实现包按需导入类，未知名称抛出AttributeError"""
+        from src.models.reward import implementations
+        self.assertIn("ExampleRewardModel", dir(implementations))
+        self.assertEqual(implementations.SyntheticRewardModel.__name__, "SyntheticRewardModel")
+        with self.assertRaises(AttributeError):
+            implementations.MissingModel
+
+
+class TestWeightPrefetch(unittest.TestCase):
+    """测试权重文件预读"""
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_weight_files_and_prefetch(self):
+        """优先使用safetensors；预读全部字节，stop_event设置后立即停止；非本地目录返回空列表"""
+        for name, size in (("model-00002.safetensors", 3000), ("model-00001.safetensors", 5000),
+                           ("pytorch_model.bin", 100)):
+            (self.temp_dir / name).write_bytes(b"\0" * size)
+        files = model_weight_files(str(self.temp_dir))
+        self.assertEqual([f.name for f in files], ["model-00001.safetensors", "model-00002.safetensors"])
+        with patch.dict(sys.modules, {"huggingface_hub": None}):
+            self.assertEqual(model_weight_files("Qwen/Qwen3-VL-30B-Instruct"), [])
+
+        # hub模型ID解析到HuggingFace缓存中的snapshot目录（只查本地缓存）
+        hub = types.ModuleType("huggingface_hub")
+        hub.snapshot_download = MagicMock(return_value=str(self.temp_dir))
+        with patch.dict(sys.modules, {"huggingface_hub": hub}):
+            self.assertEqual(model_weight_files("Qwen/Qwen3-VL-30B-Instruct"), files)
+        hub.snapshot_download.assert_called_once_with("Qwen/Qwen3-VL-30B-Instruct", local_files_only=True)
+
+        stats = prefetch_files(files, chunk_mb=1)
+        self.assertEqual((stats["files"], stats["bytes"]), (2, 8000))
+
+        stop = threading.Event()
+        stop.set()
+        self.assertEqual(prefetch_files(files, stop_event=stop)["bytes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+"""
+图像编解码与传输路径微基准
+测量decode_base64_image、encode_image_to_base64、save_image在不同格式（PNG、PNG快速压缩、无损WebP、原始字节）
+下的耗时、CPU时间、吞吐和输出大小，以及子进程评分模型在每种transport_format（png、webp、raw）下的实际
+编码路径（_encode_task）和子进程的解码（decode_transport_image），用于选择传输与存储格式
+
+用法:
+    python tools/bench_codecs.py --sizes 256 512 1024 2048 --repeat 5
+    python tools/bench_codecs.py --image-files data/samples/*.png --output codecs.csv
+    python tools/bench_codecs.py --formats png webp_lossless --output codecs.json
+    python tools/bench_codecs.py --transport-formats png raw
+"""
+
+import argparse
+import base64
+import csv
+import io
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, features
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.models.reward.implementations.qwen3_vl_multi_gpu_subprocess import Qwen3VLMultiGPUSubprocessRewardModel
+from src.models.reward.qwen3_vl_utils import TRANSPORT_FORMATS, decode_transport_image
+from src.utils import decode_base64_image, encode_image_to_base64, save_image
+
+# 格式 -> (PIL格式名, 保存参数)；raw为不压缩的RGB字节
+FORMATS = {
+    "png": ("PNG", {}),
+    "png_fast": ("PNG", {"compress_level": 1}),
+    "webp_lossless": ("WEBP", {"lossless": True, "quality": 0, "method": 0}),
+    "raw": (None, {}),
+}
+
+FIELDS = ["image", "width", "height", "format", "operation", "wall_ms", "cpu_ms",
+          "megapixels_per_s", "bytes", "base64_bytes", "compression_ratio"]
+
+
+def natural_image(size: int, seed: int = 0) -> Image.Image:
+    """
+    近似自然照片的合成图像：平滑渐变加低幅噪声
+    （纯噪声几乎不可压缩，纯渐变又压缩得过好，两者都不代表真实数据）
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    base = np.stack([x * 200 + 20, y * 180 + 40, (1 - x) * 150 + y * 60], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 6, base.shape), 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+
+def encode_bytes(image: Image.Image, fmt: str) -> bytes:
+    """按格式编码为字节"""
+    pil_format, params = FORMATS[fmt]
+    if pil_format is None:
+        return image.tobytes()
+    buffered = io.BytesIO()
+    image.save(buffered, format=pil_format, **params)
+    return buffered.getvalue()
+
+
+def timed(func, repeat: int):
+    """
+    重复执行func，返回(墙钟中位数ms, CPU时间中位数ms, 最后一次的返回值)
+    """
+    walls, cpus, result = [], [], None
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = func()
+        cpus.append((time.process_time() - cpu_start) * 1000)
+        walls.append((time.perf_counter() - wall_start) * 1000)
+    return statistics.median(walls), statistics.median(cpus), result
+
+
+def bench_image(name: str, image: Image.Image, formats, repeat: int, scorers, temp_dir: Path):
+    """对单张图像测量所有格式和操作"""
+    image = image.convert("RGB")
+    width, height = image.size
+    raw_size = width * height * 3
+    rows = []
+
+    def row(fmt, operation, wall_ms, cpu_ms, num_bytes=None, b64_bytes=None):
+        rows.append({
+            "image": name, "width": width, "height": height, "format": fmt, "operation": operation,
+            "wall_ms": round(wall_ms, 3), "cpu_ms": round(cpu_ms, 3),
+            "megapixels_per_s": round(width * height / 1e6 / (wall_ms / 1000), 2) if wall_ms > 0 else None,
+            "bytes": num_bytes, "base64_bytes": b64_bytes,
+            "compression_ratio": round(raw_size / num_bytes, 3) if num_bytes else None,
+        })
+
+    for fmt in formats:
+        pil_format, params = FORMATS[fmt]
+        data = encode_bytes(image, fmt)
+        b64 = base64.b64encode(data).decode("ascii")
+
+        # 编码（字节 + base64）
+        if not params and pil_format is not None:
+            # 无额外参数的格式使用项目中的实际函数
+            encode = lambda: encode_image_to_base64(image, format=pil_format)
+        else:
+            encode = lambda: base64.b64encode(encode_bytes(image, fmt)).decode("ascii")
+        wall, cpu, _ = timed(encode, repeat)
+        row(fmt, "encode_base64", wall, cpu, len(data), len(b64))
+
+        # 解码（base64 -> RGB图像）
+        if pil_format is None:
+            decode = lambda: Image.frombytes("RGB", (width, height), base64.b64decode(b64))
+        else:
+            decode = lambda: decode_base64_image(b64)
+        wall, cpu, _ = timed(lambda: decode().load(), repeat)
+        row(fmt, "decode_base64", wall, cpu, len(data), len(b64))
+
+        # 保存到磁盘
+        path = temp_dir / f"{name}.{fmt}"
+        if pil_format is None:
+            save = lambda: path.write_bytes(image.tobytes())
+        elif params:
+            # save_image不支持编码参数，带参数的格式直接调用PIL
+            save = lambda: image.save(path, format=pil_format, **params)
+        else:
+            save = lambda: save_image(image, str(path), format=pil_format)
+        wall, cpu, _ = timed(save, repeat)
+        row(fmt, "save", wall, cpu, path.stat().st_size)
+
+    # 子进程评分模型的实际传输路径：编码（像素预算缩放 + transport_format + base64）和子进程中的解码
+    for transport_format, scorer in scorers.items():
+        wall, cpu, task = timed(lambda: scorer._encode_task(image, {}), repeat)
+        num_bytes, b64_bytes = len(base64.b64decode(task["image_b64"])), len(task["image_b64"])
+        row(transport_format, "subprocess_encode", wall, cpu, num_bytes, b64_bytes)
+        wall, cpu, _ = timed(lambda: decode_transport_image(task).load(), repeat)
+        row(transport_format, "subprocess_decode", wall, cpu, num_bytes, b64_bytes)
+    return rows
+
+
+def print_table(rows):
+    """打印结果表"""
+    print(f"{'image':>14} {'format':>14} {'operation':>18} {'wall ms':>9} {'cpu ms':>9} "
+          f"{'MP/s':>8} {'bytes':>11} {'ratio':>7}")
+    print("-" * 98)
+    for r in rows:
+        print(f"{r['image']:>14} {r['format']:>14} {r['operation']:>18} {r['wall_ms']:>9.2f} {r['cpu_ms']:>9.2f} "
+              f"{r['megapixels_per_s'] or 0:>8.1f} {r['bytes'] or 0:>11} {r['compression_ratio'] or 0:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark image codec and transport paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024, 2048],
+                        help="Square synthetic image sizes")
+    parser.add_argument("--image-files", nargs="*", default=[], help="Benchmark real images instead")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=list(FORMATS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--transport-formats", nargs="+", default=list(TRANSPORT_FORMATS),
+                        choices=list(TRANSPORT_FORMATS), help="Subprocess transport formats to benchmark")
+    parser.add_argument("--max-pixels", type=int, default=None,
+                        help="Pixel budget applied by the subprocess encode path")
+    parser.add_argument("--output", default=None, help="Write results as .csv or .json")
+    args = parser.parse_args()
+
+    formats = list(args.formats)
+    transport_formats = list(args.transport_formats)
+    if not features.check("webp"):
+        if "webp_lossless" in formats:
+            print("Pillow is built without WebP support, skipping webp_lossless")
+            formats.remove("webp_lossless")
+        if "webp" in transport_formats:
+            print("Pillow is built without WebP support, skipping the webp transport format")
+            transport_formats.remove("webp")
+
+    if args.image_files:
+        images = [(Path(p).stem, Image.open(p)) for p in args.image_files]
+    else:
+        images = [(f"natural_{size}", natural_image(size)) for size in args.sizes]
+
+    # 只用于调用_encode_task，不会启动子进程
+    scorers = {
+        transport_format: Qwen3VLMultiGPUSubprocessRewardModel({
+            "device_ids": [0], "persistent_workers": False, "max_pixels": args.max_pixels,
+            "transport_format": transport_format
+        })
+        for transport_format in transport_formats
+    }
+
+    rows = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, image in images:
+            rows.extend(bench_image(name, image, formats, args.repeat, scorers, Path(temp_dir)))
+
+    print_table(rows)
+
+    if args.output:
+        if args.output.endswith(".json"):
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(rows, f, indent=2)
+        else:
+            with open(args.output, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+        print(f"\nResults saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
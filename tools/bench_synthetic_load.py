@@ -0,0 +1,211 @@
+"""
+合成负载基准测试（不需要GPU）
+使用桩模型（模拟延迟分布、失败率和内存占用）和合成benchmark数据运行完整的BenchmarkPipeline，
+测量pipeline自身的编排开销：加载、解码、调度、IPC和报告生成
+
+用法:
+    # 进程内桩模型，4个模拟GPU
+    python tools/bench_synthetic_load.py --categories 3 --pairs-per-category 32 --gpus 4
+
+    # 通过真实的子进程评分模型和synthetic_standalone.py测量IPC开销
+    python tools/bench_synthetic_load.py --reward ipc --gpus 2
+
+    # 保存结果，之后与之对比（编排开销超出容差时退出码为1，可用于CI）
+    python tools/bench_synthetic_load.py --output bench.json
+    python tools/bench_synthetic_load.py --baseline bench.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data import generate_synthetic_benchmark, synthetic_prompts
+from src.pipeline import BenchmarkPipeline
+
+
+def build_config(args, data_path: str, categories: list, output_dir: str) -> dict:
+    """构建使用桩模型的pipeline配置"""
+    device_ids = list(range(args.gpus))
+    latency = lambda mean: {"distribution": args.distribution, "mean": mean, "std": mean * args.jitter}
+
+    diffusion_params = {
+        "device_ids": device_ids,
+        "latency": latency(args.edit_latency),
+        "swap_latency": args.swap_latency,
+        "failure_rate": args.failure_rate,
+        "memory_mb": args.memory_mb,
+        "seed": args.seed
+    }
+    scorer_load = {
+        "latency": latency(args.score_latency),
+        "batch_overhead": args.batch_overhead,
+        "swap_latency": args.swap_latency,
+        "failure_rate": args.failure_rate,
+        "seed": args.seed
+    }
+
+    if args.reward == "ipc":
+        # 子进程通过环境变量读取模拟参数
+        os.environ["SYNTHETIC_SCORER_CONFIG"] = json.dumps(scorer_load)
+        reward_model = {
+            "class_path": "src.models.reward.implementations.qwen3_vl_multi_gpu_subprocess."
+                          "Qwen3VLMultiGPUSubprocessRewardModel",
+            "params": {
+                "device_ids": device_ids,
+                "batch_size": args.batch_size,
+                "python_path": sys.executable,
+                "script_path": str(project_root / "src/models/reward/synthetic_standalone.py"),
+                "persistent_workers": not args.one_shot,
+                "timeout": 600
+            }
+        }
+    else:
+        reward_model = {
+            "class_path": "src.models.reward.implementations.synthetic_reward.SyntheticRewardModel",
+            "params": dict(scorer_load, device_ids=device_ids, batch_size=args.batch_size,
+                           memory_mb=args.memory_mb, transport=args.transport)
+        }
+
+    return {
+        "benchmark": {"data_path": data_path, "categories": categories},
+        "diffusion_model": {
+            "class_path": "src.models.diffusion.implementations.synthetic_model.SyntheticDiffusionModel",
+            "params": diffusion_params
+        },
+        "reward_model": reward_model,
+        "prompts": synthetic_prompts(categories),
+        "evaluation": {
+            "output_dir": output_dir,
+            "save_generated_images": False,
+            "metrics": ["mean", "std", "median", "min", "max"],
+            "performance_summary": True,
+            "trace": {"enabled": args.trace is not None, "output_path": args.trace}
+        },
+        "logging": {"level": "WARNING", "console_output": False, "file_output": False}
+    }
+
+
+def run_once(config: dict) -> dict:
+    """运行一次pipeline，返回性能摘要和编排开销"""
+    pipeline = BenchmarkPipeline(config)
+    try:
+        report = pipeline.run()
+    finally:
+        close = getattr(pipeline.reward_model, "close", None)
+        if close is not None:
+            close()
+
+    performance = report["performance"]
+    # 关键路径上的模型耗时：每个阶段取最忙的GPU，加上模型切换
+    model_seconds = performance["swap"]["total_seconds"]
+    for phase in ("edit", "score"):
+        busy = [stats["busy_seconds"] for stats in performance[phase]["per_gpu"].values()]
+        model_seconds += max(busy, default=0.0)
+    num_images = report["metadata"]["total_pairs"]
+    overhead = performance["wall_seconds"] - model_seconds
+    return {
+        "wall_seconds": performance["wall_seconds"],
+        "model_seconds": model_seconds,
+        "overhead_seconds": overhead,
+        "overhead_ms_per_image": 1000 * overhead / num_images if num_images else 0.0,
+        "num_images": num_images,
+        "num_failed": report["summary"].get("num_failed", 0),
+        "performance": performance
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic-load benchmark of the pipeline orchestration")
+    parser.add_argument("--categories", type=int, default=3)
+    parser.add_argument("--pairs-per-category", type=int, default=16)
+    parser.add_argument("--image-size", type=int, nargs=2, default=[512, 512], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--image-format", default="PNG", choices=["PNG", "JPEG"])
+    parser.add_argument("--gpus", type=int, default=2, help="Number of simulated GPUs")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--edit-latency", type=float, default=0.02, help="Mean edit latency per image (s)")
+    parser.add_argument("--score-latency", type=float, default=0.01, help="Mean score latency per image (s)")
+    parser.add_argument("--batch-overhead", type=float, default=0.0, help="Fixed latency per scoring batch (s)")
+    parser.add_argument("--swap-latency", type=float, default=0.0, help="Model load/unload latency (s)")
+    parser.add_argument("--distribution", default="lognormal", choices=["constant", "normal", "lognormal", "uniform"])
+    parser.add_argument("--jitter", type=float, default=0.3, help="Latency std as a fraction of the mean")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--memory-mb", type=int, default=0, help="Simulated model memory footprint")
+    parser.add_argument("--reward", default="inprocess", choices=["inprocess", "ipc"],
+                        help="inprocess: SyntheticRewardModel; ipc: subprocess scorer with synthetic_standalone.py")
+    parser.add_argument("--transport", default="base64", choices=["none", "base64"],
+                        help="Image transport simulated by the in-process scorer")
+    parser.add_argument("--one-shot", action="store_true", help="ipc mode: one subprocess per shard")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", default=None, help="Write a Chrome trace of the last run")
+    parser.add_argument("--output", default=None, help="Write the result as JSON")
+    parser.add_argument("--baseline", default=None, help="Compare with a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative increase of the median overhead over the baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_path = str(Path(temp_dir) / "synthetic_benchmark.json")
+        categories = generate_synthetic_benchmark(
+            data_path, args.categories, args.pairs_per_category,
+            image_size=tuple(args.image_size), image_format=args.image_format, seed=args.seed
+        )
+        config = build_config(args, data_path, categories, str(Path(temp_dir) / "outputs"))
+        runs = [run_once(config) for _ in range(args.repeat)]
+
+    overhead = statistics.median(r["overhead_seconds"] for r in runs)
+    result = {
+        "args": vars(args),
+        "median_wall_seconds": statistics.median(r["wall_seconds"] for r in runs),
+        "median_overhead_seconds": overhead,
+        "median_overhead_ms_per_image": statistics.median(r["overhead_ms_per_image"] for r in runs),
+        "runs": runs
+    }
+
+    # 输出结果
+    last = runs[-1]["performance"]
+    print("\n" + "=" * 72)
+    print(f"{runs[-1]['num_images']} images, {args.gpus} simulated GPUs, reward={args.reward}, "
+          f"{args.repeat} runs")
+    print("-" * 72)
+    print(f"{'run':>4} {'wall (s)':>10} {'model (s)':>10} {'overhead (s)':>13} {'ms/image':>10} {'failed':>7}")
+    for k, r in enumerate(runs):
+        print(f"{k:>4} {r['wall_seconds']:>10.3f} {r['model_seconds']:>10.3f} {r['overhead_seconds']:>13.3f} "
+              f"{r['overhead_ms_per_image']:>10.2f} {r['num_failed']:>7}")
+    print("-" * 72)
+    print("Stage seconds (last run): " + ", ".join(f"{k}={v:.3f}" for k, v in last["stage_seconds"].items()))
+    for phase, configured in (("edit", args.edit_latency), ("score", args.score_latency)):
+        latency = last[phase]["latency"]
+        if latency.get("count"):
+            print(f"{phase:>5} latency p50={latency['p50'] * 1000:.1f}ms p95={latency['p95'] * 1000:.1f}ms "
+                  f"p99={latency['p99'] * 1000:.1f}ms (configured mean {configured * 1000:.1f}ms)")
+    if last.get("peak_rss_mb"):
+        print(f"Peak RSS: {last['peak_rss_mb']['self']:.0f} MB (children {last['peak_rss_mb']['children']:.0f} MB)")
+    print("=" * 72)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"Result saved to: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["median_overhead_seconds"]
+        limit = baseline * (1 + args.tolerance)
+        print(f"\n编排开销: {overhead:.3f}s（基线 {baseline:.3f}s，上限 {limit:.3f}s）")
+        if overhead > limit:
+            print("✗ 编排开销超出容差")
+            sys.exit(1)
+        print("✓ 编排开销在容差范围内")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+视觉token预算校准工具
+在benchmark样本上比较不同max_pixels下的评分与全分辨率基线的偏差，以及评分耗时，
+用于选择reward_model.params.max_pixels
+
+用法:
+    python tools/calibrate_pixel_budget.py --config config_full_multi_gpu.yaml \
+        --budgets 1048576 802816 602112 401408 --samples-per-category 10
+
+    # 使用之前保存的编辑结果（evaluation.save_generated_images: true）而不是原图评分
+    python tools/calibrate_pixel_budget.py --config config_full_multi_gpu.yaml --images-dir outputs/images
+"""
+
+import argparse
+import importlib
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+from PIL import Image
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data import BenchmarkLoader
+from src.models.reward.qwen3_vl_utils import PIXEL_ALIGN_FACTOR, fit_pixel_budget
+from src.utils import PromptManager, decode_base64_image, setup_logger
+
+
+def load_samples(config: dict, samples_per_category: int, images_dir: str = None):
+    """
+    从benchmark中每个类别取前N个样本
+
+    Returns:
+        (图像列表, system_prompt列表, user_prompt列表, 样本id列表)
+    """
+    benchmark_config = config["benchmark"]
+    loader = BenchmarkLoader()
+    data = loader.load(
+        data_path=benchmark_config["data_path"],
+        categories=benchmark_config["categories"],
+        decode_images=False
+    )
+    prompt_manager = PromptManager(config.get("prompts", {}))
+
+    images, system_prompts, user_prompts, pair_ids = [], [], [], []
+    for category in data.category_names:
+        for pair in data.get_category(category).data_pairs[:samples_per_category]:
+            # 编辑结果的扩展名取决于evaluation.image_writer.format
+            edited_paths = sorted((Path(images_dir) / category).glob(f"{pair.pair_id}.*")) if images_dir else []
+            if edited_paths:
+                image = Image.open(edited_paths[0]).convert("RGB")
+            else:
+                image = decode_base64_image(pair.original_image_b64)
+
+            prompts = prompt_manager.get_full_prompt(
+                category=category,
+                original_description=pair.original_description,
+                edit_instruction=pair.edit_instruction
+            )
+            images.append(image)
+            system_prompts.append(prompts["system_prompt"])
+            user_prompts.append(prompts["user_prompt"])
+            pair_ids.append(f"{category}/{pair.pair_id}")
+
+    return images, system_prompts, user_prompts, pair_ids
+
+
+def summarize_drift(baseline: list, scores: list) -> dict:
+    """计算评分相对全分辨率基线的偏差（只统计两者都成功的样本）"""
+    pairs = [(b, s) for b, s in zip(baseline, scores) if b is not None and s is not None]
+    if not pairs:
+        return {"num_samples": 0}
+
+    base = np.array([b for b, _ in pairs])
+    test = np.array([s for _, s in pairs])
+    diff = test - base
+    summary = {
+        "num_samples": len(pairs),
+        "mean_abs_drift": float(np.mean(np.abs(diff))),
+        "max_abs_drift": float(np.max(np.abs(diff))),
+        "mean_drift": float(np.mean(diff)),
+        "within_0.5": float(np.mean(np.abs(diff) <= 0.5)),
+    }
+    if len(pairs) > 1 and np.std(base) > 0 and np.std(test) > 0:
+        # Spearman相关：对排名求Pearson相关
+        base_rank = np.argsort(np.argsort(base))
+        test_rank = np.argsort(np.argsort(test))
+        summary["spearman"] = float(np.corrcoef(base_rank, test_rank)[0, 1])
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the reward model pixel budget")
+    parser.add_argument("--config", required=True, help="Pipeline config file")
+    parser.add_argument("--budgets", type=int, nargs="+",
+                        default=[1024 * 1024, 768 * 1024, 512 * 1024, 384 * 1024, 256 * 1024],
+                        help="Candidate max_pixels values")
+    parser.add_argument("--samples-per-category", type=int, default=10)
+    parser.add_argument("--images-dir", default=None,
+                        help="Directory with saved edited images ({category}/{pair_id}.png|.webp|.jpg)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Max acceptable mean absolute drift for the recommendation")
+    parser.add_argument("--output", default=None, help="Write the calibration result as JSON")
+    args = parser.parse_args()
+
+    logger = setup_logger(name="calibrate_pixel_budget", level="INFO", console_output=True)
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    images, system_prompts, user_prompts, pair_ids = load_samples(
+        config, args.samples_per_category, args.images_dir
+    )
+    n = len(images)
+    logger.info(f"Loaded {n} samples, mean resolution "
+                f"{np.mean([img.width * img.height for img in images]) / 1e6:.2f} MP")
+
+    # 加载reward模型（关闭模型自身的像素预算，由本工具控制缩放）
+    reward_config = config["reward_model"]
+    params = dict(reward_config.get("params", {}), min_pixels=None, max_pixels=None)
+    module_path, class_name = reward_config["class_path"].rsplit(".", 1)
+    model = getattr(importlib.import_module(module_path), class_name)(params)
+    model.load_to_gpu()
+
+    def run(budget_images):
+        start = time.time()
+        scores = model.batch_score(
+            edited_images=budget_images,
+            original_descriptions=[""] * n,
+            edit_instructions=[""] * n,
+            system_prompts=system_prompts,
+            user_prompts=user_prompts,
+            batch_size=params.get("batch_size", 4),
+            use_batch_inference=params.get("use_batch_inference", True)
+        )
+        return scores, time.time() - start
+
+    logger.info("Scoring full-resolution baseline...")
+    baseline, baseline_time = run(images)
+
+    results = []
+    for budget in sorted(args.budgets, reverse=True):
+        budget_images = [fit_pixel_budget(img, max_pixels=budget) for img in images]
+        tokens = np.mean([img.width * img.height for img in budget_images]) / PIXEL_ALIGN_FACTOR ** 2
+        logger.info(f"Scoring with max_pixels={budget} (~{tokens:.0f} visual tokens/image)...")
+        scores, elapsed = run(budget_images)
+        results.append({
+            "max_pixels": budget,
+            "visual_tokens": float(tokens),
+            "seconds": elapsed,
+            "speedup": baseline_time / elapsed if elapsed > 0 else None,
+            **summarize_drift(baseline, scores)
+        })
+
+    # 输出结果
+    print("\n" + "=" * 96)
+    print(f"{'max_pixels':>12} {'tokens':>8} {'speedup':>8} {'mean|Δ|':>9} {'max|Δ|':>8} "
+          f"{'meanΔ':>8} {'≤0.5':>6} {'spearman':>9}")
+    print("-" * 96)
+    print(f"{'full':>12} {np.mean([i.width * i.height for i in images]) / PIXEL_ALIGN_FACTOR ** 2:>8.0f} "
+          f"{1.0:>8.2f}")
+    for r in results:
+        if not r.get("num_samples"):
+            print(f"{r['max_pixels']:>12} (no valid scores)")
+            continue
+        print(f"{r['max_pixels']:>12} {r['visual_tokens']:>8.0f} {r['speedup'] or 0:>8.2f} "
+              f"{r['mean_abs_drift']:>9.3f} {r['max_abs_drift']:>8.3f} {r['mean_drift']:>+8.3f} "
+              f"{r['within_0.5']:>6.0%} {r.get('spearman', float('nan')):>9.3f}")
+    print("=" * 96)
+
+    acceptable = [r for r in results if r.get("num_samples") and r["mean_abs_drift"] <= args.tolerance]
+    if acceptable:
+        best = min(acceptable, key=lambda r: r["max_pixels"])
+        print(f"\n推荐: max_pixels: {best['max_pixels']}  "
+              f"(平均偏差 {best['mean_abs_drift']:.3f} ≤ {args.tolerance}, 提速 {best['speedup'] or 0:.2f}x)")
+    else:
+        print(f"\n没有预算满足平均偏差 ≤ {args.tolerance}，建议保持全分辨率")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": args.config,
+                "pair_ids": pair_ids,
+                "baseline_seconds": baseline_time,
+                "baseline_scores": baseline,
+                "results": results
+            }, f, indent=2, ensure_ascii=False)
+        logger.info(f"Calibration result saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()